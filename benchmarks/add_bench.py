@@ -0,0 +1,89 @@
+"""
+Стенд задержки добавления траты: p50/p99 прежнего пути и expenses.add_expenses.
+
+Прежний путь повторяет обработчик до объединения записи со статистикой: поиск категории,
+запись траты, статистика за сегодня и бюджет, каждое в своей сессии. Текущий путь — разбор,
+категория из кэша резолвера, запись и статистика за сегодня одним запросом.
+Синтетические пользователи (отрицательные id) отправляют сообщения «100 еда» по --concurrency
+одновременно, в конце категории удаляются вместе с тратами. Запускать на dev-базе.
+
+    python -m benchmarks.add_bench --users 50 --messages 5000 --concurrency 20
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List
+
+from benchmarks import bench_data
+from core import expenses, periods
+from core.cache import stats_cache
+from core.db import async_session
+from core.logging_utils import logger
+from core.settings import settings
+from models import Budget, Category, Expense
+
+
+async def _legacy(user_id: int, message_id: int) -> None:
+    """Прежний обработчик: три сессии и пять запросов на сообщение."""
+    async with async_session() as db:
+        category_id = await Category.get_category_id(db=db, user_id=user_id, category_name='еда')
+        await Expense.create(db=db, user_id=user_id, amount=10000, category_id=category_id, created=datetime.utcnow())
+    period = periods.get_period('today')
+    async with async_session() as db:
+        await Expense.get_statistics(db=db, user_id=user_id, start=period.start, end=period.end)
+    async with async_session() as db:
+        await Budget.get(db=db, user_id=user_id)
+
+
+async def _current(user_id: int, message_id: int) -> None:
+    await expenses.add_expenses(user_id, '100 еда', message_id, datetime.utcnow())
+
+
+async def _run(path: Callable[[int, int], Awaitable[None]], users: List[int], messages: int,
+               concurrency: int, offset: int) -> List[float]:
+    queue = asyncio.Queue()
+    for i in range(messages):
+        queue.put_nowait((users[i % len(users)], offset + i))
+    latencies = []
+
+    async def sender():
+        while not queue.empty():
+            user_id, message_id = queue.get_nowait()
+            started = time.perf_counter()
+            await path(user_id, message_id)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(sender() for _ in range(concurrency)))
+    return latencies
+
+
+async def bench(users: int, messages: int, concurrency: int) -> None:
+    settings.WRITE_BUFFER_ENABLED = False
+    created = await bench_data.create_users(users)
+    user_ids = list(created)
+    try:
+        for offset, (title, path) in enumerate((('legacy 3 sessions', _legacy), ('add_expenses', _current))):
+            await stats_cache.clear()
+            started = time.perf_counter()
+            latencies = await _run(path, user_ids, messages, concurrency, offset * messages)
+            seconds = time.perf_counter() - started
+            logger.info(
+                f'{title}: p50 {bench_data.percentile(latencies, 50) * 1000:.1f} ms, '
+                f'p99 {bench_data.percentile(latencies, 99) * 1000:.1f} ms, {messages / seconds:.0f} messages/s'
+            )
+    finally:
+        await bench_data.drop_users(created)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure add expense latency of the legacy and the current path')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(bench(args.users, args.messages, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Стенд /analytics: время ответа целиком (срез из роллапа, бюджет, расчет и текст) и отдельно
+расчета с текстом у пользователя с --rows тратами за последний год. Цель — меньше 50 мс
+на ответ при миллионе трат.
+
+Траты создаются синтетическому пользователю и удаляются вместе с его категориями в конце,
+перед замерами таблицы проходят VACUUM ANALYZE. Запускать на dev-базе.
+
+    python -m benchmarks.analytics_bench --rows 1000000 --categories 30 --repeat 100
+"""
+import argparse
+import asyncio
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, List
+
+import numpy as np
+
+from benchmarks import bench_data
+from core import analytics, periods
+from core.db import async_session
+from core.logging_utils import logger
+from core.resolver import resolver
+from models import DailyCategoryTotal
+
+
+async def _measure(call: Callable[[], Awaitable], repeat: int) -> List[float]:
+    await call()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def bench(rows: int, categories: int, repeat: int, target_ms: float) -> None:
+    users = await bench_data.create_users(1, [f'категория {i}' for i in range(1, categories + 1)])
+    (user_id, category_ids), = users.items()
+    try:
+        await bench_data.fill_expenses(user_id, category_ids, rows)
+        await bench_data.vacuum('expense', 'daily_category_totals', analyze=True)
+        today = periods.local_today()
+        first_day = analytics.slice_start(today)
+        async with async_session() as db:
+            slice_rows = await DailyCategoryTotal.get_slice(
+                db=db, user_id=user_id, first_day=first_day, last_day=today + timedelta(days=1)
+            )
+        snapshot = await resolver.snapshot(user_id)
+        columns = list(zip(*slice_rows))
+
+        async def compute_and_render():
+            analytics.render(analytics.compute(
+                today=today, first_day=first_day,
+                day_index=np.array(columns[0], dtype=np.int64),
+                category_ids=np.array(columns[1], dtype=np.int64),
+                amounts=np.array(columns[2], dtype=np.int64),
+                categories=[(c.id, c.name) for c in snapshot.categories], daily_limit=100000,
+            ))
+
+        logger.info(f'{rows} expenses, {len(slice_rows)} rollup rows in the analytics slice')
+        for title, call in (
+                ('/analytics reply', lambda: analytics.get_analytics(user_id)),
+                ('compute and render', compute_and_render),
+        ):
+            samples = await _measure(call, repeat)
+            p99 = bench_data.percentile(samples, 99) * 1000
+            logger.info(
+                f'{title}: p50 {bench_data.percentile(samples, 50) * 1000:.2f} ms, p99 {p99:.2f} ms '
+                f'({"within" if p99 < target_ms else "over"} {target_ms:.0f} ms)'
+            )
+    finally:
+        await bench_data.drop_users(users)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure /analytics latency on a large expense history')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--categories', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--target-ms', type=float, default=50)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(bench(args.rows, args.categories, args.repeat, args.target_ms))
+
+
+if __name__ == '__main__':
+    main()
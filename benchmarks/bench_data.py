@@ -0,0 +1,117 @@
+"""
+Синтетические данные для стендов `python -m benchmarks.*_bench`.
+
+Пользователи стендов имеют отрицательные id и не пересекаются с настоящими. Траты создаются
+одним INSERT ... SELECT generate_series на стороне Postgres, удаляются вместе с категориями
+(каскадом, роллап обновляет триггер). Для стендов с тысячами пользователей категории, бюджеты
+и траты создаются так же одним запросом на каждую таблицу. Запускать стенды только на dev-базе.
+"""
+import resource
+from typing import Dict, List, Sequence
+
+from sqlalchemy import text
+
+from core.db import async_session, engine
+from models import Category, DailyCategoryTotal
+
+CATEGORIES = ('еда', 'такси', 'кофе', 'продукты', 'кино')
+
+FILL_QUERY = text("""
+    INSERT INTO expense (user_id, amount, created, category_id)
+    SELECT :user_id, 1 + floor(random() * 500000)::bigint,
+        timezone('utc', now()) - random() * make_interval(days => :days),
+        (CAST(:category_ids AS integer[]))[1 + i % :categories]
+    FROM generate_series(0, :rows - 1) AS i
+""")
+
+TENANT_CATEGORIES_QUERY = text("""
+    INSERT INTO category (user_id, name)
+    SELECT -u, name FROM generate_series(CAST(:first AS bigint), CAST(:last AS bigint)) AS u, unnest(CAST(:names AS varchar[])) AS name
+""")
+TENANT_BUDGETS_QUERY = text("""
+    INSERT INTO budget (user_id, name, daily_limit)
+    SELECT -u, 'base', 100000 FROM generate_series(CAST(:first AS bigint), CAST(:last AS bigint)) AS u
+""")
+TENANT_EXPENSES_QUERY = text("""
+    INSERT INTO expense (user_id, amount, created, category_id)
+    SELECT c.user_id, 1 + floor(random() * 500000)::bigint,
+        timezone('utc', now()) - random() * make_interval(days => :days), c.id
+    FROM category AS c, generate_series(1, :rows) AS i
+    WHERE c.user_id BETWEEN -CAST(:last AS bigint) AND -CAST(:first AS bigint)
+""")
+# Каскад от category удаляет траты и строки роллапа по category_id полным просмотром таблицы на каждую
+# категорию, поэтому траты и роллап удаляются заранее по user_id, а таблицы очищаются VACUUM
+DROP_TENANTS_QUERIES = (
+    text("SELECT set_config(:defer, 'on', true)"),
+    text("DELETE FROM expense WHERE user_id BETWEEN -CAST(:last AS bigint) AND -1"),
+    text("DELETE FROM daily_category_totals WHERE user_id BETWEEN -CAST(:last AS bigint) AND -1"),
+    text("DELETE FROM budget WHERE user_id BETWEEN -CAST(:last AS bigint) AND -1"),
+)
+DROP_TENANT_CATEGORIES_QUERY = text("DELETE FROM category WHERE user_id BETWEEN -CAST(:last AS bigint) AND -1")
+
+
+async def create_users(users: int, categories: Sequence[str] = CATEGORIES) -> Dict[int, List[int]]:
+    """Создает пользователей -1 … -users с категориями categories. Возвращает id категорий по пользователям."""
+    result = {}
+    async with async_session() as db:
+        for user_id in range(-1, -users - 1, -1):
+            result[user_id] = [(await Category.create(db=db, user_id=user_id, name=name)).id for name in categories]
+    return result
+
+
+async def drop_users(users: Dict[int, List[int]]) -> None:
+    """Удаляет категории пользователей стенда вместе с их тратами."""
+    async with async_session() as db:
+        for user_id, category_ids in users.items():
+            for category_id in category_ids:
+                await Category.delete_by_id(db=db, user_id=user_id, instance_id=category_id)
+
+
+async def fill_expenses(user_id: int, category_ids: List[int], rows: int, days: int = 365) -> None:
+    """Добавляет rows трат, равномерно по категориям и по последним days дням."""
+    async with async_session() as db:
+        await db.execute(FILL_QUERY, {
+            'user_id': user_id, 'days': days, 'category_ids': category_ids,
+            'categories': len(category_ids), 'rows': rows,
+        })
+        await db.commit()
+
+
+async def create_tenants(first: int, last: int, rows: int, categories: Sequence[str] = CATEGORIES,
+                         days: int = 365) -> None:
+    """Создает пользователей -first … -last с категориями, бюджетом и rows тратами в каждой категории."""
+    params = {'first': first, 'last': last, 'names': list(categories), 'rows': rows, 'days': days}
+    async with async_session() as db:
+        for query in (TENANT_CATEGORIES_QUERY, TENANT_BUDGETS_QUERY, TENANT_EXPENSES_QUERY):
+            await db.execute(query, params)
+        await db.commit()
+        await db.execute(text('ANALYZE'))
+
+
+async def drop_tenants(last: int) -> None:
+    """Удаляет пользователей -1 … -last, созданных create_tenants, вместе с тратами."""
+    async with async_session() as db:
+        for query in DROP_TENANTS_QUERIES:
+            await db.execute(query, {'last': last, 'defer': DailyCategoryTotal.DEFER_SETTING})
+        await db.commit()
+    await vacuum('expense', 'daily_category_totals')
+    async with async_session() as db:
+        await db.execute(DROP_TENANT_CATEGORIES_QUERY, {'last': last})
+        await db.commit()
+
+
+async def vacuum(*tables: str, analyze: bool = False) -> None:
+    """VACUUM таблиц вне транзакции, чтобы замеры не шли вперемешку с autovacuum после заполнения."""
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level='AUTOCOMMIT')
+        await conn.execute(text(f"VACUUM {'ANALYZE ' if analyze else ''}{', '.join(tables)}"))
+
+
+def peak_rss_mb() -> float:
+    """Пиковый размер резидентной памяти процесса в МБ (Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(samples: List[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
@@ -0,0 +1,86 @@
+"""
+Стенд памяти выгрузки трат: пик памяти Python при потоковой выгрузке в CSV и Parquet
+и при выгрузке со всеми строками в памяти, на нескольких размерах таблицы.
+
+Синтетический пользователь получает траты до каждого размера из --rows по очереди. Пик считает
+tracemalloc, поэтому время выгрузки под стендом больше обычного. У потоковой выгрузки пик
+не должен расти с числом трат, у выгрузки целиком — растет линейно.
+
+    python -m benchmarks.export_bench --rows 100000 1000000
+"""
+import argparse
+import asyncio
+import csv
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from typing import Awaitable, Callable, List, Tuple
+
+from benchmarks import bench_data
+from core import exporter
+from core.db import async_session
+from core.logging_utils import logger
+from core.money import to_decimal
+from core.settings import settings
+from models import Expense
+
+
+async def _export_buffered(path: str, user_id: int) -> int:
+    """Выгрузка без серверного курсора: все строки читаются в память, затем пишутся в файл."""
+    async with async_session() as db:
+        rows = (await db.execute(Expense.export_query(user_id))).all()
+    offset = timedelta(hours=settings.DIFFERENCE_WITH_UTC)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(exporter.COLUMNS)
+        writer.writerows((r.id, r.created + offset, to_decimal(r.amount), r.category) for r in rows)
+    return len(rows)
+
+
+async def _measure(export: Callable[[str, int], Awaitable[int]], path: str, user_id: int) -> Tuple[int, float, float]:
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        exported = await export(path, user_id)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return exported, time.perf_counter() - started, peak / 2 ** 20
+
+
+async def bench(sizes: List[int]) -> None:
+    users = await bench_data.create_users(1)
+    (user_id, category_ids), = users.items()
+    cases = [('streamed csv', 'csv', exporter.export_file)]
+    if exporter.pyarrow is not None:
+        cases.append(('streamed parquet', 'parquet', exporter.export_file))
+    cases.append(('buffered csv', 'csv', _export_buffered))
+    filled = 0
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for size in sorted(sizes):
+                await bench_data.fill_expenses(user_id, category_ids, size - filled)
+                filled = size
+                for title, suffix, export in cases:
+                    path = os.path.join(directory, f'expenses.{suffix}')
+                    exported, seconds, peak = await _measure(export, path, user_id)
+                    logger.info(
+                        f'{title}: {exported} rows in {seconds:.1f} s, peak {peak:.1f} MB traced, '
+                        f'file {os.path.getsize(path) / 2 ** 20:.1f} MB'
+                    )
+        logger.info(f'Peak RSS of the process: {bench_data.peak_rss_mb():.0f} MB')
+    finally:
+        await bench_data.drop_users(users)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure peak memory of streamed and buffered expense exports')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(bench(args.rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Стенд импорта трат: строк в секунду при импорте файла CSV и JSONL из --rows строк
+для нескольких размеров пачки COPY, и для сравнения — прежний путь, одна трата на коммит
+через BaseOrmMixin.create, на --legacy-rows строках.
+
+Файлы создаются во временном каталоге, траты пишутся синтетическому пользователю и удаляются
+вместе с его категориями в конце. После импортов роллап сверяется с таблицей expense.
+Запускать на dev-базе.
+
+    python -m benchmarks.import_bench --rows 1000000 --chunk-size 1000 5000 20000
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from benchmarks import bench_data
+from core import importer, rollup
+from core.db import async_session
+from core.logging_utils import logger
+from models import Expense
+
+
+def _write_fixture(path: str, rows: int) -> None:
+    rng = random.Random(0)
+    start = datetime.utcnow() - timedelta(days=365)
+    records = (
+        {
+            'created': (start + timedelta(seconds=rng.randrange(365 * 86400))).isoformat(sep=' '),
+            'amount': f'{rng.randint(1, 5000)}.{rng.randint(0, 99):02d}',
+            'category': rng.choice(bench_data.CATEGORIES),
+        }
+        for _ in range(rows)
+    )
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if path.endswith('.csv'):
+            writer = csv.DictWriter(f, fieldnames=('created', 'amount', 'category'))
+            writer.writeheader()
+            writer.writerows(records)
+        else:
+            f.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+
+
+async def _legacy(user_id: int, category_id: int, rows: int) -> float:
+    """Прежний путь: сессия и коммит на каждую трату. Возвращает строк в секунду."""
+    started = time.perf_counter()
+    for _ in range(rows):
+        async with async_session() as db:
+            await Expense.create(db=db, user_id=user_id, amount=10000, category_id=category_id, created=datetime.utcnow())
+    return rows / (time.perf_counter() - started)
+
+
+async def bench(rows: int, chunk_sizes: List[int], legacy_rows: int) -> None:
+    users = await bench_data.create_users(1)
+    (user_id, category_ids), = users.items()
+    try:
+        if legacy_rows:
+            rate = await _legacy(user_id, category_ids[0], legacy_rows)
+            logger.info(f'legacy create per row: {legacy_rows} rows, {rate:.0f} rows/s')
+        with tempfile.TemporaryDirectory() as directory:
+            for suffix in ('csv', 'jsonl'):
+                path = os.path.join(directory, f'expenses.{suffix}')
+                _write_fixture(path, rows)
+                logger.info(f'Fixture {path}: {rows} rows, {os.path.getsize(path) / 2 ** 20:.1f} MB')
+                for chunk_size in chunk_sizes:
+                    result = await importer.import_file(path, user_id, chunk_size)
+                    logger.info(
+                        f'{suffix}, chunk {chunk_size}: {result.imported} rows in {result.seconds:.1f} s, '
+                        f'{result.rows_per_second:.0f} rows/s'
+                    )
+        await rollup.verify()
+        logger.info(f'Peak RSS of the process: {bench_data.peak_rss_mb():.0f} MB')
+    finally:
+        await bench_data.drop_users(users)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure import rate of CSV and JSONL files')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--chunk-size', type=int, nargs='+', default=[5000])
+    parser.add_argument('--legacy-rows', type=int, default=2000, help='Rows for the per-row commit path, 0 to skip')
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(bench(args.rows, args.chunk_size, args.legacy_rows))
+
+
+if __name__ == '__main__':
+    main()
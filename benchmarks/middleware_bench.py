@@ -0,0 +1,81 @@
+"""
+Микробенчмарк накладных расходов AccessMiddleware на один апдейт.
+
+Сравнивает прежнюю проверку (список id из строк на каждое сообщение и форматирование сообщения
+для debug-лога) с текущей: только проверка доступа, с ограничителем частоты, который пропускает
+все сообщения, и флуд, который ограничитель отбрасывает. Все пользователи из списка доступа,
+к БД и Bot API стенд не обращается.
+
+    python -m benchmarks.middleware_bench --ids 100 --users 1000 --updates 200000 --log-level INFO
+"""
+import argparse
+import asyncio
+import time
+from typing import Callable, List
+
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler
+
+from core.constants import LOG_FMT_LOGURU
+from core.logging_utils import CustomizeLogger, logger
+from core.middlewares import AccessMiddleware
+
+
+def _make_message(message_id: int, user_id: int) -> types.Message:
+    return types.Message.to_object({
+        'message_id': message_id,
+        'date': int(time.time()),
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench'},
+        'chat': {'id': user_id, 'type': 'private'},
+        'text': '100 bench',
+    })
+
+
+def _legacy(access_ids: List[str]) -> Callable:
+    """Проверка в том виде, в каком она была до AccessMiddleware с frozenset."""
+    async def check(message: types.Message, _):
+        logger.debug(f'Bot retrieved message: {message}')
+        if int(message.from_user.id) not in [int(access_id) for access_id in access_ids]:
+            raise CancelHandler()
+    return check
+
+
+async def _measure(check: Callable, messages: List[types.Message]) -> float:
+    started = time.perf_counter()
+    for message in messages:
+        try:
+            await check(message, None)
+        except CancelHandler:
+            pass
+    return time.perf_counter() - started
+
+
+async def bench(ids: int, users: int, updates: int) -> None:
+    access_ids = [str(user_id) for user_id in range(1, ids + 1)]
+    messages = [_make_message(i, i % min(users, ids) + 1) for i in range(updates)]
+    flood = AccessMiddleware(access_ids, rate=0.001, burst=1)
+    cases = (
+        ('legacy list check', _legacy(access_ids)),
+        ('frozenset check', AccessMiddleware(access_ids).on_pre_process_message),
+        ('frozenset + limiter', AccessMiddleware(access_ids, rate=10 ** 6, burst=10 ** 6).on_pre_process_message),
+        ('flood shed by limiter', flood.on_pre_process_message),
+    )
+    for title, check in cases:
+        seconds = await _measure(check, messages)
+        logger.info(f'{title}: {seconds / updates * 10 ** 6:.2f} us per update ({updates} updates)')
+    logger.info(f'Flood: {flood.dropped} of {updates} updates dropped')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure AccessMiddleware overhead per update')
+    parser.add_argument('--ids', type=int, default=100, help='Number of ids in ACCESS_IDS')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--updates', type=int, default=200000)
+    parser.add_argument('--log-level', default='INFO')
+    args = parser.parse_args()
+    CustomizeLogger.customize_logging(level=args.log_level, format=LOG_FMT_LOGURU)
+    asyncio.get_event_loop().run_until_complete(bench(args.ids, args.users, args.updates))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Микробенчмарк разбора сообщений: время parse_message на одну строку для типичных сообщений,
+многострочных сообщений и отклоняемого ввода, включая очень длинные суммы.
+
+    python -m benchmarks.parser_bench --messages 100000
+"""
+import argparse
+import random
+import time
+from datetime import date
+from typing import List
+
+from core.exceptions import NotCorrectMessage
+from core.money import MAX_AMOUNT, MINOR_UNITS
+from core.parser import parse_message
+
+TODAY = date(2024, 3, 15)
+
+
+def _messages(rng: random.Random, count: int) -> dict:
+    units = MAX_AMOUNT // MINOR_UNITS
+    return {
+        'single line': [f'{rng.randint(1, 10 ** 5)} кофе' for _ in range(count)],
+        'date and fraction': [f'вчера {rng.randint(1, 10 ** 4)},{rng.randint(0, 99):02d} такси' for _ in range(count)],
+        'thousands separators': [f'{rng.randint(1, 999)} {rng.randint(0, 999):03d},50 продукты' for _ in range(count)],
+        '10 lines': [
+            '\n'.join(f'{rng.randint(1, 10 ** 5)} еда' for _ in range(10)) for _ in range(count // 10)
+        ],
+        'rejected: no category': [str(rng.randint(1, 10 ** 5)) for _ in range(count)],
+        'rejected: above bound': [f'{units + rng.randint(1, 10 ** 6)} еда' for _ in range(count)],
+        'rejected: 1000 digits': ['9' * 1000 + ' еда' for _ in range(count // 10)],
+    }
+
+
+def _measure(messages: List[str]) -> float:
+    started = time.perf_counter()
+    for message in messages:
+        try:
+            parse_message(message, TODAY)
+        except NotCorrectMessage:
+            pass
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure parse_message time per line')
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for title, messages in _messages(random.Random(args.seed), args.messages).items():
+        lines = sum(message.count('\n') + 1 for message in messages)
+        seconds = _measure(messages)
+        print(f'{title}: {seconds / lines * 10 ** 6:.2f} us per line ({lines} lines)')
+
+
+if __name__ == '__main__':
+    main()
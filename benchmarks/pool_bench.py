@@ -0,0 +1,99 @@
+"""
+Нагрузочный стенд пула соединений: запросов в секунду, p99 и ожидание соединения из пула
+при нескольких уровнях параллельности для каждой конфигурации пула.
+
+Конфигурация — POOL_SIZE:MAX_OVERFLOW:STATEMENT_CACHE_SIZE. Каждый запрос — отдельная сессия
+со статистикой за месяц синтетического пользователя, как ответ на /month без кэша.
+Остальные параметры пула берутся из настроек PG_*. Запускать на dev-базе.
+
+    python -m benchmarks.pool_bench --pools 5:0:0 10:5:500 20:10:500 --concurrency 10 50 200 --seconds 5
+"""
+import argparse
+import asyncio
+import time
+from typing import List, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks import bench_data
+from core import periods
+from core.db import InstrumentedQueuePool, pool_stats
+from core.logging_utils import logger
+from core.settings import settings
+from models import Expense
+
+Pool = Tuple[int, int, int]
+
+
+def _parse_pool(text: str) -> Pool:
+    size, overflow, cache = (int(value) for value in text.split(':'))
+    return size, overflow, cache
+
+
+async def _load(session, user_id: int, concurrency: int, seconds: float) -> List[float]:
+    period = periods.get_period('month')
+    deadline = time.perf_counter() + seconds
+    latencies = []
+
+    async def client():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            async with session() as db:
+                await Expense.get_statistics(db=db, user_id=user_id, start=period.start, end=period.end)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies
+
+
+async def bench(pools: List[Pool], concurrency: List[int], seconds: float, rows: int) -> None:
+    pg = settings.POSTGRES_CONFIG
+    users = await bench_data.create_users(1)
+    (user_id, category_ids), = users.items()
+    try:
+        await bench_data.fill_expenses(user_id, category_ids, rows, days=60)
+        for size, overflow, cache in pools:
+            engine = create_async_engine(
+                pg.URL,
+                future=True,
+                poolclass=InstrumentedQueuePool,
+                pool_size=size,
+                max_overflow=overflow,
+                pool_timeout=pg.POOL_TIMEOUT,
+                pool_recycle=pg.POOL_RECYCLE,
+                pool_pre_ping=pg.POOL_PRE_PING,
+                connect_args={'prepared_statement_cache_size': cache},
+            )
+            session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+            try:
+                for clients in concurrency:
+                    pool_stats.reset()
+                    latencies = await _load(session, user_id, clients, seconds)
+                    avg_wait = pool_stats.wait_total / pool_stats.checkouts if pool_stats.checkouts else 0
+                    logger.info(
+                        f'pool {size}+{overflow}, statement cache {cache}, {clients} clients: '
+                        f'{len(latencies) / seconds:.0f} requests/s, '
+                        f'p50 {bench_data.percentile(latencies, 50) * 1000:.1f} ms, '
+                        f'p99 {bench_data.percentile(latencies, 99) * 1000:.1f} ms, '
+                        f'pool wait avg {avg_wait * 1000:.2f} ms, max {pool_stats.wait_max * 1000:.2f} ms'
+                    )
+            finally:
+                await engine.dispose()
+    finally:
+        await bench_data.drop_users(users)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure throughput for connection pool configurations')
+    parser.add_argument('--pools', type=_parse_pool, nargs='+', default=[(5, 0, 0), (10, 5, 500), (20, 10, 500)],
+                        help='POOL_SIZE:MAX_OVERFLOW:STATEMENT_CACHE_SIZE')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(bench(args.pools, args.concurrency, args.seconds, args.rows))
+
+
+if __name__ == '__main__':
+    main()
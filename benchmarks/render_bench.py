@@ -0,0 +1,115 @@
+"""
+Стенд аллокаций ответа /month: время, пик памяти Python и число созданных объектов
+на один ответ прежним способом и текущим, у пользователя с --rows тратами.
+
+Прежний способ — все категории со всеми тратами через selectinload, затем pydantic-схемы
+CategorySchema/ExpenseSchema (их копия ниже, пакет schemas удален) и суммы в Python.
+Текущий — expenses.get_statistics: строки SQLAlchemy Row из агрегации в БД, кэш статистики
+очищается перед каждым ответом. Пик памяти считает tracemalloc в отдельном прогоне.
+Запускать на dev-базе.
+
+    python -m benchmarks.render_bench --rows 100000 --repeat 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Awaitable, Callable, List
+
+from pydantic import BaseModel
+
+from benchmarks import bench_data
+from core import expenses, periods
+from core.cache import stats_cache
+from core.db import async_session
+from core.logging_utils import logger
+from core.settings import settings
+from models import Category, Expense
+
+
+class ExpenseSchema(BaseModel):
+    id: int = None
+    amount: int
+    created: datetime = None
+    category_name: str = None
+
+
+class CategorySchema(BaseModel):
+    id: int
+    name: str
+    expenses: List[ExpenseSchema] = []
+
+
+async def _legacy(user_id: int, period: periods.Period) -> int:
+    """Прежний ответ /month. Возвращает число созданных ORM-объектов и схем."""
+    async with async_session() as db:
+        categories = await Category.get_all(db=db, user_id=user_id, selectinload_attr='expenses')
+    schemas = [
+        CategorySchema(
+            id=c.id, name=c.name,
+            expenses=[ExpenseSchema(id=e.id, amount=e.amount, created=e.created) for e in c.expenses],
+        )
+        for c in categories
+    ]
+    c_rows = []
+    for c in schemas:
+        amount = sum(e.amount for e in c.expenses if period.start <= e.created < period.end)
+        if amount:
+            c_rows.append(f'{amount} {settings.CURRENCY} | {c.name} | /cat_m{c.id}')
+    objects = sum(1 + len(c.expenses) for c in categories)
+    return 2 * objects
+
+
+async def _current(user_id: int, period: periods.Period) -> int:
+    """Текущий ответ /month. Возвращает число строк результата."""
+    await stats_cache.clear()
+    async with async_session() as db:
+        rows = await Expense.get_statistics(db=db, user_id=user_id, start=period.start, end=period.end)
+    expenses._render_statistics(period, rows)
+    return len(rows)
+
+
+async def _peak_mb(path: Callable[[int, periods.Period], Awaitable[int]], user_id: int, period: periods.Period) -> float:
+    tracemalloc.start()
+    try:
+        await path(user_id, period)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+async def bench(rows: int, repeat: int) -> None:
+    users = await bench_data.create_users(1)
+    (user_id, category_ids), = users.items()
+    period = periods.get_period('month')
+    try:
+        await bench_data.fill_expenses(user_id, category_ids, rows)
+        for title, path in (('legacy pydantic', _legacy), ('current rows', _current)):
+            objects = await path(user_id, period)
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                await path(user_id, period)
+                samples.append(time.perf_counter() - started)
+            peak = await _peak_mb(path, user_id, period)
+            logger.info(
+                f'{title}: median {statistics.median(samples) * 1000:.1f} ms per reply, '
+                f'{objects} objects built, peak {peak:.1f} MB traced'
+            )
+    finally:
+        await bench_data.drop_users(users)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure allocations of the /month reply before and after')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(bench(args.rows, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
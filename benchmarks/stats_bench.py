@@ -0,0 +1,98 @@
+"""
+Стенд /today и /month: время ответа прежним способом (все категории вместе со всеми тратами
+в память, фильтр по дате в Python) против агрегации в SQL по таблице expense и текущей
+статистики бота из роллапа daily_category_totals, на нескольких размерах истории трат.
+
+Синтетический пользователь получает траты за последний год до каждого размера из --rows по очереди.
+Кэш статистики не участвует: каждый замер — новый запрос к БД.
+
+    python -m benchmarks.stats_bench --rows 10000 100000 1000000 --repeat 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Awaitable, Callable, List
+
+from sqlalchemy import func, select
+
+from benchmarks import bench_data
+from core import periods
+from core.db import async_session
+from core.logging_utils import logger
+from models import Category, Expense
+
+
+async def _legacy(user_id: int, period: periods.Period) -> int:
+    """Прежний путь: все траты пользователя через selectinload, суммы по категориям в Python."""
+    async with async_session() as db:
+        categories = await Category.get_all(db=db, user_id=user_id, selectinload_attr='expenses')
+    totals = [sum(e.amount for e in c.expenses if period.start <= e.created < period.end) for c in categories]
+    return sum(totals)
+
+
+async def _expense_scan(user_id: int, period: periods.Period) -> int:
+    """Суммы по категориям в SQL по самой таблице expense за [start, end)."""
+    amounts = Expense.raw_amounts_query(user_id=user_id, start=period.start, end=period.end).subquery()
+    query = select(amounts.c.category_id, func.sum(amounts.c.amount)).group_by(amounts.c.category_id)
+    async with async_session() as db:
+        rows = (await db.execute(query)).all()
+    return sum(amount for _, amount in rows)
+
+
+async def _rollup(user_id: int, period: periods.Period) -> int:
+    """Текущий путь бота: Expense.get_statistics, полные дни читаются из роллапа."""
+    async with async_session() as db:
+        rows = await Expense.get_statistics(db=db, user_id=user_id, start=period.start, end=period.end)
+    return sum(r.amount or 0 for r in rows)
+
+
+async def _measure(path: Callable[[int, periods.Period], Awaitable[int]], user_id: int,
+                   period: periods.Period, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await path(user_id, period)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def bench(sizes: List[int], repeat: int, legacy_max: int) -> None:
+    users = await bench_data.create_users(1)
+    (user_id, category_ids), = users.items()
+    paths = (('legacy load-all', _legacy), ('expense scan', _expense_scan), ('rollup', _rollup))
+    filled = 0
+    try:
+        for size in sorted(sizes):
+            await bench_data.fill_expenses(user_id, category_ids, size - filled)
+            filled = size
+            for name in ('today', 'month'):
+                period = periods.get_period(name)
+                totals = set()
+                for title, path in paths:
+                    if path is _legacy and size > legacy_max:
+                        continue
+                    totals.add(await path(user_id, period))
+                    samples = await _measure(path, user_id, period, repeat)
+                    logger.info(
+                        f'{size} rows, /{name}, {title}: median {statistics.median(samples) * 1000:.1f} ms, '
+                        f'max {max(samples) * 1000:.1f} ms'
+                    )
+                if len(totals) != 1:
+                    logger.error(f'{size} rows, /{name}: paths disagree on the total: {sorted(totals)}')
+        logger.info(f'Peak RSS of the process: {bench_data.peak_rss_mb():.0f} MB')
+    finally:
+        await bench_data.drop_users(users)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare /today and /month statistics paths on growing history')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--legacy-max', type=int, default=1000000, help='Skip the legacy path above this size')
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(bench(args.rows, args.repeat, args.legacy_max))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Стенд изоляции пользователей: задержка статистики одного пользователя при 10, 1000 и 100 000
+пользователях в базе с одинаковым объемом трат у каждого. При индексах, начинающихся с user_id,
+и роллапе по пользователям время не должно зависеть от числа пользователей.
+
+Пользователи добавляются до каждого числа из --tenants по очереди, у каждого категории, бюджет
+и --rows трат в каждой категории за последний год. Измеряются /today, /month и последние траты
+пользователя -1, кэш статистики не участвует. Запускать на dev-базе.
+
+    python -m benchmarks.tenant_bench --tenants 10 1000 100000 --rows 4 --repeat 200
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+from benchmarks import bench_data
+from core import periods
+from core.db import async_session
+from core.logging_utils import logger
+from models import Expense
+
+USER_ID = -1
+
+
+async def _statistics(name: str) -> None:
+    period = periods.get_period(name)
+    async with async_session() as db:
+        await Expense.get_statistics(db=db, user_id=USER_ID, start=period.start, end=period.end)
+
+
+async def _last() -> None:
+    async with async_session() as db:
+        await Expense.get_last(db=db, user_id=USER_ID)
+
+
+async def bench(tenants: List[int], rows: int, repeat: int) -> None:
+    cases = (
+        ('/today', lambda: _statistics('today')),
+        ('/month', lambda: _statistics('month')),
+        ('last expenses', _last),
+    )
+    created = 0
+    try:
+        for count in sorted(tenants):
+            started = time.perf_counter()
+            await bench_data.create_tenants(created + 1, count, rows)
+            logger.info(f'{count} tenants: added {count - created} in {time.perf_counter() - started:.1f} s')
+            created = count
+            for title, call in cases:
+                await call()
+                samples = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    await call()
+                    samples.append(time.perf_counter() - started)
+                logger.info(
+                    f'{count} tenants, {title}: p50 {bench_data.percentile(samples, 50) * 1000:.2f} ms, '
+                    f'p99 {bench_data.percentile(samples, 99) * 1000:.2f} ms'
+                )
+    finally:
+        await bench_data.drop_tenants(created)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure per-tenant statistics latency as the number of tenants grows')
+    parser.add_argument('--tenants', type=int, nargs='+', default=[10, 1000, 100000])
+    parser.add_argument('--rows', type=int, default=4, help='Expenses per category of each tenant')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(bench(args.tenants, args.rows, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
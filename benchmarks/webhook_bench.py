@@ -0,0 +1,160 @@
+"""
+Нагрузочный стенд вебхука: апдейты из JSONL-файла (по апдейту Telegram в строке) или синтетические
+сообщения «100 еда» отправляются POST-запросами на вебхук бота по --concurrency одновременно.
+Выводятся апдейтов в секунду и p50/p99 ответа вебхука.
+
+Вебхук поднимается в процессе стенда на 127.0.0.1 с тем же обработчиком запросов, что и в боте,
+с диспетчером и хендлерами server.py. Bot API заменяет локальный сервер, который отвечает успехом
+на любой метод и считает вызовы. Синтетические пользователи (отрицательные id) добавляются к ACCESS_IDS до импорта
+server.py, их траты удаляются в конце. С UPDATE_QUEUE_ENABLED вебхук только кладет апдейты в очередь,
+их апдейты в очереди тоже удаляются в конце.
+Запускать на dev-базе.
+
+    python -m benchmarks.webhook_bench --updates 5000 --users 50 --concurrency 50
+    python -m benchmarks.webhook_bench --file updates.jsonl --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import secrets
+import time
+from collections import Counter
+from typing import List
+
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.dispatcher.webhook import BOT_DISPATCHER_KEY
+from aiohttp import ClientSession, web
+from sqlalchemy import text
+
+from benchmarks import bench_data
+from core.db import async_session
+from core.logging_utils import logger
+from core.settings import settings
+from core.webhook import SECRET_TOKEN_HEADER, request_handler
+
+DROP_QUEUED_QUERY = text("DELETE FROM update_queue WHERE user_id < 0")
+
+
+class FakeBotApi:
+    """Локальный Bot API: отвечает успехом на любой метод и считает вызовы."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.app = web.Application()
+        self.app.router.add_post('/bot{token}/{method}', self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] += 1
+        data = await request.post()
+        chat_id = int(data.get('chat_id') or 0)
+        result = {
+            'message_id': sum(self.calls.values()), 'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'}, 'text': '',
+        }
+        return web.json_response({'ok': True, 'result': result if method != 'answerCallbackQuery' else True})
+
+
+def _synthetic(users: List[int], count: int) -> List[dict]:
+    return [
+        {
+            'update_id': 10 ** 9 + i,
+            'message': {
+                'message_id': i + 1, 'date': int(time.time()), 'text': '100 еда',
+                'from': {'id': users[i % len(users)], 'is_bot': False, 'first_name': 'bench'},
+                'chat': {'id': users[i % len(users)], 'type': 'private'},
+            },
+        }
+        for i in range(count)
+    ]
+
+
+async def _start(app: web.Application) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    return runner
+
+
+def _url(runner: web.AppRunner) -> str:
+    host, port = runner.addresses[0][:2]
+    return f'http://{host}:{port}'
+
+
+async def _replay(url: str, updates: List[dict], concurrency: int) -> List[float]:
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+    headers = {SECRET_TOKEN_HEADER: settings.WEBHOOK_SECRET}
+    latencies = []
+
+    async def client(session: ClientSession):
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as response:
+                await response.read()
+                if response.status != 200:
+                    logger.error(f'Update {update["update_id"]}: HTTP {response.status}')
+            latencies.append(time.perf_counter() - started)
+
+    async with ClientSession() as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    return latencies
+
+
+async def bench(path: str, count: int, users: int, concurrency: int) -> None:
+    created = await bench_data.create_users(users) if path is None else {}
+    settings.ACCESS_IDS.extend(str(user_id) for user_id in created)
+    # Обработчик без секрета отклоняет все апдейты
+    settings.WEBHOOK_SECRET = settings.WEBHOOK_SECRET or secrets.token_hex(16)
+    # Хендлеры и middleware регистрируются при импорте, уже с пользователями стенда в ACCESS_IDS
+    import server
+    from core import outbox
+
+    api = FakeBotApi()
+    api_runner = await _start(api.app)
+    server.bot.server = TelegramAPIServer.from_base(_url(api_runner))
+    app = web.Application()
+    app.router.add_route('*', settings.WEBHOOK_PATH, request_handler())
+    app[BOT_DISPATCHER_KEY] = server.dp
+    webhook_runner = await _start(app)
+    await outbox.on_startup(server.dp)
+    try:
+        if path is None:
+            updates = _synthetic(list(created), count)
+        else:
+            with open(path, encoding='utf-8') as f:
+                updates = [json.loads(line) for line in f if line.strip()]
+        started = time.perf_counter()
+        latencies = await _replay(_url(webhook_runner) + settings.WEBHOOK_PATH, updates, concurrency)
+        seconds = time.perf_counter() - started
+        logger.info(
+            f'{len(updates)} updates, {concurrency} clients: {len(updates) / seconds:.0f} updates/s, '
+            f'p50 {bench_data.percentile(latencies, 50) * 1000:.1f} ms, '
+            f'p99 {bench_data.percentile(latencies, 99) * 1000:.1f} ms'
+        )
+        await outbox.on_shutdown(server.dp)
+        logger.info(f'Bot API calls: {dict(api.calls)}, coalesced replies: {outbox.outbox.coalesced}')
+    finally:
+        await webhook_runner.cleanup()
+        await api_runner.cleanup()
+        await bench_data.drop_users(created)
+        if path is None:
+            async with async_session() as db:
+                await db.execute(DROP_QUEUED_QUERY)
+                await db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Replay updates against the webhook and measure latency')
+    parser.add_argument('--file', help='JSONL file with one Telegram update per line')
+    parser.add_argument('--updates', type=int, default=5000, help='Synthetic updates without --file')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(bench(args.file, args.updates, args.users, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
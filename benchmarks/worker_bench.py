@@ -0,0 +1,126 @@
+"""
+Стенд для режима воркеров: несколько процессов-воркеров против синтетического источника апдейтов.
+
+Апдейты синтетических пользователей (отрицательные id) кладутся в update_queue дважды,
+вторая доставка должна быть отброшена по update_id. Обработчик только ждет --work-ms,
+ответы в Telegram не отправляются. В конце проверяется, что каждый апдейт обработан ровно
+один раз и что апдейты одного пользователя не пересекались по времени и шли по порядку.
+Запускать на dev-базе с пустой очередью.
+
+    python -m benchmarks.worker_bench --workers 4 --users 50 --updates 5000 --work-ms 5
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+from collections import defaultdict
+from typing import List, Tuple
+
+from aiogram import Bot, Dispatcher, types
+
+from core.db import async_session
+from core.logging_utils import logger
+from core.settings import settings
+from core.worker import Worker, enqueue
+from models import QueuedUpdate
+
+Handled = Tuple[int, int, float, float]
+
+
+def _make_update(update_id: int, user_id: int) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench'},
+            'chat': {'id': user_id, 'type': 'private'},
+            'text': 'bench',
+        },
+    }
+
+
+async def _work(work_ms: int) -> List[Handled]:
+    dp = Dispatcher(Bot(token=settings.API_TOKEN))
+    handled = []
+
+    @dp.message_handler()
+    async def handle(message: types.Message):
+        started = time.time()
+        await asyncio.sleep(work_ms / 1000)
+        handled.append((message.from_user.id, message.message_id, started, time.time()))
+
+    await Worker(dp).run(until_empty=True)
+    await dp.bot.close()
+    return handled
+
+
+def _worker_process(work_ms: int, results: multiprocessing.Queue) -> None:
+    results.put(asyncio.get_event_loop().run_until_complete(_work(work_ms)))
+
+
+async def _fill(users: int, updates: int) -> Tuple[int, int]:
+    async with async_session() as db:
+        if await QueuedUpdate.pending_count(db):
+            raise SystemExit('update_queue has pending updates, run the bench on an empty queue')
+    # id выше реальных update_id Telegram, чтобы не пересекаться с ними
+    first_id = (10 ** 10 + int(time.time())) * 10 ** 6
+    batch = [_make_update(first_id + i, -(i % users + 1)) for i in range(updates)]
+    added = await _enqueue_all(batch)
+    redelivered = await _enqueue_all(batch)
+    return added, updates - redelivered
+
+
+async def _enqueue_all(batch: List[dict], chunk_size: int = 1000) -> int:
+    return sum([await enqueue(batch[i:i + chunk_size]) for i in range(0, len(batch), chunk_size)])
+
+
+def _check(handled: List[Handled]) -> Tuple[int, int]:
+    """Возвращает число повторно обработанных апдейтов и нарушений порядка внутри пользователя."""
+    by_user = defaultdict(list)
+    for user_id, update_id, started, finished in handled:
+        by_user[user_id].append((update_id, started, finished))
+    repeated = len(handled) - len({update_id for _, update_id, _, _ in handled})
+    violations = 0
+    for items in by_user.values():
+        items.sort()
+        for (_, _, previous_finished), (_, started, _) in zip(items, items[1:]):
+            if started < previous_finished:
+                violations += 1
+    return repeated, violations
+
+
+def bench(workers: int, users: int, updates: int, work_ms: int) -> None:
+    added, duplicates = asyncio.get_event_loop().run_until_complete(_fill(users, updates))
+    logger.info(f'Enqueued {added} updates, {duplicates} duplicate deliveries dropped')
+    #
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [context.Process(target=_worker_process, args=(work_ms, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    handled = [item for _ in processes for item in results.get()]
+    for process in processes:
+        process.join()
+    #
+    seconds = max(h[3] for h in handled) - min(h[2] for h in handled) if handled else 0
+    repeated, violations = _check(handled)
+    logger.info(
+        f'{workers} workers handled {len(handled)} updates of {users} users in {seconds:.2f} s, '
+        f'{len(handled) / seconds if seconds else 0:.0f} updates/s, '
+        f'{repeated} handled twice, {violations} per-user order violations'
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure update queue throughput with several workers')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--work-ms', type=int, default=5)
+    args = parser.parse_args()
+    bench(args.workers, args.users, args.updates, args.work_ms)
+
+
+if __name__ == '__main__':
+    main()
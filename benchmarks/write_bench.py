@@ -0,0 +1,103 @@
+"""
+Стенд отложенной записи: коммитов и трат в секунду при добавлении трат с буфером и без него.
+
+Синтетические пользователи (отрицательные id) получают по категории «bench». Сообщения добавляются
+через expenses.add_expenses по --concurrency одновременно, сначала с прямой записью, затем
+с WRITE_BUFFER_ENABLED. Каждое сообщение (тот же id и время отправки) доставляется дважды:
+вторая доставка не должна добавить трат.
+В конце категории удаляются вместе с тратами. Запускать на dev-базе.
+
+    python -m benchmarks.write_bench --users 50 --messages 2000 --lines 1 --concurrency 100
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import List, Tuple
+
+from sqlalchemy import func, select
+
+from core import expenses
+from core.cache import stats_cache
+from core.db import async_session
+from core.logging_utils import logger
+from core.settings import settings
+from core.write_buffer import write_buffer
+from models import Category, Expense
+
+Message = Tuple[int, str, int, datetime]
+
+
+async def _setup(users: int) -> List[int]:
+    category_ids = []
+    async with async_session() as db:
+        for user_id in range(-1, -users - 1, -1):
+            category = await Category.create(db=db, user_id=user_id, name='bench')
+            category_ids.append(category.id)
+    return category_ids
+
+
+async def _cleanup(category_ids: List[int]) -> None:
+    async with async_session() as db:
+        for user_id, category_id in zip(range(-1, -len(category_ids) - 1, -1), category_ids):
+            await Category.delete_by_id(db=db, user_id=user_id, instance_id=category_id)
+
+
+async def _count(users: int) -> int:
+    async with async_session() as db:
+        result = await db.execute(select(func.count()).select_from(Expense).where(Expense.user_id.between(-users, -1)))
+        return result.scalar()
+
+
+async def _run(messages: List[Message], concurrency: int) -> float:
+    queue = asyncio.Queue()
+    for message in messages:
+        queue.put_nowait(message)
+
+    async def sender():
+        while not queue.empty():
+            user_id, text, message_id, sent = queue.get_nowait()
+            await expenses.add_expenses(user_id, text, message_id, sent)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender() for _ in range(concurrency)))
+    return time.perf_counter() - started
+
+
+async def bench(users: int, messages: int, lines: int, concurrency: int) -> None:
+    category_ids = await _setup(users)
+    text = "\n".join(["100 bench"] * lines)
+    try:
+        for buffered in (False, True):
+            settings.WRITE_BUFFER_ENABLED = buffered
+            await stats_cache.clear()
+            offset = messages if buffered else 0
+            sent = datetime.utcnow()
+            batch = [(-(i % users + 1), text, offset + i, sent) for i in range(messages)]
+            before, flushes = await _count(users), write_buffer.flushes
+            seconds = await _run(batch, concurrency)
+            added = await _count(users) - before
+            commits = write_buffer.flushes - flushes if buffered else messages
+            redelivery = await _run(batch, concurrency)
+            duplicates = await _count(users) - before - added
+            logger.info(
+                f'{"buffered" if buffered else "direct"}: {messages} messages, {added} expenses in {seconds:.2f} s, '
+                f'{messages / seconds:.0f} messages/s, {commits} commits, {commits / seconds:.0f} commits/s, '
+                f'redelivery in {redelivery:.2f} s added {duplicates} duplicates'
+            )
+    finally:
+        await _cleanup(category_ids)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare expense writes with and without the write-behind buffer')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--lines', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=100)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(bench(args.users, args.messages, args.lines, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Аналитика трат: скользящие средние за 7 и 30 дней, изменение к прошлому месяцу,
+расход бюджета и прогноз на конец месяца.
+
+Из роллапа одним запросом читается срез (day_index, category_id, amount) с начала прошлого
+месяца (или за последние 37 дней, если это раньше) по сегодня. Он раскладывается в матрицу
+категория × день, и все показатели считаются векторно по ней. Объем среза зависит от числа
+дней и категорий, а не от числа трат.
+"""
+import calendar
+from datetime import date, timedelta
+from typing import List, NamedTuple
+
+import numpy as np
+
+from core import periods
+from core.db import async_session
+from core.money import format_amount
+from core.resolver import resolver
+from core.settings import settings
+from models import Budget, DailyCategoryTotal
+
+ROLLING_WINDOWS = (7, 30)
+
+
+class CategoryDelta(NamedTuple):
+    name: str
+    amount: int
+    previous: int
+
+
+class Analytics(NamedTuple):
+    month_start: date
+    # Прошедшие дни текущего месяца, включая сегодня
+    elapsed_days: int
+    month_days: int
+    spent: int
+    # Траты за те же дни прошлого месяца
+    previous: int
+    # Средний расход в день за последние 7 и 30 полных дней и за 7 дней неделей раньше
+    average_7: float
+    average_30: float
+    average_7_week_ago: float
+    daily_limit: int
+    projection: int
+    categories: List[CategoryDelta]
+
+    @property
+    def budget_to_date(self) -> int:
+        return self.daily_limit * self.elapsed_days
+
+    @property
+    def month_budget(self) -> int:
+        return self.daily_limit * self.month_days
+
+
+async def get_analytics(user_id: int) -> str:
+    today = periods.local_today()
+    first_day = slice_start(today)
+    snapshot = await resolver.snapshot(user_id)
+    async with async_session() as db:
+        rows = await DailyCategoryTotal.get_slice(
+            db=db, user_id=user_id, first_day=first_day, last_day=today + timedelta(days=1)
+        )
+        budget = await Budget.get(db=db, user_id=user_id)
+    columns = list(zip(*rows)) or [(), (), ()]
+    analytics = compute(
+        today=today,
+        first_day=first_day,
+        day_index=np.array(columns[0], dtype=np.int64),
+        category_ids=np.array(columns[1], dtype=np.int64),
+        amounts=np.array(columns[2], dtype=np.int64),
+        categories=[(c.id, c.name) for c in snapshot.categories],
+        daily_limit=budget.daily_limit if budget else 0,
+    )
+    return render(analytics)
+
+
+def slice_start(today: date) -> date:
+    """Первый день среза: начало прошлого месяца или 37 дней назад, если это раньше."""
+    return min(_previous_month(today), today - timedelta(days=max(ROLLING_WINDOWS) + 7))
+
+
+def compute(
+        today: date, first_day: date, day_index: np.ndarray, category_ids: np.ndarray, amounts: np.ndarray,
+        categories: list, daily_limit: int,
+) -> Analytics:
+    """Считает показатели по колонкам среза; день today — последний в матрице."""
+    n_days = (today - first_day).days + 1
+    ids = np.array(sorted(c[0] for c in categories), dtype=np.int64)
+    names = dict(categories)
+    # Матрица категория × день, траты удаленных за время запроса категорий отбрасываются
+    positions = np.searchsorted(ids, category_ids)
+    known = np.isin(category_ids, ids)
+    matrix = np.zeros((len(ids), n_days), dtype=np.int64)
+    np.add.at(matrix, (positions[known], day_index[known]), amounts[known])
+    daily = matrix.sum(axis=0)
+    #
+    # Скользящие средние по полным дням: окна заканчиваются вчера
+    cumulative = np.concatenate(([0], np.cumsum(daily[:-1])))
+    rolling = {w: (cumulative[w:] - cumulative[:-w]) / w for w in ROLLING_WINDOWS}
+    #
+    month_start = today.replace(day=1)
+    previous_start = _previous_month(today)
+    current = (month_start - first_day).days
+    elapsed = n_days - current
+    previous = (previous_start - first_day).days
+    same_days = min(elapsed, (month_start - previous_start).days)
+    spent_by_category = matrix[:, current:].sum(axis=1)
+    previous_by_category = matrix[:, previous:previous + same_days].sum(axis=1)
+    #
+    month_days = calendar.monthrange(today.year, today.month)[1]
+    spent = int(spent_by_category.sum())
+    projection = spent + int(round(rolling[7][-1] * (month_days - elapsed)))
+    order = np.argsort(-spent_by_category, kind='stable')
+    active = order[(spent_by_category[order] > 0) | (previous_by_category[order] > 0)]
+    return Analytics(
+        month_start=month_start,
+        elapsed_days=elapsed,
+        month_days=month_days,
+        spent=spent,
+        previous=int(previous_by_category.sum()),
+        average_7=float(rolling[7][-1]),
+        average_30=float(rolling[30][-1]),
+        average_7_week_ago=float(rolling[7][-8]),
+        daily_limit=daily_limit,
+        projection=projection,
+        categories=[
+            CategoryDelta(names[int(ids[i])], int(spent_by_category[i]), int(previous_by_category[i]))
+            for i in active
+        ],
+    )
+
+
+def render(a: Analytics) -> str:
+    currency = settings.CURRENCY
+    lines = [
+        f"Аналитика за {a.month_start:%m.%Y}, день {a.elapsed_days} из {a.month_days}:",
+        f"потрачено — {format_amount(a.spent)} {currency}"
+        f"{_delta(a.spent, a.previous, 'к тем же дням прошлого месяца')}",
+        f"в среднем в день: за 7 дней — {format_amount(round(a.average_7))}"
+        f"{_delta(a.average_7, a.average_7_week_ago, 'к прошлой неделе')}, "
+        f"за 30 дней — {format_amount(round(a.average_30))} {currency}",
+    ]
+    if a.daily_limit:
+        burn = a.spent / a.budget_to_date * 100
+        verdict = "перерасход" if a.projection > a.month_budget else "в пределах бюджета"
+        lines += [
+            f"бюджет на сегодня — {format_amount(a.budget_to_date)}, израсходовано {burn:.0f}%",
+            f"прогноз на конец месяца — {format_amount(a.projection)} из {format_amount(a.month_budget)}, {verdict}",
+        ]
+    else:
+        lines.append(f"прогноз на конец месяца — {format_amount(a.projection)} {currency}")
+    if a.categories:
+        lines.append("")
+        lines += [f"{c.name}: {format_amount(c.amount)}{_delta(c.amount, c.previous)}" for c in a.categories]
+    return "\n".join(lines)
+
+
+def _delta(value: float, previous: float, compared_to: str = '') -> str:
+    if not previous:
+        return ""
+    return f" ({(value - previous) / previous * 100:+.0f}%{' ' + compared_to if compared_to else ''})"
+
+
+def _previous_month(day: date) -> date:
+    return (day.replace(day=1) - timedelta(days=1)).replace(day=1)
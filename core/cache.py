@@ -0,0 +1,275 @@
+"""
+Кэш результатов статистики: суммы по категориям за период и итог по одной категории.
+
+Ключ — (user_id, start, end, category_id) с полуинтервалом в UTC, для статистики по всем категориям
+category_id равен None. Записи не устаревают по времени данных: каждая добавленная или
+удаленная трата применяется к записям, в период которых она попадает.
+По умолчанию кэш хранится в памяти процесса (LRU), с STATS_CACHE_REDIS_URL — в Redis.
+Запись трат идет внутри StatsCache.writing(): результат запроса, начатого до записи или во время нее,
+в кэш не сохраняется, иначе трата была бы учтена дважды — в результате запроса и при применении к записи.
+В Redis траты пишут воркеры, а читать может и другой процесс (например, планировщик сводок),
+поэтому поколения процесса там мало: перед запросом к БД читатель арендует ключ, трата удаляет
+затронутые ключи вместе с арендой, и результат сохраняется, только если аренда дожила до записи.
+"""
+import json
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, List, NamedTuple, Optional, Tuple
+
+from core import metrics
+from core.logging_utils import logger
+from core.settings import settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+Key = Tuple[int, datetime, datetime, Optional[int]]
+
+
+class StatRow(NamedTuple):
+    id: int
+    name: str
+    amount: Optional[int]
+    daily_limit: int
+
+
+class CategoryTotal(NamedTuple):
+    name: str
+    amount: int
+
+
+class Generation(NamedTuple):
+    """Снимок до запроса к БД: поколение процесса и аренда ключа в общем бэкенде."""
+    local: int
+    lease: Optional[str] = None
+
+
+def _apply_amount(key: Key, value: Any, category_id: int, amount: int) -> Any:
+    """Значение записи с учетом траты или None, если запись нельзя обновить и ее нужно удалить."""
+    if key[3] is not None:
+        return value._replace(amount=(value.amount or 0) + amount)
+    if not any(r.id == category_id for r in value):
+        # Категория создана после того, как статистика попала в кэш
+        return None
+    return [r._replace(amount=(r.amount or 0) + amount) if r.id == category_id else r for r in value]
+
+
+def _affected(key: Key, user_id: int, created: datetime, category_id: int) -> bool:
+    key_user_id, start, end, key_category_id = key
+    return key_user_id == user_id and start <= created < end and key_category_id in (None, category_id)
+
+
+class MemoryBackend:
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: 'OrderedDict[Key, Tuple[float, Any]]' = OrderedDict()
+
+    async def get(self, key: Key) -> Any:
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            return None
+        self._data.move_to_end(key)
+        return item[1]
+
+    async def lease(self, key: Key) -> Optional[str]:
+        # Кэш процесса защищен поколением StatsCache
+        return None
+
+    async def set(self, key: Key, value: Any, lease: str = None) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    async def apply(self, user_id: int, created: datetime, category_id: int, amount: int) -> None:
+        """Добавляет сумму к закэшированным итогам, в период которых попадает трата."""
+        for key, (expires, value) in list(self._data.items()):
+            if not _affected(key, user_id, created, category_id):
+                continue
+            value = _apply_amount(key, value, category_id, amount)
+            if value is None:
+                del self._data[key]
+            else:
+                self._data[key] = (expires, value)
+
+    async def clear(self) -> None:
+        self._data.clear()
+
+
+class RedisBackend:
+    """Общий для нескольких процессов кэш. Затронутые тратой записи удаляются, а не обновляются."""
+
+    prefix = 'finance-bot:stats'
+    lease_prefix = b'lease:'
+    lease_ttl = 60
+    # Значение записывается, только если в ключе все еще аренда читателя
+    SET_IF_LEASED = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        end
+        return false
+    """
+
+    def __init__(self, url: str, ttl: int):
+        self.ttl = ttl
+        self._redis = aioredis.from_url(url)
+        self._set_if_leased = self._redis.register_script(self.SET_IF_LEASED)
+
+    def _key(self, key: Key) -> str:
+        user_id, start, end, category_id = key
+        return (
+            f'{self.prefix}:{user_id}:{start:%Y%m%dT%H%M%S}:{end:%Y%m%dT%H%M%S}:'
+            f'{"" if category_id is None else category_id}'
+        )
+
+    def _parse_key(self, raw: bytes) -> Key:
+        user_id, start, end, category_id = raw.decode()[len(self.prefix) + 1:].split(':')
+        return (
+            int(user_id),
+            datetime.strptime(start, '%Y%m%dT%H%M%S'),
+            datetime.strptime(end, '%Y%m%dT%H%M%S'),
+            int(category_id) if category_id else None,
+        )
+
+    async def get(self, key: Key) -> Any:
+        raw = await self._redis.get(self._key(key))
+        if raw is None or raw.startswith(self.lease_prefix):
+            return None
+        value = json.loads(raw)
+        if key[3] is not None:
+            return CategoryTotal(*value)
+        return [StatRow(*r) for r in value]
+
+    async def lease(self, key: Key) -> str:
+        """
+        Занимает пустой ключ до запроса к БД. Если ключ уже занят другим читателем,
+        аренда все равно возвращается, но сохранить по ней ничего не получится.
+        """
+        lease = self.lease_prefix + uuid.uuid4().hex.encode()
+        await self._redis.set(self._key(key), lease, ex=self.lease_ttl, nx=True)
+        return lease.decode()
+
+    async def set(self, key: Key, value: Any, lease: str = None) -> None:
+        if lease is None:
+            await self._redis.set(self._key(key), json.dumps(value), ex=self.ttl)
+        else:
+            await self._set_if_leased(keys=[self._key(key)], args=[lease, json.dumps(value), self.ttl])
+
+    async def apply(self, user_id: int, created: datetime, category_id: int, amount: int) -> None:
+        stale = []
+        async for raw in self._redis.scan_iter(match=f'{self.prefix}:{user_id}:*'):
+            if _affected(self._parse_key(raw), user_id, created, category_id):
+                stale.append(raw)
+        if stale:
+            await self._redis.delete(*stale)
+
+    async def clear(self) -> None:
+        keys = [raw async for raw in self._redis.scan_iter(match=f'{self.prefix}:*')]
+        if keys:
+            await self._redis.delete(*keys)
+
+
+class StatsCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        # Увеличивается в начале и в конце каждой записи. Результат запроса, начатого до записи,
+        # в кэш не сохраняется, как и любой результат, пока запись идет
+        self.generation = 0
+        self.writes = 0
+
+    async def begin_read(
+            self, user_id: int, start: datetime, end: datetime, category_id: int = None
+    ) -> Generation:
+        """Снимается после промаха и до запроса к БД, передается в set_statistics или set_category_total."""
+        return Generation(self.generation, await self.backend.lease((user_id, start, end, category_id)))
+
+    async def get_statistics(self, user_id: int, start: datetime, end: datetime) -> Optional[List[StatRow]]:
+        return self._count(await self.backend.get((user_id, start, end, None)))
+
+    async def set_statistics(
+            self, user_id: int, start: datetime, end: datetime, rows, generation: Generation
+    ) -> List[StatRow]:
+        value = [StatRow(r.id, r.name, r.amount, r.daily_limit) for r in rows]
+        if self._can_store(generation):
+            await self.backend.set((user_id, start, end, None), value, generation.lease)
+        return value
+
+    async def get_category_total(
+            self, user_id: int, category_id: int, start: datetime, end: datetime
+    ) -> Optional[CategoryTotal]:
+        return self._count(await self.backend.get((user_id, start, end, category_id)))
+
+    async def set_category_total(
+            self, user_id: int, category_id: int, start: datetime, end: datetime, row, generation: Generation
+    ) -> CategoryTotal:
+        value = CategoryTotal(row.name, row.amount)
+        if self._can_store(generation):
+            await self.backend.set((user_id, start, end, category_id), value, generation.lease)
+        return value
+
+    @asynccontextmanager
+    async def writing(self) -> AsyncIterator[Generation]:
+        """
+        Оборачивает запись трат в БД вместе с expense_added и expense_deleted.
+        Отдает generation, которое будет после записи, если параллельно не шло других записей.
+        """
+        self.generation += 1
+        self.writes += 1
+        try:
+            yield Generation(self.generation + 1)
+        finally:
+            self.writes -= 1
+            self.generation += 1
+
+    async def expense_added(self, user_id: int, created: datetime, category_id: int, amount: int) -> None:
+        await self.backend.apply(user_id, created, category_id, amount)
+
+    async def expense_deleted(self, user_id: int, created: datetime, category_id: int, amount: int) -> None:
+        await self.backend.apply(user_id, created, category_id, -amount)
+
+    async def clear(self) -> None:
+        self.generation += 1
+        await self.backend.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
+
+    def _can_store(self, generation: Generation) -> bool:
+        return generation.local == self.generation and not self.writes
+
+    def _count(self, value: Any) -> Any:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+
+def _make_backend():
+    if settings.STATS_CACHE_REDIS_URL:
+        if aioredis is None:
+            logger.warning('STATS_CACHE_REDIS_URL is set but redis is not installed, using in-process cache')
+        else:
+            return RedisBackend(settings.STATS_CACHE_REDIS_URL, ttl=settings.STATS_CACHE_TTL)
+    if settings.UPDATE_QUEUE_ENABLED:
+        # Траты применяются только к кэшу процесса, который их добавил, у других воркеров он бы устарел
+        logger.warning('Update queue workers need STATS_CACHE_REDIS_URL to share statistics cache, cache disabled')
+        return MemoryBackend(max_size=0, ttl=settings.STATS_CACHE_TTL)
+    return MemoryBackend(max_size=settings.STATS_CACHE_SIZE, ttl=settings.STATS_CACHE_TTL)
+
+
+stats_cache = StatsCache(_make_backend())
+
+metrics.registry.gauge('finance_bot_stats_cache_hits', 'Statistics cache hits', lambda: stats_cache.hits)
+metrics.registry.gauge('finance_bot_stats_cache_misses', 'Statistics cache misses', lambda: stats_cache.misses)
+metrics.registry.gauge('finance_bot_stats_cache_hit_rate', 'Statistics cache hit rate', lambda: stats_cache.hit_rate)
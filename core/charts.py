@@ -0,0 +1,163 @@
+"""
+Графики трат /chart month и /chart year: итоги по категориям и траты по дням в одной картинке PNG.
+
+Данные берутся из роллапа одним срезом, как для /analytics. Отрисовка matplotlib (Agg, без дисплея)
+идет в пуле процессов и не блокирует цикл событий. Версия данных — хэш того, что попадает на график,
+поэтому картинка с тем же ключом (пользователь, период, версия) всегда одинакова: после первой
+отправки запоминается file_id Telegram, и повторный запрос не рисует и не загружает ее заново.
+"""
+import asyncio
+import hashlib
+import io
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from multiprocessing import get_context
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from aiogram import Dispatcher
+
+from core import exceptions, periods
+from core.cache import MemoryBackend
+from core.db import async_session
+from core.money import MINOR_UNITS
+from core.resolver import resolver
+from core.settings import settings
+from models import DailyCategoryTotal
+
+try:
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.dates
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+except ImportError:
+    matplotlib = None
+
+CHART_PERIODS = ('month', 'year')
+
+Key = Tuple[int, str, date, str]
+
+
+class ChartData(NamedTuple):
+    title: str
+    first_day: date
+    last_day: date
+    # Траты по прошедшим дням периода и итоги по категориям в копейках
+    daily: List[int]
+    categories: List[Tuple[str, int]]
+    currency: str
+
+
+class Chart(NamedTuple):
+    key: Key
+    # Задан, если картинка уже отправлялась, иначе png
+    file_id: Optional[str]
+    png: Optional[bytes]
+
+
+_file_ids = MemoryBackend(max_size=settings.CHART_CACHE_SIZE, ttl=settings.STATS_CACHE_TTL)
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+async def get_chart(user_id: int, name: str) -> Chart:
+    if name not in CHART_PERIODS:
+        raise exceptions.NotCorrectMessage("Укажите период графика: /chart month или /chart year")
+    if matplotlib is None:
+        raise exceptions.NotCorrectMessage("Графики недоступны: не установлен matplotlib")
+    data = await _load(user_id, periods.get_period(name))
+    if not data.categories:
+        raise exceptions.NotCorrectMessage("За этот период трат нет")
+    key = (user_id, name, data.first_day, _version(data))
+    file_id = await _file_ids.get(key)
+    if file_id is not None:
+        return Chart(key=key, file_id=file_id, png=None)
+    png = await asyncio.get_event_loop().run_in_executor(_get_pool(), render_png, data)
+    return Chart(key=key, file_id=None, png=png)
+
+
+async def remember(key: Key, file_id: str) -> None:
+    """Запоминает file_id отправленной картинки для повторных запросов с той же версией данных."""
+    await _file_ids.set(key, file_id)
+
+
+async def on_shutdown(_: Dispatcher) -> None:
+    """Дожидается начатых отрисовок и останавливает процессы пула."""
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await asyncio.get_event_loop().run_in_executor(None, pool.shutdown)
+
+
+async def _load(user_id: int, period: periods.Period) -> ChartData:
+    first_day, last_day = periods.local_days(period)
+    snapshot = await resolver.snapshot(user_id)
+    async with async_session() as db:
+        rows = await DailyCategoryTotal.get_slice(
+            db=db, user_id=user_id, first_day=first_day, last_day=first_day + timedelta(days=period.days)
+        )
+    columns = list(zip(*rows)) or [(), (), ()]
+    day_index = np.array(columns[0], dtype=np.int64)
+    category_ids = np.array(columns[1], dtype=np.int64)
+    amounts = np.array(columns[2], dtype=np.int64)
+    #
+    daily = np.zeros(period.days, dtype=np.int64)
+    np.add.at(daily, day_index, amounts)
+    names = {c.id: c.name for c in snapshot.categories}
+    ids, inverse = np.unique(category_ids, return_inverse=True)
+    totals = np.zeros(len(ids), dtype=np.int64)
+    np.add.at(totals, inverse.ravel(), amounts)
+    # Траты удаленных за время запроса категорий на график не попадают
+    categories = sorted(
+        ((names[int(i)], int(total)) for i, total in zip(ids, totals) if int(i) in names and total),
+        key=lambda c: (-c[1], c[0]),
+    )
+    return ChartData(
+        title=period.title, first_day=first_day, last_day=last_day, daily=daily.tolist(), categories=categories,
+        currency=settings.CURRENCY,
+    )
+
+
+def _version(data: ChartData) -> str:
+    return hashlib.sha1(repr(tuple(data)).encode()).hexdigest()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: дочерние процессы не наследуют соединения и потоки бота
+        _pool = ProcessPoolExecutor(max_workers=settings.CHART_WORKERS, mp_context=get_context('spawn'))
+    return _pool
+
+
+def render_png(data: ChartData) -> bytes:
+    """Рисует график в PNG. Выполняется в процессе пула, поэтому не трогает ничего, кроме data."""
+    figure = Figure(figsize=(8, 9), dpi=100, tight_layout=True)
+    FigureCanvasAgg(figure)
+    by_category, by_day = figure.subplots(2, 1)
+    figure.suptitle(data.title)
+    #
+    names = [name for name, _ in reversed(data.categories)]
+    totals = [amount / MINOR_UNITS for _, amount in reversed(data.categories)]
+    bars = by_category.barh(names, totals, color='tab:blue')
+    by_category.bar_label(bars, labels=[f'{t:,.0f}'.replace(',', ' ') for t in totals], padding=3)
+    by_category.set_title(f'По категориям, {data.currency}')
+    by_category.margins(x=0.15)
+    #
+    days = [data.first_day + timedelta(days=i) for i in range(len(data.daily))]
+    values = [amount / MINOR_UNITS for amount in data.daily]
+    if (data.last_day - data.first_day).days > 31:
+        by_day.plot(days, values, color='tab:orange', linewidth=1)
+        by_day.fill_between(days, values, color='tab:orange', alpha=0.3)
+        by_day.xaxis.set_major_formatter(matplotlib.dates.DateFormatter('%m.%Y'))
+    else:
+        by_day.bar(days, values, color='tab:orange')
+        by_day.xaxis.set_major_formatter(matplotlib.dates.DateFormatter('%d'))
+    # Ось — весь период, включая еще не наступившие дни
+    by_day.set_xlim(data.first_day - timedelta(days=1), data.last_day)
+    by_day.set_title(f'По дням, {data.currency}')
+    by_day.grid(axis='y', alpha=0.3)
+    #
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    return buffer.getvalue()
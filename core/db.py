@@ -1,8 +1,72 @@
+import asyncio
+import time
+
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from core import metrics
+from core.logging_utils import logger
 from core.settings import settings
 
-engine = create_async_engine(settings.POSTGRES_CONFIG.URL, future=True)
+
+class PoolStats:
+    """Счетчики ожидания соединений из пула между выводами в лог."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def observe_wait(self, seconds: float):
+        self.checkouts += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, замеряющий время получения соединения (ожидание свободного или подключение нового)."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.observe_wait(time.perf_counter() - started)
+
+
+async def log_pool_stats(interval: int) -> None:
+    """Периодически логирует загрузку пула и время ожидания соединений."""
+    pool = engine.sync_engine.pool
+    while True:
+        await asyncio.sleep(interval)
+        avg_wait = pool_stats.wait_total / pool_stats.checkouts if pool_stats.checkouts else 0
+        logger.info(
+            f'DB pool: in use {pool.checkedout()}/{pool.size()} (overflow {pool.overflow()}), '
+            f'checkouts {pool_stats.checkouts}, wait avg {avg_wait * 1000:.2f} ms, max {pool_stats.wait_max * 1000:.2f} ms'
+        )
+        pool_stats.reset()
+
+
+pg = settings.POSTGRES_CONFIG
+engine = create_async_engine(
+    pg.URL,
+    future=True,
+    poolclass=InstrumentedQueuePool,
+    pool_size=pg.POOL_SIZE,
+    max_overflow=pg.MAX_OVERFLOW,
+    pool_timeout=pg.POOL_TIMEOUT,
+    pool_recycle=pg.POOL_RECYCLE,
+    pool_pre_ping=pg.POOL_PRE_PING,
+    connect_args={'prepared_statement_cache_size': pg.STATEMENT_CACHE_SIZE},
+)
 Base = declarative_base()
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+metrics.registry.gauge('finance_bot_db_pool_checked_out', 'Connections checked out from the pool', lambda: engine.pool.checkedout())
@@ -1,107 +1,186 @@
-import re
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from typing import List, NamedTuple, Optional, Tuple
 
-from core import exceptions
+from core import parser, periods
+from core.money import format_amount
+from core.cache import stats_cache
 from core.db import async_session
+from core.resolver import resolver
 from core.settings import settings
-from models import Expense, Category, Budget
-from schemas.expense import MessageSchema, ExpenseSchema, CategorySchema
+from core.write_buffer import write_buffer
+from models import Expense
 
 
-async def add_expense(raw_message: str):
+class AddedExpense(NamedTuple):
+    id: int
+    # В копейках
+    amount: int
+    category_name: str
+    # Локальная дата траты, если она добавлена не на сегодня
+    day: Optional[date] = None
+
+
+async def add_expenses(
+        user_id: int, raw_message: str, message_id: int, sent: datetime
+) -> Tuple[List[AddedExpense], str]:
     """
-    Добавляет новую трату.
-    Принимает на вход текст сообщения, пришедшего в бот.
+    Добавляет новые траты, по одной на каждую строку сообщения, одним запросом.
+    Принимает на вход текст сообщения, пришедшего в бот, его id и время отправки в UTC.
+    Время трат и их ключи идемпотентности зависят только от сообщения, поэтому повторная доставка
+    того же сообщения ничего не добавляет.
+    Возвращает добавленные траты и статистику за сегодня с их учетом,
+    перед ней — предупреждение, если траты превысили дневной бюджет.
     """
-    m = _parse_message(raw_message)
-    async with async_session() as db:
-        category_id = await Category.get_category_id(db=db, category_name=m.category_text)
-        e = await Expense.create(db=db, amount=m.amount, category_id=category_id, created=datetime.utcnow())
-    return ExpenseSchema(id=e.id, amount=e.amount, category_name=m.category_text)
+    day_sent = periods.local_date(sent)
+    parsed = parser.parse_message(raw_message, day_sent)
+    category_ids = [await resolver.get_category_id(user_id, p.category_text) for p in parsed]
+    values = [
+        dict(
+            user_id=user_id, amount=p.amount, category_id=category_id,
+            created=sent + (p.day - day_sent if p.day else timedelta()),
+            idempotency_key=f'{message_id}:{number}',
+        )
+        for number, (p, category_id) in enumerate(zip(parsed, category_ids), start=1)
+    ]
+    period = periods.get_period('today')
+    async with stats_cache.writing() as generation:
+        if settings.WRITE_BUFFER_ENABLED:
+            expense_ids = await write_buffer.add(values)
+        else:
+            async with async_session() as db:
+                rows = await Expense.create_with_statistics(
+                    db=db, user_id=user_id, start=period.start, end=period.end, expenses=values,
+                )
+            ids_by_key = dict(zip(rows[0].expense_keys or [], rows[0].expense_ids or []))
+            expense_ids = [ids_by_key.get(v['idempotency_key']) for v in values]
+        new_values = [v for v, expense_id in zip(values, expense_ids) if expense_id is not None]
+        for v in new_values:
+            await stats_cache.expense_added(user_id, v['created'], v['category_id'], v['amount'])
+    if settings.WRITE_BUFFER_ENABLED:
+        rows = await _aggregate(user_id, period)
+    else:
+        # Свежая статистика за сегодня сохраняется в кэш, если параллельно с этой записью не было других
+        rows = await stats_cache.set_statistics(user_id, period.start, period.end, rows, generation=generation)
+    # Траты, уже записанные при прошлой доставке сообщения, в ответ не попадают
+    added = [
+        AddedExpense(id=expense_id, amount=p.amount, category_name=p.category_text, day=p.day)
+        for expense_id, p in zip(expense_ids, parsed) if expense_id is not None
+    ]
+    added_today = sum(v['amount'] for v in new_values if period.start <= v['created'] < period.end)
+    statistics = _render_statistics(period, rows)
+    alert = _budget_alert(rows, added_today)
+    return added, f'{alert}\n\n{statistics}' if alert else statistics
+
+
+def _budget_alert(rows, added_today: int) -> Optional[str]:
+    """Предупреждение, если траты за сегодня перешли дневной бюджет именно этими тратами."""
+    daily_limit = rows[0].daily_limit if rows else 0
+    total = sum(r.amount or 0 for r in rows)
+    if not daily_limit or not total - added_today <= daily_limit < total:
+        return None
+    return (
+        f"Превышен дневной бюджет: потрачено {format_amount(total)} {settings.CURRENCY} "
+        f"из {format_amount(daily_limit)}"
+    )
 
 
-async def delete_expense(expense_id: int) -> None:
+async def delete_expense(user_id: int, expense_id: int) -> None:
     """Удаляет трату по ее идентификатору"""
-    async with async_session() as db:
-        await Expense.delete_by_id(db=db, instance_id=expense_id)
+    async with stats_cache.writing():
+        async with async_session() as db:
+            deleted = await Expense.delete_returning(db=db, user_id=user_id, instance_id=expense_id)
+        if deleted:
+            await stats_cache.expense_deleted(user_id, deleted.created, deleted.category_id, deleted.amount)
+
+
+async def get_statistics(user_id: int, period: periods.Period) -> str:
+    """Возвращает строкой статистику расходов за период"""
+    return _render_statistics(period, await _aggregate(user_id, period))
+
 
+async def warm_statistics(user_id: int, period: periods.Period) -> None:
+    """Заранее считает статистику за период в кэш."""
+    await _aggregate(user_id, period)
 
-async def get_statistics(period: str) -> str:
-    """Возвращает строкой статистику расходов за текущий месяц"""
+
+async def _aggregate(user_id: int, period: periods.Period) -> list:
+    """Общая агрегация для всех периодов: суммы по категориям за [start, end) в одном запросе или из кэша."""
+    rows = await stats_cache.get_statistics(user_id, period.start, period.end)
+    if rows is not None:
+        return rows
+    generation = await stats_cache.begin_read(user_id, period.start, period.end)
     async with async_session() as db:
-        categories = await Category.get_all(db=db, selectinload_attr='expenses')
-        categories = [CategorySchema.from_db(c) for c in categories]
-        #
-        if period == 'month':
-            deadline = datetime.utcnow().replace(day=1).date()
-            msg_title = 'Расходы в текущем месяце'
-            budget = datetime.utcnow().day * await _get_budget_limit()
-        else:
-            deadline = datetime.utcnow().date()
-            msg_title = 'Расходы за сегодня'
-            budget = await _get_budget_limit()
-        #
-        c_rows = []
-        full_amounts = 0
-        #
-        for c in categories:
-            expenses = list(filter(lambda e: e.created.date() >= deadline, c.expenses))
-            amount = sum([e.amount for e in expenses])
-            if amount > 0:
-                full_amounts += amount
-                command = f'/cat_d{c.id}' if period == 'today' else f'/cat_m{c.id}'
-                c_rows.append(f'{amount} {settings.CURRENCY} | {c.name} | {command}')
+        rows = await Expense.get_statistics(db=db, user_id=user_id, start=period.start, end=period.end)
+    return await stats_cache.set_statistics(user_id, period.start, period.end, rows, generation=generation)
+
+
+def _render_statistics(period: periods.Period, rows) -> str:
+    """Форматирует строки Expense.get_statistics в ответ бота."""
+    budget = period.days * rows[0].daily_limit if rows else 0
+    c_rows = []
+    full_amounts = 0
+    #
+    for c in rows:
+        if c.amount:
+            full_amounts += c.amount
+            command = f' | /cat_{period.code}{c.id}' if period.code != periods.CUSTOM else ''
+            c_rows.append(f'{format_amount(c.amount)} {settings.CURRENCY} | {c.name}{command}')
     #
-    answer_message = (f"{msg_title}:\n всего — {full_amounts} {settings.CURRENCY} из {budget}\n\n" + "\n".join(c_rows))
-    if period == 'today':
+    answer_message = (
+        f"{period.title}:\n всего — {format_amount(full_amounts)} {settings.CURRENCY} из {format_amount(budget)}\n\n" +
+        "\n".join(c_rows)
+    )
+    if period.code == 'd':
         answer_message += "\n\nЗа текущий месяц: /month"
     #
     return answer_message
 
 
-async def get_category(category_id: int, period: str) -> str:
-    """Получает одну запись о категории вместе с ее расходами по её идентификатору"""
+class CategoryPage(NamedTuple):
+    text: str
+    # Курсоры (created, id) для перехода к более новым и более старым тратам, None если их нет
+    newer: Optional[Tuple[datetime, int]] = None
+    older: Optional[Tuple[datetime, int]] = None
+
+
+async def get_category(
+        user_id: int, category_id: int, period: str, before: Tuple[datetime, int] = None, after: Tuple[datetime, int] = None,
+) -> CategoryPage:
+    """Получает страницу трат категории за период, от новых к старым, с общей суммой за период"""
+    p = periods.get_period_by_code(period)
+    start, end = p.start, p.end
+    date_format = "%H:%M" if p.code == 'd' else '%d-%m-%Y %H:%M'
+    #
+    category = await stats_cache.get_category_total(user_id, category_id, start, end)
     async with async_session() as db:
-        category = await Category.by_id(db=db, instance_id=category_id, selectinload_attr='expenses')
-        c = CategorySchema.from_db(category)
-        #
-        if period == 'm':
-            deadline = datetime.utcnow().date().replace(day=1)
-            date_format = '%d-%m-%Y'
-            msg_title = f'Расходы по категории {c.name} за месяц'
-        else:
-            deadline = datetime.utcnow().date()
-            date_format = "%H:%M"
-            msg_title = f'Расходы по категории {c.name} за сегодня'
-        #
-        expenses = list(filter(lambda e: e.created.date() >= deadline, c.expenses))
-    return (
-            f"{msg_title}:\n"
-            f"всего — {sum([e.amount for e in expenses])} {settings.CURRENCY}.\n\n" +
+        if category is None:
+            generation = await stats_cache.begin_read(user_id, start, end, category_id)
+            category = await Expense.get_category_total(
+                db=db, user_id=user_id, category_id=category_id, start=start, end=end
+            )
+            if not category:
+                return CategoryPage(text=f"Категории с идентификатором {category_id} не существует")
+            category = await stats_cache.set_category_total(
+                user_id, category_id, start, end, category, generation=generation
+            )
+        expenses, has_more = await Expense.get_page(
+            db=db, user_id=user_id, category_id=category_id, start=start, end=end, limit=settings.CATEGORY_PAGE_SIZE,
+            before=before, after=after,
+        )
+    #
+    text = (
+            f"{p.title}, категория {category.name}:\n"
+            f"всего — {format_amount(category.amount)} {settings.CURRENCY}.\n\n" +
             "\n".join([
-                f'{e.amount} {settings.CURRENCY} | {c.name} | '
+                f'{format_amount(e.amount)} {settings.CURRENCY} | {category.name} | '
                 f'{(e.created + timedelta(hours=settings.DIFFERENCE_WITH_UTC)).strftime(date_format)} | /del{e.id}'
                 for e in expenses
             ])
     )
+    if not expenses:
+        return CategoryPage(text=text)
+    first, last = (expenses[0].created, expenses[0].id), (expenses[-1].created, expenses[-1].id)
+    if after is not None:
+        return CategoryPage(text=text, newer=first if has_more else None, older=last)
+    return CategoryPage(text=text, newer=first if before is not None else None, older=last if has_more else None)
 
-
-def _parse_message(raw_message: str) -> MessageSchema:
-    """Парсит текст пришедшего сообщения о новом расходе."""
-    regexp_result = re.match(r"([\d+\.\d+]+) (.*)", raw_message)
-    if not regexp_result or not regexp_result.group(0) \
-            or not regexp_result.group(1) or not regexp_result.group(2):
-        raise exceptions.NotCorrectMessage(
-            "Не могу понять сообщение. Напишите сообщение в формате, "
-            "например:\n1500 метро")
-
-    amount = regexp_result.group(1).replace(" ", "")
-    category_text = regexp_result.group(2).strip().lower()
-    return MessageSchema(amount=float(amount), category_text=category_text)
-
-
-async def _get_budget_limit() -> int:
-    """Возвращает дневной лимит трат."""
-    async with async_session() as db:
-        budget = await Budget.get(db=db)
-    return budget.daily_limit if budget else 0
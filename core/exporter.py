@@ -0,0 +1,107 @@
+"""
+Потоковая выгрузка трат в CSV или Parquet.
+
+Строки читаются серверным курсором порциями по EXPORT_CHUNK_SIZE и сразу дописываются в файл,
+поэтому память не зависит от количества трат. Колонки совпадают с форматом импорта
+(created в локальном времени пользователя), плюс id траты.
+Parquet требует pyarrow, которого нет в Docker-образе (python:3.7-alpine): там доступен только CSV.
+
+    python -m core.exporter expenses.csv --user-id 123456
+    python -m core.exporter expenses.parquet --user-id 123456
+"""
+import argparse
+import asyncio
+import csv
+import os
+import time
+from datetime import timedelta
+
+from core import exceptions
+from core.db import async_session
+from core.logging_utils import logger
+from core.money import SCALE, to_decimal
+from core.settings import settings
+from models import Expense
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+COLUMNS = ('id', 'created', 'amount', 'category')
+FORMATS = ('csv', 'parquet')
+
+
+async def export_file(path: str, user_id: int, chunk_size: int = None) -> int:
+    """Выгружает все траты пользователя в файл, формат определяется по расширению. Возвращает число строк."""
+    file_format = os.path.splitext(path)[1].lower().lstrip('.')
+    if file_format not in FORMATS:
+        raise exceptions.NotCorrectMessage(f"Поддерживаемые форматы выгрузки: {', '.join(FORMATS)}")
+    if file_format == 'parquet' and pyarrow is None:
+        raise exceptions.NotCorrectMessage("Выгрузка в Parquet недоступна: не установлен pyarrow")
+    #
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    offset = timedelta(hours=settings.DIFFERENCE_WITH_UTC)
+    started = time.perf_counter()
+    exported = 0
+    writer = _ParquetWriter(path) if file_format == 'parquet' else _CsvWriter(path)
+    try:
+        async with async_session() as db:
+            result = await db.stream(Expense.export_query(user_id).execution_options(yield_per=chunk_size))
+            async for rows in result.partitions(chunk_size):
+                writer.write([(r.id, r.created + offset, to_decimal(r.amount), r.category) for r in rows])
+                exported += len(rows)
+    finally:
+        writer.close()
+    logger.info(f'Exported {exported} expenses to {path} in {time.perf_counter() - started:.1f} s')
+    return exported
+
+
+class _CsvWriter:
+    def __init__(self, path: str):
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, rows: list) -> None:
+        self._writer.writerows(rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _ParquetWriter:
+    """Пишет каждую порцию строк отдельной row group."""
+
+    def __init__(self, path: str):
+        schema = pyarrow.schema([
+            ('id', pyarrow.int64()),
+            ('created', pyarrow.timestamp('us')),
+            ('amount', pyarrow.decimal128(18, SCALE)),
+            ('category', pyarrow.string()),
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, schema)
+
+    def write(self, rows: list) -> None:
+        columns = list(zip(*rows))
+        self._writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(column, type=field.type) for column, field in zip(columns, self._writer.schema)],
+            schema=self._writer.schema,
+        ))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Export expenses to CSV or Parquet')
+    parser.add_argument('path')
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--chunk-size', type=int, default=settings.EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(export_file(args.path, args.user_id, args.chunk_size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Потоковый импорт трат из CSV или JSONL (например, выгрузок из банка).
+
+Каждая строка содержит поля created (дата или дата и время в локальном времени пользователя),
+amount и category (имя категории или алиас). Файл читается построчно, записи пишутся
+в таблицу expense через COPY пачками по IMPORT_CHUNK_SIZE строк в одной транзакции.
+Триггер роллапа на время импорта выключен, суммы по дням и категориям копятся в памяти
+и дописываются в daily_category_totals одним запросом в той же транзакции.
+
+    python -m core.importer expenses.csv --user-id 123456 [--chunk-size 5000]
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import asyncpg
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from core.cache import stats_cache
+from core.db import engine
+from core.exceptions import GetFromDatabaseException
+from core.logging_utils import logger
+from core.money import to_minor
+from core.resolver import resolver
+from core.settings import settings
+from models import DailyCategoryTotal
+
+COLUMNS = ('user_id', 'amount', 'created', 'category_id')
+JSONL_SUFFIXES = ('.jsonl', '.ndjson')
+SUFFIXES = ('.csv',) + JSONL_SUFFIXES
+# COPY и сумма роллапа идут в обход SQLAlchemy, ошибки asyncpg приходят как есть
+DB_ERRORS = (SQLAlchemyError, asyncpg.PostgresError, GetFromDatabaseException, OSError, asyncio.TimeoutError)
+
+
+class ImportResult(NamedTuple):
+    imported: int
+    skipped: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.imported / self.seconds if self.seconds else 0
+
+
+def iter_rows(path: str) -> Iterator[Any]:
+    """
+    Лениво читает строки файла как словари, формат определяется по расширению.
+    Строка JSONL, которая не разбирается как JSON, отдается как None и пропускается в parse_row.
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        if os.path.splitext(path)[1].lower() in JSONL_SUFFIXES:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        yield None
+        else:
+            yield from csv.DictReader(f)
+
+
+def parse_row(row: Any, ids_by_name: Dict[str, int]) -> Optional[Tuple[int, datetime, int]]:
+    """
+    Преобразует строку файла в запись для COPY, None — если строку нужно пропустить.
+    Пропускаются и строки JSONL, которые не являются объектом (список, число, строка, битый JSON).
+    """
+    try:
+        category_id = ids_by_name.get(str(row['category']).strip().lower())
+        amount = to_minor(str(row['amount']))
+        created = datetime.fromisoformat(str(row['created']).strip())
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return None
+    if category_id is None or amount <= 0:
+        return None
+    return amount, created - timedelta(hours=settings.DIFFERENCE_WITH_UTC), category_id
+
+
+async def import_file(path: str, user_id: int, chunk_size: int = None) -> ImportResult:
+    """Импортирует файл пользователя целиком в одной транзакции, память не зависит от размера файла."""
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    ids_by_name = (await resolver.snapshot(user_id)).ids_by_name
+    started = time.perf_counter()
+    imported = skipped = 0
+    # (локальный день, категория) -> [сумма, число трат], день считается как в функции триггера
+    totals: Dict[Tuple[date, int], List[int]] = defaultdict(lambda: [0, 0])
+    offset = timedelta(hours=int(settings.DIFFERENCE_WITH_UTC))
+    rows = iter_rows(path)
+    # Транзакцией владеет SQLAlchemy: ее открывает первый запрос через conn, COPY драйвера идет в ней же.
+    # Своя транзакция asyncpg на соединении после pre-ping пула стала бы точкой сохранения
+    # и откатывалась бы при возврате соединения в пул
+    async with engine.begin() as conn:
+        await conn.execute(select(func.set_config(DailyCategoryTotal.DEFER_SETTING, 'on', True)))
+        raw_connection = await conn.get_raw_connection()
+        pg = raw_connection.driver_connection
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            records = [(user_id, *r) for r in (parse_row(row, ids_by_name) for row in chunk) if r is not None]
+            skipped += len(chunk) - len(records)
+            if records:
+                await pg.copy_records_to_table('expense', records=records, columns=COLUMNS)
+                imported += len(records)
+            for _, amount, created, category_id in records:
+                total = totals[(created + offset).date(), category_id]
+                total[0] += amount
+                total[1] += 1
+            logger.debug(f'Imported {imported} expenses from {path}, skipped {skipped}')
+        await conn.execute(select(func.set_config(DailyCategoryTotal.DEFER_SETTING, 'off', True)))
+        if totals:
+            days, category_ids = zip(*totals)
+            amounts, counts = zip(*totals.values())
+            await pg.execute(DailyCategoryTotal.ADD_TOTALS, user_id, days, category_ids, amounts, counts)
+    await stats_cache.clear()
+    result = ImportResult(imported=imported, skipped=skipped, seconds=time.perf_counter() - started)
+    logger.info(
+        f'Import of {path} finished: {result.imported} rows, {result.skipped} skipped, '
+        f'{result.seconds:.1f} s, {result.rows_per_second:.0f} rows/s'
+    )
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Import expenses from CSV or JSONL')
+    parser.add_argument('path')
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--chunk-size', type=int, default=settings.IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(import_file(args.path, args.user_id, args.chunk_size))
+
+
+if __name__ == '__main__':
+    main()
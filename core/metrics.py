@@ -0,0 +1,151 @@
+"""
+Метрики процесса в памяти. Отдаются в формате Prometheus на отдельном внутреннем адресе
+METRICS_HOST:METRICS_PORT (по умолчанию только localhost), а не на публичном порту вебхука.
+"""
+import asyncio
+import bisect
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiogram import Dispatcher
+from aiohttp import web
+
+from core.logging_utils import logger
+from core.settings import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+# Доставка ответа может ждать лимитов Telegram и RetryAfter
+DELIVERY_BUCKETS = LATENCY_BUCKETS + (10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Гистограмма в памяти процесса с метками, выводится в текстовом формате Prometheus."""
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...], label: str = 'command'):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.label = label
+        self._counts: Dict[str, List[int]] = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        self._sums: Dict[str, float] = defaultdict(float)
+
+    def observe(self, label_value: str, value: float) -> None:
+        self._counts[label_value][bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[label_value] += value
+
+    def summary(self) -> Dict[str, Tuple[int, float, float]]:
+        """Возвращает {метка: (количество, среднее, оценка p99 по границе бакета)}."""
+        result = {}
+        for label_value, counts in self._counts.items():
+            total = sum(counts)
+            threshold, cumulative, p99 = total * 0.99, 0, float('inf')
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                if cumulative >= threshold:
+                    p99 = bound
+                    break
+            result[label_value] = (total, self._sums[label_value] / total, p99)
+        return result
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_value, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {self._sums[label_value]}')
+            lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.histograms: List[Histogram] = []
+        self.gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def histogram(
+            self, name: str, documentation: str, buckets: Tuple[float, ...], label: str = 'command'
+    ) -> Histogram:
+        histogram = Histogram(name, documentation, buckets, label=label)
+        self.histograms.append(histogram)
+        return histogram
+
+    def gauge(self, name: str, documentation: str, getter: Callable[[], float]) -> None:
+        """Регистрирует значение, которое считывается в момент выдачи метрик."""
+        self.gauges[name] = (documentation, getter)
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.render())
+        for name, (documentation, getter) in sorted(self.gauges.items()):
+            lines.extend([f'# HELP {name} {documentation}', f'# TYPE {name} gauge', f'{name} {getter()}'])
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+handler_seconds = registry.histogram(
+    'finance_bot_handler_seconds', 'Wall time of update processing', LATENCY_BUCKETS
+)
+db_seconds = registry.histogram(
+    'finance_bot_db_seconds', 'Total time spent in SQL statements per update', LATENCY_BUCKETS
+)
+db_statements = registry.histogram(
+    'finance_bot_db_statements', 'Number of SQL statements per update', COUNT_BUCKETS
+)
+reply_delivery_seconds = registry.histogram(
+    'finance_bot_reply_delivery_seconds', 'Time from queueing a reply to its delivery', DELIVERY_BUCKETS, label='kind'
+)
+
+
+async def log_summary(interval: int) -> None:
+    """Периодически выводит в лог сводку по гистограммам обработки апдейтов."""
+    while True:
+        await asyncio.sleep(interval)
+        statements = db_statements.summary()
+        db_time = db_seconds.summary()
+        for command, (count, avg, p99) in sorted(handler_seconds.summary().items()):
+            logger.info(
+                f'{command}: {count} updates, avg {avg * 1000:.1f} ms, p99 <= {p99 * 1000:.0f} ms, '
+                f'db avg {db_time.get(command, (0, 0, 0))[1] * 1000:.1f} ms, '
+                f'{statements.get(command, (0, 0, 0))[1]:.1f} queries/update'
+            )
+        for kind, (count, avg, p99) in sorted(reply_delivery_seconds.summary().items()):
+            logger.info(f'{kind} replies: {count} delivered, avg {avg * 1000:.1f} ms, p99 <= {p99 * 1000:.0f} ms')
+
+
+async def metrics_view(_: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type='text/plain')
+
+
+_runner: Optional[web.AppRunner] = None
+
+
+async def on_startup(_: Dispatcher) -> None:
+    """Поднимает HTTP-сервер /metrics, если задан METRICS_PORT."""
+    global _runner
+    if not settings.METRICS_PORT:
+        return
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_view)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, settings.METRICS_HOST, settings.METRICS_PORT).start()
+    except OSError:
+        # Например, несколько воркеров на одном хосте с одинаковым METRICS_PORT
+        logger.exception(f'Metrics are not served: {settings.METRICS_HOST}:{settings.METRICS_PORT} is unavailable')
+        await runner.cleanup()
+        return
+    _runner = runner
+    logger.info(f'Metrics are served on http://{settings.METRICS_HOST}:{settings.METRICS_PORT}/metrics')
+
+
+async def on_shutdown(_: Dispatcher) -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -1,21 +1,149 @@
-from typing import List
+import asyncio
+import math
+import time
+from typing import List, Optional, Set, Tuple
+from weakref import WeakKeyDictionary
 
 from aiogram import types
 from aiogram.dispatcher.handler import CancelHandler
 from aiogram.dispatcher.middlewares import BaseMiddleware
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
 
+from core import metrics
 from core.logging_utils import logger
+from core.outbox import outbox
+from core.throttling import RateLimiter
 
 
 class AccessMiddleware(BaseMiddleware):
-    """Аутентификация — пропускаем сообщения только от заданных Telegram аккаунтов."""
+    """
+    Аутентификация — пропускаем сообщения только от заданных Telegram аккаунтов.
+    С rate > 0 ограничиваем частоту сообщений от каждого пользователя, чтобы флуд
+    отсекался до любой работы с БД. Об отброшенных сообщениях пользователь узнает
+    одним ответом на серию: следующий будет только после того, как сообщение снова пройдет.
+    """
 
-    def __init__(self, access_ids: List[str]):
-        self.access_ids = access_ids
+    def __init__(self, access_ids: List[str], rate: float = 0, burst: int = 0):
+        self.access_ids = frozenset(int(access_id) for access_id in access_ids)
+        self.limiter = RateLimiter(rate, burst) if rate > 0 else None
+        self.dropped = 0
+        self._throttled: Set[int] = set()
         super().__init__()
 
-    async def on_process_message(self, message: types.Message, _):
-        logger.debug(f'Bot retrieved message: {message}')
-        if int(message.from_user.id) not in [int(access_id) for access_id in self.access_ids]:
-            await message.answer("Access Denied")
+    async def on_pre_process_message(self, message: types.Message, _):
+        logger.opt(lazy=True).debug('Bot retrieved message: {}', lambda: message)
+        if not self._admit(message.from_user.id, message.chat.id):
             raise CancelHandler()
+
+    async def on_pre_process_callback_query(self, query: types.CallbackQuery, _):
+        if not self._admit(query.from_user.id, query.from_user.id, notify=False):
+            raise CancelHandler()
+
+    def admit(self, update: types.Update) -> bool:
+        """Та же проверка для апдейта до обработки, например до записи в очередь воркеров."""
+        if update.message:
+            return self._admit(update.message.from_user.id, update.message.chat.id)
+        if update.callback_query:
+            return self._admit(update.callback_query.from_user.id, update.callback_query.from_user.id, notify=False)
+        return True
+
+    def _admit(self, user_id: int, chat_id: int, notify: bool = True) -> bool:
+        if not self._allow(user_id):
+            if notify and user_id not in self._throttled and user_id in self.access_ids:
+                self._throttled.add(user_id)
+                retry = math.ceil(self.limiter.bucket(user_id).delay())
+                outbox.send(
+                    chat_id,
+                    f"Слишком много сообщений подряд, это и следующие сообщения не обработаны. "
+                    f"Отправьте их снова через {retry} с.",
+                )
+            return False
+        if user_id not in self.access_ids:
+            outbox.send(chat_id, "Access Denied")
+            return False
+        return True
+
+    def _allow(self, user_id: int) -> bool:
+        if self.limiter is None:
+            return True
+        if self.limiter.allow(user_id):
+            self._throttled.discard(user_id)
+            return True
+        self.dropped += 1
+        logger.opt(lazy=True).debug('Drop update from {}: rate limit exceeded', lambda: user_id)
+        if len(self._throttled) > self.limiter.max_keys:
+            self._throttled.clear()
+        return False
+
+
+class UpdateProfile:
+    __slots__ = ('started', 'db_time', 'queries')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.queries: List[Tuple[str, float]] = []
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """
+    Профилирование апдейтов: время обработки, число SQL-запросов и время в БД по командам.
+    Запросы привязываются к апдейту через текущую asyncio-задачу, в которой aiogram его обрабатывает.
+    """
+
+    def __init__(self, engine: AsyncEngine, slow_update_ms: int = 0):
+        self.slow_update_ms = slow_update_ms
+        self._profiles: 'WeakKeyDictionary[asyncio.Task, UpdateProfile]' = WeakKeyDictionary()
+        event.listen(engine.sync_engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine.sync_engine, 'after_cursor_execute', self._after_cursor_execute)
+        super().__init__()
+
+    async def on_pre_process_update(self, update: types.Update, _):
+        self._profiles[asyncio.current_task()] = UpdateProfile()
+
+    async def on_post_process_update(self, update: types.Update, _, __):
+        profile = self._profiles.pop(asyncio.current_task(), None)
+        if profile is None:
+            return
+        elapsed = time.perf_counter() - profile.started
+        command = _command_name(update)
+        metrics.handler_seconds.observe(command, elapsed)
+        metrics.db_seconds.observe(command, profile.db_time)
+        metrics.db_statements.observe(command, len(profile.queries))
+        if self.slow_update_ms and elapsed * 1000 >= self.slow_update_ms:
+            logger.warning(
+                f'Slow update {update.update_id} ({command}): {elapsed * 1000:.1f} ms, '
+                f'{len(profile.queries)} queries, db {profile.db_time * 1000:.1f} ms\n' +
+                '\n'.join(f'  {duration * 1000:.1f} ms | {statement}' for statement, duration in profile.queries)
+            )
+
+    def _current_profile(self) -> Optional[UpdateProfile]:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            return None
+        return self._profiles.get(task) if task is not None else None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_started'].pop()
+        profile = self._current_profile()
+        if profile is not None:
+            profile.db_time += duration
+            profile.queries.append((statement, duration))
+
+
+def _command_name(update: types.Update) -> str:
+    """Метка апдейта для метрик: команда без аргументов, 'expense' для текста или тип апдейта."""
+    if update.message and update.message.text:
+        text = update.message.text
+        if not text.startswith('/'):
+            return 'expense'
+        command = text.split()[0].split('@')[0]
+        return command.rstrip('0123456789') if command[1:4] in ('del', 'cat') else command
+    if update.callback_query:
+        return 'callback_query'
+    return 'other'
@@ -0,0 +1,35 @@
+"""
+Суммы хранятся и складываются целыми числами в минимальных единицах валюты (копейках),
+в рубли они переводятся только при выводе и выгрузке.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+MINOR_UNITS = 100
+SCALE = 2
+# Наибольшая сумма одной траты, миллиард рублей: суммы десятков миллионов таких трат
+# еще помещаются в BIGINT
+MAX_AMOUNT = 10 ** 9 * MINOR_UNITS
+
+
+def to_minor(text: str) -> int:
+    """Переводит сумму в рублях из текста («1500», «1 500,50», «99.9») в копейки без потери точности."""
+    try:
+        value = Decimal(''.join(text.split()).replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f'Not a number: {text!r}')
+    if not value.is_finite():
+        raise ValueError(f'Not a number: {text!r}')
+    if abs(value) * MINOR_UNITS > MAX_AMOUNT:
+        raise ValueError(f'Amount is too large: {text!r}')
+    return int((value * MINOR_UNITS).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def to_decimal(minor: int) -> Decimal:
+    return Decimal(minor).scaleb(-SCALE)
+
+
+def format_amount(minor: int) -> str:
+    """1500 для целых рублей, 1500.50 — с копейками."""
+    units, cents = divmod(abs(minor), MINOR_UNITS)
+    sign = '-' if minor < 0 else ''
+    return f'{sign}{units}.{cents:02d}' if cents else f'{sign}{units}'
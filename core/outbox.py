@@ -0,0 +1,300 @@
+"""
+Очередь исходящих сообщений.
+
+Хендлеры не ждут Bot API: reply() кладет ответ в очередь процесса и сразу возвращается,
+так что обработка апдейта заканчивается коммитом в БД. Очередь разбирают OUTBOX_WORKERS задач.
+Частоту ограничивают общая корзина токенов (лимит Telegram — около 30 сообщений в секунду на бота)
+и корзина на каждый чат (около одного сообщения в секунду). Сообщения одного чата уходят по одному
+и по порядку, чат, исчерпавший свою корзину, не занимает задачу на время ожидания.
+На RetryAfter чат ждет указанное Telegram время, сетевые ошибки повторяются с удваивающейся паузой,
+остальные ошибки Bot API (бот заблокирован, чат не найден) не повторяются.
+
+Пока ответ ждет отправки, следующий ответ в тот же чат с тем же ключом coalesce сливается с ним:
+строки дописываются, итог заменяется последним. Серия трат подряд дает один ответ со всеми тратами
+и актуальной статистикой, повторный /month — одну статистику. Слияние останавливается у лимита Telegram
+на длину сообщения, а текст длиннее лимита уходит несколькими сообщениями по границам строк.
+Через очередь уходят и картинки, файлы и правка сообщений с кнопками.
+
+Очередь живет в памяти процесса. При остановке она дожидается отправки не дольше
+OUTBOX_SHUTDOWN_TIMEOUT секунд, при падении процесса неотправленные ответы теряются.
+Время от постановки в очередь до доставки пишется в гистограмму finance_bot_reply_delivery_seconds.
+"""
+import asyncio
+import io
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.utils.exceptions import NetworkError, RetryAfter, TelegramAPIError
+
+from core import metrics
+from core.logging_utils import logger
+from core.settings import settings
+from core.throttling import RateLimiter, TokenBucket
+
+
+# Лимит Telegram на длину текста сообщения
+MESSAGE_LIMIT = 4096
+
+
+def _join(header: Optional[str], lines: List[str], summary: Optional[str]) -> str:
+    body = "\n".join(([header] if header else []) + lines)
+    return "\n\n".join(part for part in (body, summary) if part)
+
+
+def split_text(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Делит текст на части не длиннее limit по границам строк, слишком длинные строки — по limit символов."""
+    parts, current = [], ''
+    for line in text.split('\n'):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ''
+            parts.append(line[:limit])
+            line = line[limit:]
+        candidate = f'{current}\n{line}' if current else line
+        if len(candidate) > limit:
+            parts.append(current)
+            candidate = line
+        current = candidate
+    if current or not parts:
+        parts.append(current)
+    return parts
+
+
+class Outgoing:
+    """
+    Сообщение в чат: текст из заголовка, строк и итога, разделенного пустой строкой, картинка
+    (file_id или PNG), файл по пути или новый текст сообщения edit_message_id.
+    """
+
+    __slots__ = (
+        'chat_id', 'coalesce', 'header', 'lines', 'summary', 'reply_markup', 'photo', 'document',
+        'edit_message_id', 'on_sent', 'on_done', 'enqueued', 'attempts', 'sent_parts',
+    )
+
+    def __init__(
+            self, chat_id: int, lines: List[str], header: str = None, summary: str = None,
+            coalesce: str = None, reply_markup=None, photo=None, document: str = None, edit_message_id: int = None,
+            on_sent: Callable[[types.Message], Awaitable[None]] = None, on_done: Callable[[], None] = None,
+    ):
+        self.chat_id = chat_id
+        self.coalesce = coalesce
+        self.header = header
+        self.lines = lines
+        self.summary = summary
+        self.reply_markup = reply_markup
+        self.photo = photo
+        self.document = document
+        self.edit_message_id = edit_message_id
+        # Вызывается с отправленным сообщением, on_done — после отправки или отказа от нее
+        self.on_sent = on_sent
+        self.on_done = on_done
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+        # Сколько частей длинного текста уже отправлено, повтор начинается со следующей
+        self.sent_parts = 0
+
+    @property
+    def text(self) -> str:
+        return _join(self.header, self.lines, self.summary)
+
+    def merge(self, other: 'Outgoing') -> bool:
+        """Дописывает other, если текст останется в пределах лимита. Возвращает False, если не дописал."""
+        lines = self.lines + other.lines
+        summary = self.summary if other.summary is None else other.summary
+        if len(_join(self.header, lines, summary)) > MESSAGE_LIMIT:
+            return False
+        self.lines, self.summary = lines, summary
+        self.reply_markup = other.reply_markup
+        return True
+
+
+class Outbox:
+    def __init__(self, rate: float, chat_rate: float, chat_burst: int, workers: int):
+        self.workers = workers
+        self.coalesced = 0
+        self.failed = 0
+        self._bucket = TokenBucket(rate, capacity=rate)
+        self._chats = RateLimiter(chat_rate, chat_burst)
+        self._pending: Dict[int, Deque[Outgoing]] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._bot: Optional[Bot] = None
+
+    @property
+    def size(self) -> int:
+        return sum(len(queue) for queue in self._pending.values())
+
+    def send(
+            self, chat_id: int, text: str = None, header: str = None, summary: str = None,
+            coalesce: str = None, reply_markup=None,
+    ) -> None:
+        """Ставит сообщение в очередь. Сообщение с тем же coalesce, еще не взятое в отправку, дополняется."""
+        self._put(Outgoing(
+            chat_id, [text] if text else [], header=header, summary=summary, coalesce=coalesce,
+            reply_markup=reply_markup,
+        ))
+
+    def send_photo(
+            self, chat_id: int, photo, on_sent: Callable[[types.Message], Awaitable[None]] = None
+    ) -> None:
+        """Ставит в очередь картинку: file_id уже загруженной или байты PNG."""
+        self._put(Outgoing(chat_id, [], photo=photo, on_sent=on_sent))
+
+    def send_document(self, chat_id: int, path: str, on_done: Callable[[], None] = None) -> None:
+        """Ставит в очередь файл. Файл должен существовать до вызова on_done, например, чтобы удалить его."""
+        self._put(Outgoing(chat_id, [], document=path, on_done=on_done))
+
+    def edit_text(self, chat_id: int, message_id: int, text: str, reply_markup=None) -> None:
+        self._put(Outgoing(chat_id, [text], reply_markup=reply_markup, edit_message_id=message_id))
+
+    def _put(self, message: Outgoing) -> None:
+        queue = self._pending.get(message.chat_id)
+        if queue is None:
+            self._pending[message.chat_id] = deque([message])
+            self._schedule(message.chat_id)
+            return
+        # Сливается только с последним в очереди, чтобы не менять порядок ответов
+        if message.coalesce is not None and queue and queue[-1].coalesce == message.coalesce:
+            if queue[-1].merge(message):
+                self.coalesced += 1
+                return
+        queue.append(message)
+
+    def start(self, bot: Bot) -> None:
+        self._bot = bot
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+            for chat_id in self._pending:
+                self._ready.put_nowait(chat_id)
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float) -> None:
+        """Дожидается отправки поставленных сообщений, но не дольше timeout секунд."""
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._pending:
+            logger.warning(f'Outbox stopped with {self.size} undelivered messages')
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _schedule(self, chat_id: int, delay: float = 0) -> None:
+        if self._ready is None:
+            return
+        if delay > 0:
+            asyncio.get_event_loop().call_later(delay, self._ready.put_nowait, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    async def _work(self) -> None:
+        while True:
+            chat_id = await self._ready.get()
+            try:
+                await self._deliver(chat_id)
+            except Exception:
+                logger.exception(f'Outbox failed to deliver to {chat_id}')
+
+    async def _deliver(self, chat_id: int) -> None:
+        queue = self._pending[chat_id]
+        bucket = self._chats.bucket(chat_id)
+        if not bucket.consume():
+            self._schedule(chat_id, bucket.delay())
+            return
+        while not self._bucket.consume():
+            await asyncio.sleep(self._bucket.delay())
+        #
+        message = queue.popleft()
+        delay = None
+        try:
+            delay = await self._send(message)
+        except asyncio.CancelledError:
+            queue.appendleft(message)
+            raise
+        except Exception:
+            logger.exception(f'Outbox failed to deliver to {chat_id}, message dropped')
+            self.failed += 1
+        finally:
+            # Чат планируется дальше при любом исходе, иначе следующие ответы в него никогда не уйдут
+            if delay is not None:
+                queue.appendleft(message)
+                self._schedule(chat_id, delay)
+            elif queue:
+                self._schedule(chat_id)
+            else:
+                del self._pending[chat_id]
+        if delay is None and message.on_done is not None:
+            message.on_done()
+
+    async def _send(self, message: Outgoing) -> Optional[float]:
+        """Отправляет сообщение. Возвращает паузу перед повтором или None, если повторять не нужно."""
+        try:
+            sent = await self._call(message)
+        except RetryAfter as e:
+            logger.warning(f'Flood control while sending to {message.chat_id}, retry in {e.timeout} s')
+            return e.timeout
+        except (NetworkError, asyncio.TimeoutError) as e:
+            message.attempts += 1
+            if message.attempts < settings.OUTBOX_MAX_ATTEMPTS:
+                logger.warning(f'Failed to send to {message.chat_id}, attempt {message.attempts}: {e!r}')
+                return settings.OUTBOX_RETRY_DELAY * 2 ** (message.attempts - 1)
+            logger.error(f'Giving up sending to {message.chat_id} after {message.attempts} attempts: {e!r}')
+            self.failed += 1
+            return None
+        except TelegramAPIError as e:
+            logger.error(f'Failed to send to {message.chat_id}: {e!r}')
+            self.failed += 1
+            return None
+        kind = message.coalesce.split(':', 1)[0] if message.coalesce else 'reply'
+        metrics.reply_delivery_seconds.observe(kind, time.monotonic() - message.enqueued)
+        if message.on_sent is not None:
+            await message.on_sent(sent)
+        return None
+
+    async def _call(self, message: Outgoing) -> types.Message:
+        bot, chat_id = self._bot, message.chat_id
+        if message.photo is not None:
+            photo = message.photo
+            if isinstance(photo, bytes):
+                photo = types.InputFile(io.BytesIO(photo), filename='photo.png')
+            return await bot.send_photo(chat_id, photo)
+        if message.document is not None:
+            with open(message.document, 'rb') as file:
+                document = types.InputFile(file, filename=os.path.basename(message.document))
+                return await bot.send_document(chat_id, document)
+        if message.edit_message_id is not None:
+            return await bot.edit_message_text(
+                message.text, chat_id, message.edit_message_id, reply_markup=message.reply_markup
+            )
+        parts = split_text(message.text)
+        sent = None
+        for number in range(message.sent_parts, len(parts)):
+            # Кнопки — только у последней части
+            markup = message.reply_markup if number == len(parts) - 1 else None
+            sent = await bot.send_message(chat_id, parts[number], reply_markup=markup)
+            message.sent_parts += 1
+        return sent
+
+
+outbox = Outbox(
+    rate=settings.OUTBOX_RATE, chat_rate=settings.OUTBOX_CHAT_RATE, chat_burst=settings.OUTBOX_CHAT_BURST,
+    workers=settings.OUTBOX_WORKERS,
+)
+
+
+async def on_startup(dp: Dispatcher) -> None:
+    outbox.start(dp.bot)
+
+
+async def on_shutdown(_: Dispatcher) -> None:
+    await outbox.stop(settings.OUTBOX_SHUTDOWN_TIMEOUT)
+
+
+metrics.registry.gauge('finance_bot_outbox_pending', 'Messages waiting in the outbox', lambda: outbox.size)
+metrics.registry.gauge('finance_bot_outbox_coalesced', 'Replies merged into a pending message', lambda: outbox.coalesced)
+metrics.registry.gauge('finance_bot_outbox_failed', 'Messages dropped after send errors', lambda: outbox.failed)
@@ -0,0 +1,105 @@
+"""
+Разбор сообщений о тратах.
+
+Каждая непустая строка сообщения — одна трата: [дата] сумма категория.
+Сумма — целая часть с необязательными разделителями тысяч (пробел) и дробная часть
+до двух знаков через запятую или точку: «1 500,50 такси», «99.9 кофе». Разбирается сразу в копейки,
+сумма больше MAX_AMOUNT отклоняется.
+Дата — «сегодня», «вчера», «позавчера» или ДД.ММ[.ГГГГ] в локальном времени пользователя,
+дата без года, которая еще не наступила, относится к прошлому году.
+"""
+import re
+from datetime import date, timedelta
+from typing import List, NamedTuple, Optional
+
+from core import exceptions
+from core.money import MAX_AMOUNT, MINOR_UNITS, format_amount
+
+_RELATIVE_DAYS = {'сегодня': 0, 'вчера': 1, 'позавчера': 2}
+_THOUSANDS_SEPARATORS = ' \u00a0\u202f'
+_MAX_INTEGER_DIGITS = len(str(MAX_AMOUNT // MINOR_UNITS))
+
+_DATE = r'(?:(?P<word>сегодня|вчера|позавчера)|(?P<day>[0-9]{1,2})\.(?P<month>[0-9]{1,2})(?:\.(?P<year>[0-9]{4}|[0-9]{2}))?)'
+_EXPENSE_RE = re.compile(
+    rf'(?:{_DATE}\s+)?'
+    r'(?P<integer>[0-9]{1,3}(?:[ \u00a0\u202f][0-9]{3})+|[0-9]+)(?:[.,](?P<fraction>[0-9]{1,2}))?'
+    r'\s+(?P<category>\S.*)',
+    re.IGNORECASE,
+)
+_SPACES_RE = re.compile(r'\s+')
+
+FORMAT_HELP = (
+    "Не могу понять сообщение. Напишите сообщение в формате, например:\n"
+    "1500 метро\n"
+    "вчера 300,50 кофе\n\n"
+    "Несколько трат — каждая с новой строки"
+)
+_TOO_LARGE = f"Сумма траты не может быть больше {format_amount(MAX_AMOUNT)}"
+
+
+class ParsedExpense(NamedTuple):
+    # В копейках
+    amount: int
+    category_text: str
+    # Локальная дата траты, None — сейчас
+    day: Optional[date] = None
+
+
+def parse_message(raw_message: str, today: date) -> List[ParsedExpense]:
+    """Разбирает все строки сообщения, today — текущая локальная дата пользователя."""
+    lines = [line for line in raw_message.splitlines() if line.strip()]
+    if not lines:
+        raise exceptions.NotCorrectMessage(FORMAT_HELP)
+    expenses = []
+    for number, line in enumerate(lines, start=1):
+        try:
+            expenses.append(parse_line(line, today))
+        except exceptions.NotCorrectMessage as e:
+            if len(lines) == 1:
+                raise
+            raise exceptions.NotCorrectMessage(f"Строка {number} «{line.strip()}»: {e}")
+    return expenses
+
+
+def parse_line(line: str, today: date) -> ParsedExpense:
+    m = _EXPENSE_RE.fullmatch(line.strip())
+    if m is None:
+        raise exceptions.NotCorrectMessage(FORMAT_HELP)
+    #
+    integer = m.group('integer')
+    for separator in _THOUSANDS_SEPARATORS:
+        integer = integer.replace(separator, '')
+    integer = integer.lstrip('0') or '0'
+    # Длинная строка цифр отклоняется еще до int(), который для нее медленный
+    if len(integer) > _MAX_INTEGER_DIGITS:
+        raise exceptions.NotCorrectMessage(_TOO_LARGE)
+    fraction = m.group('fraction') or ''
+    amount = int(integer) * MINOR_UNITS + int(fraction.ljust(2, '0'))
+    if amount > MAX_AMOUNT:
+        raise exceptions.NotCorrectMessage(_TOO_LARGE)
+    if amount <= 0:
+        raise exceptions.NotCorrectMessage("Сумма траты должна быть больше нуля")
+    #
+    category_text = _SPACES_RE.sub(' ', m.group('category').strip().lower())
+    return ParsedExpense(amount=amount, category_text=category_text, day=_parse_day(m, today))
+
+
+def _parse_day(m, today: date) -> Optional[date]:
+    if m.group('word'):
+        days = _RELATIVE_DAYS[m.group('word').lower()]
+        return today - timedelta(days=days) if days else None
+    if not m.group('day'):
+        return None
+    year = m.group('year')
+    try:
+        if year:
+            day = date(int(year) + (2000 if len(year) == 2 else 0), int(m.group('month')), int(m.group('day')))
+        else:
+            day = date(today.year, int(m.group('month')), int(m.group('day')))
+            if day > today:
+                day = day.replace(year=today.year - 1)
+    except ValueError:
+        raise exceptions.NotCorrectMessage(f"Некорректная дата {m.group(0).split()[0]}")
+    if day > today:
+        raise exceptions.NotCorrectMessage("Нельзя добавить трату на будущую дату")
+    return None if day == today else day
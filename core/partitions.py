@@ -0,0 +1,113 @@
+"""
+Обслуживание месячных партиций таблицы expense.
+
+Партиция — локальный месяц пользователя (DIFFERENCE_WITH_UTC), поэтому периоды /today и /month
+попадают в одну партицию. При смене DIFFERENCE_WITH_UTC границы старых партиций не меняются:
+запросы остаются верными, но могут задевать соседнюю партицию.
+Партиции создаются заранее на PARTITION_MONTHS_AHEAD месяцев вперед, чтобы новые траты не попадали
+в партицию по умолчанию. С PARTITION_RETENTION_MONTHS партиции старше этого числа месяцев отсоединяются
+и переносятся в схему PARTITION_ARCHIVE_SCHEMA: vacuum и бэкапы основной таблицы их больше не касаются.
+Месяцы отсоединенных партиций записываются в expense_archive. Их итоги остаются в роллапе,
+поэтому статистика за них не меняется, а `python -m core.rollup verify` и `rebuild` их дни пропускают.
+Планировщик запускает обслуживание раз в сутки.
+
+    python -m core.partitions maintain
+    python -m core.partitions list
+    python -m core.partitions explain --user-id 123456
+"""
+import argparse
+import asyncio
+from datetime import date
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from core import periods
+from core.db import async_session
+from core.logging_utils import logger
+from core.settings import settings
+from models import Expense
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+async def maintain(today: date = None) -> Tuple[List[str], List[str]]:
+    """Создает недостающие партиции и архивирует устаревшие. Возвращает имена созданных и отсоединенных."""
+    month = (today or periods.local_today()).replace(day=1)
+    created, archived = [], []
+    async with async_session() as db:
+        existing = set(await Expense.get_partitions(db=db))
+        for ahead in range(settings.PARTITION_MONTHS_AHEAD + 1):
+            partition_month = _add_months(month, ahead)
+            name = Expense.partition_name(partition_month)
+            if name in existing:
+                continue
+            moved = await Expense.create_partition(db=db, month=partition_month)
+            created.append(name)
+            logger.info(f'Created partition {name}, moved {moved} expenses from {Expense.DEFAULT_PARTITION}')
+        if settings.PARTITION_RETENTION_MONTHS:
+            oldest = Expense.partition_name(_add_months(month, -settings.PARTITION_RETENTION_MONTHS))
+            # Имена expense_yYYYYmMM сравниваются в порядке месяцев
+            for name in sorted(existing):
+                if name >= oldest:
+                    break
+                await Expense.detach_partition(db=db, name=name, schema=settings.PARTITION_ARCHIVE_SCHEMA)
+                archived.append(name)
+                logger.info(f'Detached partition {name} into schema {settings.PARTITION_ARCHIVE_SCHEMA}')
+    return created, archived
+
+
+async def list_partitions() -> List[str]:
+    async with async_session() as db:
+        return await Expense.get_partitions(db=db)
+
+
+async def maintain_job() -> None:
+    try:
+        await maintain()
+    except Exception:
+        logger.exception('Partition maintenance failed')
+
+
+async def explain(user_id: int) -> List[str]:
+    """
+    Планы запросов /today и /month: статистика бота (читает роллап) и те же суммы по самой expense,
+    в плане которых остаются только партиции периода.
+    """
+    lines = []
+    async with async_session() as db:
+        for name in ('today', 'month'):
+            period = periods.get_period(name)
+            for title, query in (
+                    ('statistics', Expense.statistics_query(user_id=user_id, start=period.start, end=period.end)),
+                    ('expense scan', Expense.raw_amounts_query(user_id=user_id, start=period.start, end=period.end)),
+            ):
+                compiled = query.compile(dialect=postgresql.dialect(paramstyle='named'))
+                plan = await db.execute(text(f'EXPLAIN {compiled}').bindparams(**compiled.params))
+                lines += [f'-- /{name} {title}'] + list(plan.scalars()) + ['']
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Maintain monthly partitions of the expense table')
+    parser.add_argument('command', choices=['maintain', 'list', 'explain'])
+    parser.add_argument('--user-id', type=int, help='Telegram user id for explain')
+    args = parser.parse_args()
+    loop = asyncio.get_event_loop()
+    if args.command == 'maintain':
+        created, archived = loop.run_until_complete(maintain())
+        logger.info(f'Partitions created: {len(created)}, archived: {len(archived)}')
+    elif args.command == 'list':
+        print('\n'.join(loop.run_until_complete(list_partitions())))
+    else:
+        if args.user_id is None:
+            parser.error('explain requires --user-id')
+        print('\n'.join(loop.run_until_complete(explain(args.user_id))))
+
+
+if __name__ == '__main__':
+    main()
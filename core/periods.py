@@ -0,0 +1,114 @@
+"""
+Периоды статистики. Границы считаются один раз по локальному дню пользователя
+(UTC + DIFFERENCE_WITH_UTC) и переводятся в полуинтервал [start, end) в UTC,
+в котором хранятся траты.
+"""
+from datetime import date, datetime, timedelta
+from typing import NamedTuple, Tuple
+
+from core import exceptions
+from core.settings import settings
+
+CUSTOM = 'r'
+# Код периода используется в командах /cat_<код><id>
+PERIODS = {
+    'today': 'd',
+    'week': 'w',
+    'month': 'm',
+    'prev_month': 'p',
+    'year': 'y',
+}
+NAMES_BY_CODE = {code: name for name, code in PERIODS.items()}
+
+
+class Period(NamedTuple):
+    code: str
+    title: str
+    # Полуинтервал [start, end) в UTC
+    start: datetime
+    end: datetime
+    # Количество прошедших дней периода для расчета бюджета
+    days: int
+
+
+def local_today() -> date:
+    return local_date(datetime.utcnow())
+
+
+def local_date(moment: datetime) -> date:
+    """Локальная дата пользователя для момента в UTC."""
+    return (moment + _utc_offset()).date()
+
+
+def get_period(name: str) -> Period:
+    """Возвращает период по имени: today, week, month, prev_month или year."""
+    today = local_today()
+    if name == 'week':
+        first_day = today - timedelta(days=today.weekday())
+        return _make_period('w', 'Расходы за текущую неделю', first_day, first_day + timedelta(days=7))
+    if name == 'month':
+        first_day = today.replace(day=1)
+        return _make_period('m', 'Расходы в текущем месяце', first_day, _next_month(first_day))
+    if name == 'prev_month':
+        last_day = today.replace(day=1)
+        first_day = (last_day - timedelta(days=1)).replace(day=1)
+        return _make_period('p', 'Расходы за прошлый месяц', first_day, last_day)
+    if name == 'year':
+        first_day = today.replace(month=1, day=1)
+        return _make_period('y', 'Расходы за текущий год', first_day, first_day.replace(year=first_day.year + 1))
+    return _make_period('d', 'Расходы за сегодня', today, today + timedelta(days=1))
+
+
+def get_day(day: date) -> Period:
+    """Период за один локальный день, например вчерашний для ежедневной сводки."""
+    return _make_period(CUSTOM, f'Расходы за {day:%d.%m.%Y}', day, day + timedelta(days=1))
+
+
+def get_month(day: date) -> Period:
+    """Период за календарный месяц, в который попадает day."""
+    first_day = day.replace(day=1)
+    return _make_period(CUSTOM, f'Расходы за {first_day:%m.%Y}', first_day, _next_month(first_day))
+
+
+def local_days(period: Period) -> Tuple[date, date]:
+    """Локальные дни [first_day, last_day) периода."""
+    offset = _utc_offset()
+    return (period.start + offset).date(), (period.end + offset).date()
+
+
+def get_period_by_code(code: str) -> Period:
+    if code not in NAMES_BY_CODE:
+        raise exceptions.NotCorrectMessage(f"Неизвестный период '{code}'")
+    return get_period(NAMES_BY_CODE[code])
+
+
+def parse_range(text: str) -> Period:
+    """Разбирает произвольный период вида 2023-01-01..2023-03-31, обе даты включительно."""
+    try:
+        first, last = (date.fromisoformat(part.strip()) for part in text.split('..'))
+    except ValueError:
+        raise exceptions.NotCorrectMessage(
+            "Не могу понять период. Укажите даты в формате, например:\n/stats 2023-01-01..2023-03-31")
+    if first > last:
+        first, last = last, first
+    return _make_period(
+        CUSTOM, f'Расходы с {first:%d.%m.%Y} по {last:%d.%m.%Y}', first, last + timedelta(days=1)
+    )
+
+
+def _make_period(code: str, title: str, first_day: date, last_day: date) -> Period:
+    """Период по локальным дням [first_day, last_day)."""
+    offset = _utc_offset()
+    start = datetime.combine(first_day, datetime.min.time()) - offset
+    end = datetime.combine(last_day, datetime.min.time()) - offset
+    today = local_today()
+    days = (min(today + timedelta(days=1), last_day) - first_day).days
+    return Period(code=code, title=title, start=start, end=end, days=max(days, 0))
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _utc_offset() -> timedelta:
+    return timedelta(hours=settings.DIFFERENCE_WITH_UTC)
@@ -0,0 +1,169 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import asyncpg
+from aiogram import Dispatcher
+
+from core import exceptions, metrics
+from core.db import async_session
+from core.logging_utils import logger
+from core.settings import settings
+from models import Category
+
+LISTEN_MAX_BACKOFF = 30
+
+class CategoryItem(NamedTuple):
+    id: int
+    name: str
+    aliases: Tuple[str, ...]
+
+
+class CategoriesSnapshot(NamedTuple):
+    categories: List[CategoryItem]
+    ids_by_name: Dict[str, int]
+
+
+class CategoryResolver:
+    """
+    Кэш категорий и их алиасов в памяти процесса, отдельный снимок на каждого пользователя.
+    Снимок загружается одним запросом и обновляется по TTL или после явной инвалидации:
+    listen() сбрасывает снимок пользователя по уведомлению триггеров category и aliases.
+    Пользователь без категорий (добавленный в ACCESS_IDS после миграции мультитенантности) при первой
+    загрузке получает копию категорий, алиасов и бюджета первого пользователя из ACCESS_IDS.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        # Снимок из кэша / загрузка из БД / имя, которого нет среди категорий и алиасов
+        self.hits = 0
+        self.misses = 0
+        self.unknown = 0
+        self._snapshots: Dict[int, Tuple[float, CategoriesSnapshot]] = {}
+        self._locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._listener: Optional[asyncio.Task] = None
+        # Снимок, загрузка которого началась до инвалидации, отдается, но не кэшируется
+        self._invalidations = 0
+
+    def invalidate(self, user_id: int = None) -> None:
+        self._invalidations += 1
+        if user_id is None:
+            self._snapshots.clear()
+            self._prune_locks()
+        else:
+            self._snapshots.pop(user_id, None)
+
+    async def snapshot(self, user_id: int) -> CategoriesSnapshot:
+        snapshot = self._fresh(user_id)
+        if snapshot is None:
+            async with self._locks[user_id]:
+                snapshot = self._fresh(user_id) or await self._load(user_id)
+        return snapshot
+
+    async def get_category_id(self, user_id: int, category_name: str) -> int:
+        snapshot = await self.snapshot(user_id)
+        category_id = snapshot.ids_by_name.get(category_name.lower())
+        if category_id is None:
+            self.unknown += 1
+            raise exceptions.NotCorrectMessage(f"Категории с именем '{category_name}' не существует")
+        return category_id
+
+    async def get_categories(self, user_id: int) -> List[CategoryItem]:
+        snapshot = await self.snapshot(user_id)
+        return snapshot.categories
+
+    def _fresh(self, user_id: int) -> Optional[CategoriesSnapshot]:
+        item = self._snapshots.get(user_id)
+        if item is None or time.monotonic() - item[0] > self.ttl:
+            return None
+        self.hits += 1
+        return item[1]
+
+    async def listen(self) -> None:
+        """
+        Держит отдельное соединение с LISTEN на канал Category.CHANGED_CHANNEL.
+        После каждого подключения сбрасываются все снимки: уведомления за время разрыва потеряны.
+        """
+        pg = settings.POSTGRES_CONFIG
+        delay = 1
+        while True:
+            try:
+                connection = await asyncpg.connect(
+                    user=pg.USER, password=pg.PASS, host=pg.HOST, port=pg.PORT, database=pg.DB
+                )
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError):
+                logger.exception(f'Failed to listen for category changes, retry in {delay} s')
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, LISTEN_MAX_BACKOFF)
+                continue
+            delay = 1
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            try:
+                await connection.add_listener(Category.CHANGED_CHANNEL, self._on_changed)
+                self.invalidate()
+                await closed.wait()
+                logger.warning('Connection listening for category changes is lost, reconnecting')
+            finally:
+                await connection.close()
+
+    async def on_startup(self, _: Dispatcher) -> None:
+        self._listener = asyncio.create_task(self.listen())
+
+    async def on_shutdown(self, _: Dispatcher) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    def _prune_locks(self) -> None:
+        # Занятый замок остается, иначе вторая загрузка пошла бы параллельно с первой
+        self._locks = defaultdict(asyncio.Lock, {
+            k: lock for k, lock in self._locks.items() if k in self._snapshots or lock.locked()
+        })
+
+    def _on_changed(self, connection, pid: int, channel: str, payload: str) -> None:
+        self.invalidate(int(payload))
+
+    async def _load(self, user_id: int) -> CategoriesSnapshot:
+        self.misses += 1
+        invalidations = self._invalidations
+        async with async_session() as db:
+            rows = await Category.get_names(db=db, user_id=user_id)
+            template_user_id = int(settings.ACCESS_IDS[0]) if settings.ACCESS_IDS else None
+            if not rows and template_user_id not in (None, user_id):
+                copied = await Category.copy_from(db=db, user_id=user_id, template_user_id=template_user_id)
+                if copied:
+                    logger.info(f'Categories of {template_user_id} copied to {user_id}: {copied} categories')
+                    rows = await Category.get_names(db=db, user_id=user_id)
+        #
+        categories: Dict[int, CategoryItem] = {}
+        ids_by_name: Dict[str, int] = {}
+        for category_id, category_name, alias_name in rows:
+            if category_id not in categories:
+                categories[category_id] = CategoryItem(id=category_id, name=category_name, aliases=())
+                ids_by_name[category_name.lower()] = category_id
+            if alias_name is not None:
+                c = categories[category_id]
+                categories[category_id] = c._replace(aliases=c.aliases + (alias_name,))
+                ids_by_name.setdefault(alias_name.lower(), category_id)
+        #
+        now = time.monotonic()
+        self._snapshots = {k: v for k, v in self._snapshots.items() if now - v[0] <= self.ttl}
+        snapshot = CategoriesSnapshot(categories=list(categories.values()), ids_by_name=ids_by_name)
+        if invalidations == self._invalidations:
+            self._snapshots[user_id] = (now, snapshot)
+        self._prune_locks()
+        logger.debug(
+            f'Categories cache reloaded for {user_id}: {len(categories)} categories, {len(ids_by_name)} names, '
+            f'hits={self.hits} misses={self.misses} unknown={self.unknown}'
+        )
+        return snapshot
+
+
+resolver = CategoryResolver(ttl=settings.CATEGORIES_CACHE_TTL)
+metrics.registry.gauge('finance_bot_categories_cache_hits', 'Category resolver cache hits', lambda: resolver.hits)
+metrics.registry.gauge('finance_bot_categories_cache_misses', 'Category resolver cache reloads', lambda: resolver.misses)
+metrics.registry.gauge(
+    'finance_bot_categories_unknown_names', 'Names matching no category or alias', lambda: resolver.unknown
+)
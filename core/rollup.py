@@ -0,0 +1,47 @@
+"""
+Проверка и пересборка роллапа daily_category_totals.
+Дни месяцев, партиции которых отсоединены в архив (expense_archive), не проверяются и не пересчитываются.
+
+    python -m core.rollup verify
+    python -m core.rollup rebuild
+"""
+import argparse
+import asyncio
+
+from core.db import async_session
+from core.logging_utils import logger
+from models import DailyCategoryTotal
+
+
+async def verify() -> int:
+    """Логирует расхождения роллапа с таблицей expense и возвращает их количество."""
+    async with async_session() as db:
+        drift = await DailyCategoryTotal.get_drift(db=db)
+    for row in drift:
+        logger.warning(
+            f'Rollup drift {row.day} category={row.category_id}: '
+            f'expected {row.expected_amount} ({row.expected_count}), stored {row.amount} ({row.count})'
+        )
+    logger.info(f'Rollup verified, {len(drift)} drifted rows')
+    return len(drift)
+
+
+async def rebuild() -> None:
+    """Пересчитывает роллап по таблице expense."""
+    async with async_session() as db:
+        await DailyCategoryTotal.rebuild(db=db)
+    logger.info('Rollup rebuilt')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Maintain daily_category_totals rollup')
+    parser.add_argument('command', choices=['verify', 'rebuild'])
+    args = parser.parse_args()
+    if args.command == 'verify':
+        drifted = asyncio.get_event_loop().run_until_complete(verify())
+        raise SystemExit(1 if drifted else 0)
+    asyncio.get_event_loop().run_until_complete(rebuild())
+
+
+if __name__ == '__main__':
+    main()
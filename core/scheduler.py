@@ -0,0 +1,71 @@
+"""
+Планировщик: в локальную полночь (UTC + DIFFERENCE_WITH_UTC) закрывает прошедший день.
+
+Сводки за вчера и первого числа за прошлый месяц считаются один раз. Дни роллапа локальные,
+поэтому закрытые сутки в нем уже посчитаны целиком. Результаты попадают в кэш статистики
+вместе с текущими днем и месяцем, и первые /today и /month после полуночи не агрегируют заново.
+Сводка рассылается всем пользователям из ACCESS_IDS через очередь исходящих сообщений, которая
+соблюдает лимиты Telegram. Одновременно готовится не больше DIGEST_CONCURRENCY сводок.
+Раз в сутки, через полчаса после закрытия дня, обслуживаются партиции таблицы expense.
+"""
+import asyncio
+from datetime import timedelta
+from typing import List
+
+from aiogram import Dispatcher
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from core import expenses, partitions, periods
+from core.logging_utils import logger
+from core.outbox import outbox
+from core.settings import settings
+
+
+async def close_day() -> None:
+    """Считает сводки за закрывшиеся день и месяц и рассылает их."""
+    today = periods.local_today()
+    yesterday = today - timedelta(days=1)
+    closed = [periods.get_day(yesterday)]
+    if today.day == 1:
+        closed.append(periods.get_month(yesterday))
+    #
+    semaphore = asyncio.Semaphore(settings.DIGEST_CONCURRENCY)
+    users = [int(access_id) for access_id in settings.ACCESS_IDS]
+    queued = await asyncio.gather(*(_send_digest(user_id, closed, semaphore) for user_id in users))
+    logger.info(f'Digest for {yesterday} queued for {sum(queued)} of {len(users)} users')
+
+
+async def _send_digest(user_id: int, closed: List[periods.Period], semaphore: asyncio.Semaphore) -> bool:
+    async with semaphore:
+        try:
+            text = "\n\n".join([await expenses.get_statistics(user_id, period) for period in closed])
+            for name in ('today', 'month'):
+                await expenses.warm_statistics(user_id, periods.get_period(name))
+        except Exception:
+            logger.exception(f'Failed to prepare digest for {user_id}')
+            return False
+    outbox.send(user_id, summary=text, coalesce='digest')
+    return True
+
+
+def start_scheduler() -> AsyncIOScheduler:
+    scheduler = AsyncIOScheduler(timezone='UTC')
+    # Локальная полночь в UTC
+    hour = -int(settings.DIFFERENCE_WITH_UTC) % 24
+    if settings.DIGEST_ENABLED:
+        scheduler.add_job(
+            close_day, CronTrigger(hour=hour, minute=0, timezone='UTC'),
+            id='close_day', coalesce=True, misfire_grace_time=3600,
+        )
+    scheduler.add_job(
+        partitions.maintain_job, CronTrigger(hour=hour, minute=30, timezone='UTC'),
+        id='maintain_partitions', coalesce=True, misfire_grace_time=3600,
+    )
+    scheduler.start()
+    logger.info(f'Scheduler started, day closes at {hour:02d}:00 UTC')
+    return scheduler
+
+
+async def on_startup(_: Dispatcher) -> None:
+    start_scheduler()
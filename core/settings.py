@@ -11,6 +11,15 @@ class PostgresConfig(BaseSettings):
     PORT: int
     URL: str = None
 
+    POOL_SIZE: int = 10
+    MAX_OVERFLOW: int = 5
+    POOL_TIMEOUT: int = 10
+    POOL_RECYCLE: int = 1800
+    POOL_PRE_PING: bool = True
+    STATEMENT_CACHE_SIZE: int = 500
+    # Интервал вывода статистики пула в лог, 0 — не выводить
+    POOL_STATS_INTERVAL: int = 300
+
     @validator('URL', pre=True)
     def url(cls, _, values):
         return PostgresDsn.build(
@@ -32,13 +41,94 @@ class Settings(BaseSettings):
 
     API_TOKEN: str
     ACCESS_IDS: List[str]
+    # Ограничение частоты сообщений от пользователя: токенов в секунду и размер корзины, 0 — без ограничения.
+    # Корзина должна вмещать пачку пересланных чеков, иначе часть трат придется отправлять заново
+    RATE_LIMIT_RATE: float = 0
+    RATE_LIMIT_BURST: int = 30
 
     DIFFERENCE_WITH_UTC: int
 
     CURRENCY: str
 
+    CATEGORIES_CACHE_TTL: int = 300
+    CATEGORY_PAGE_SIZE: int = 20
+
+    STATS_CACHE_SIZE: int = 1024
+    STATS_CACHE_TTL: int = 86400
+    # Redis для кэша статистики, общего между процессами; по умолчанию кэш в памяти процесса
+    STATS_CACHE_REDIS_URL: str = None
+
+    # Отложенная запись трат: траты всех сообщений за WRITE_BUFFER_DELAY секунд пишутся одним INSERT
+    WRITE_BUFFER_ENABLED: bool = False
+    WRITE_BUFFER_DELAY: float = 0.005
+    WRITE_BUFFER_MAX_ROWS: int = 500
+
+    # Месячные партиции expense: сколько месяцев создавать заранее и через сколько месяцев отсоединять
+    # старые в архивную схему, 0 — не отсоединять
+    PARTITION_MONTHS_AHEAD: int = 3
+    PARTITION_RETENTION_MONTHS: int = 0
+    PARTITION_ARCHIVE_SCHEMA: str = 'archive'
+
+    IMPORT_CHUNK_SIZE: int = 5000
+    EXPORT_CHUNK_SIZE: int = 5000
+
+    # Режим вебхука включается, если задан публичный адрес WEBHOOK_HOST, иначе long polling
+    WEBHOOK_HOST: str = None
+    WEBHOOK_PATH: str = '/webhook'
+    WEBHOOK_SECRET: str = None
+    WEBAPP_HOST: str = '0.0.0.0'
+    WEBAPP_PORT: int = 8300
+
+    # Общая очередь апдейтов в Postgres: вебхук или long polling только кладут апдейты в очередь,
+    # обрабатывают их процессы `python server.py worker`, сколько угодно штук
+    UPDATE_QUEUE_ENABLED: bool = False
+    WORKER_BATCH_SIZE: int = 50
+    WORKER_POLL_INTERVAL: float = 0.2
+    # Время в секундах, на которое воркер забирает апдейт; после него апдейт достанется другому воркеру
+    WORKER_LEASE: int = 60
+    WORKER_MAX_ATTEMPTS: int = 3
+    WORKER_RETRY_DELAY: int = 5
+    # Сколько секунд хранить обработанные апдейты для отсева повторных доставок
+    WORKER_RETENTION: int = 86400
+
+    # Сводка за прошедший день (первого числа — и за прошлый месяц) в локальную полночь
+    DIGEST_ENABLED: bool = True
+    DIGEST_CONCURRENCY: int = 5
+
+    # Очередь исходящих сообщений: сообщений в секунду на бота в каждом процессе (общий лимит Telegram —
+    # около 30) и на чат (около 1), число одновременных отправок
+    OUTBOX_RATE: float = 25
+    OUTBOX_CHAT_RATE: float = 1
+    OUTBOX_CHAT_BURST: int = 3
+    OUTBOX_WORKERS: int = 8
+    # Повторы при сетевых ошибках, пауза удваивается с каждой попыткой
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    OUTBOX_RETRY_DELAY: float = 1
+    # Сколько секунд при остановке ждать отправки поставленных в очередь сообщений
+    OUTBOX_SHUTDOWN_TIMEOUT: int = 10
+
+    # Процессы для отрисовки графиков /chart и число запомненных file_id готовых картинок
+    CHART_WORKERS: int = 2
+    CHART_CACHE_SIZE: int = 1024
+
+    PROFILING_ENABLED: bool = True
+    # Апдейты дольше порога логируются со списком SQL-запросов, 0 — не логировать
+    PROFILING_SLOW_UPDATE_MS: int = 0
+    # Интервал вывода сводки метрик в лог, 0 — не выводить
+    METRICS_LOG_INTERVAL: int = 0
+    # Внутренний адрес /metrics, отдельный от порта вебхука и не публикуемый наружу; 0 — не поднимать
+    METRICS_HOST: str = '127.0.0.1'
+    METRICS_PORT: int = 9300
+
     POSTGRES_CONFIG: PostgresConfig = PostgresConfig()
 
+    @validator('WEBHOOK_SECRET', always=True)
+    def webhook_secret(cls, secret, values):
+        # Без секрета вебхук принял бы апдейты от любого, кто знает адрес
+        if values.get('WEBHOOK_HOST') and not secret:
+            raise ValueError('WEBHOOK_SECRET is required when WEBHOOK_HOST is set')
+        return secret
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,57 @@
+import time
+from typing import Dict, Hashable
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity накопленных."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, tokens: float = 1) -> bool:
+        """Забирает токены, если они есть. Возвращает False, если запрос нужно отбросить."""
+        self._refill(time.monotonic())
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+    def delay(self, tokens: float = 1) -> float:
+        """Сколько секунд ждать, пока накопится нужное количество токенов."""
+        self._refill(time.monotonic())
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    @property
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """Отдельная корзина токенов на каждый ключ. Простаивающие корзины удаляются при росте словаря."""
+
+    def __init__(self, rate: float, capacity: float, max_keys: int = 10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+
+    def allow(self, key: Hashable) -> bool:
+        return self.bucket(key).consume()
+
+    def bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._buckets = {k: b for k, b in self._buckets.items() if not b.idle}
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+        return bucket
@@ -0,0 +1,68 @@
+import hmac
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.webhook import WebhookRequestHandler
+from aiogram.utils.executor import Executor
+from aiohttp import web
+
+from core import worker
+from core.logging_utils import logger
+from core.settings import settings
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class SecretTokenRequestHandler(WebhookRequestHandler):
+    """
+    Принимает апдейты только с секретным токеном, заданным при регистрации вебхука.
+    Без WEBHOOK_SECRET режим вебхука не запускается, а обработчик не принимает ничего.
+    """
+
+    def validate_ip(self):
+        super().validate_ip()
+        token = self.request.headers.get(SECRET_TOKEN_HEADER, '')
+        if not settings.WEBHOOK_SECRET or not hmac.compare_digest(token, settings.WEBHOOK_SECRET):
+            logger.warning(f'Blocking webhook request with wrong secret token from {self.request.remote}')
+            raise web.HTTPUnauthorized()
+
+
+class QueueRequestHandler(SecretTokenRequestHandler):
+    """
+    Не обрабатывает апдейт сам, а кладет его в очередь воркеров и сразу отвечает Telegram.
+    Чужие апдейты и флуд в очередь не попадают. Если БД недоступна, Telegram получает ошибку
+    и доставит апдейт повторно.
+    """
+
+    async def process_update(self, update):
+        if worker.admit(self.get_dispatcher(), [update]):
+            await worker.enqueue([update.to_python()])
+
+
+async def on_startup(dp: Dispatcher):
+    url = f'{settings.WEBHOOK_HOST.rstrip("/")}{settings.WEBHOOK_PATH}'
+    await dp.bot.set_webhook(url, secret_token=settings.WEBHOOK_SECRET)
+    logger.info(f'Webhook set to {url}')
+
+
+def request_handler() -> type:
+    """Обработчик вебхука для текущего режима: с очередью воркеров или с обработкой на месте."""
+    return QueueRequestHandler if settings.UPDATE_QUEUE_ENABLED else SecretTokenRequestHandler
+
+
+def make_executor(dp: Dispatcher, on_startup_callbacks: list = (), on_shutdown_callbacks: list = ()) -> Executor:
+    """
+    Исполнитель в режиме вебхука. Вебхук не удаляется при остановке,
+    чтобы Telegram копил апдейты на время перезапуска.
+    """
+    executor = Executor(dp, skip_updates=False)
+    executor.on_startup(on_startup, polling=False, webhook=True)
+    for callback in on_startup_callbacks:
+        executor.on_startup(callback, polling=False, webhook=True)
+    for callback in on_shutdown_callbacks:
+        executor.on_shutdown(callback, polling=False, webhook=True)
+    executor.set_webhook(webhook_path=settings.WEBHOOK_PATH, request_handler=request_handler())
+    return executor
+
+
+def start_webhook(dp: Dispatcher, on_startup_callbacks: list = (), on_shutdown_callbacks: list = ()) -> None:
+    make_executor(dp, on_startup_callbacks, on_shutdown_callbacks).run_app(host=settings.WEBAPP_HOST, port=settings.WEBAPP_PORT)
@@ -0,0 +1,206 @@
+"""
+Режим воркеров: апдейты Telegram проходят через общую очередь в Postgres (таблица update_queue).
+
+Прием апдейтов (вебхук или long polling) только кладет их в очередь. update_id — ключ
+идемпотентности: повторная доставка того же апдейта в очередь отбрасывается.
+Воркеров может быть сколько угодно, в процессах или контейнерах. Каждый забирает апдейты
+через FOR UPDATE SKIP LOCKED. У пользователя в работе не больше одного апдейта, и они идут
+строго по порядку update_id, поэтому /del не обгонит добавление траты, на которую ссылается.
+
+Апдейт обрабатывается как минимум один раз. Если воркер упал до отметки об обработке,
+апдейт через WORKER_LEASE секунд заберет другой воркер. Чужие апдейты и флуд отсекает
+AccessMiddleware еще при приеме, до записи в очередь. Пока БД недоступна, прием и воркеры
+повторяют попытки с растущей паузой.
+
+    python server.py worker
+"""
+import asyncio
+import signal
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.utils.exceptions import TelegramAPIError
+
+from core.db import async_session
+from core.exceptions import GetFromDatabaseException
+from core.logging_utils import logger
+from core.middlewares import AccessMiddleware
+from core.settings import settings
+from models import QueuedUpdate
+
+PURGE_INTERVAL = 600
+MAX_BACKOFF = 30
+# Отказ соединения asyncpg приходит в обход обработки ошибок моделей
+DB_ERRORS = (GetFromDatabaseException, OSError, asyncio.TimeoutError)
+
+
+def update_user_id(payload: dict) -> int:
+    """Пользователь, от которого пришел апдейт, 0 — если апдейт не от пользователя."""
+    for value in payload.values():
+        if isinstance(value, dict):
+            if 'from' in value:
+                return value['from']['id']
+            if 'chat' in value:
+                return value['chat']['id']
+    return 0
+
+
+def admit(dp: Dispatcher, updates: List[types.Update]) -> List[types.Update]:
+    """Апдейты, которые пропускает AccessMiddleware диспетчера."""
+    for middleware in dp.middleware.applications:
+        if isinstance(middleware, AccessMiddleware):
+            return [u for u in updates if middleware.admit(u)]
+    return updates
+
+
+def backoff(delay: float) -> float:
+    """Следующая пауза перед повтором после ошибки БД."""
+    return min(delay * 2, MAX_BACKOFF)
+
+
+async def enqueue(updates: List[dict]) -> int:
+    """Кладет апдейты в очередь воркеров, возвращает число новых."""
+    async with async_session() as db:
+        return await QueuedUpdate.enqueue(db, [(u['update_id'], update_user_id(u), u) for u in updates])
+
+
+async def poll_updates(dp: Dispatcher, timeout: int = 20) -> None:
+    """Прием апдейтов long polling'ом: offset сдвигается только после записи апдейтов в очередь."""
+    offset = None
+    delay = 1
+    while True:
+        try:
+            updates = await dp.bot.get_updates(offset=offset, timeout=timeout)
+        except TelegramAPIError:
+            logger.exception('Failed to get updates')
+            await asyncio.sleep(1)
+            continue
+        if not updates:
+            continue
+        # Проверка доступа уже ответила отброшенным, при ошибке БД они не проверяются повторно
+        admitted = admit(dp, updates)
+        while True:
+            try:
+                added = await enqueue([u.to_python() for u in admitted]) if admitted else 0
+            except DB_ERRORS:
+                logger.exception(f'Failed to enqueue updates, retry in {delay} s')
+                await asyncio.sleep(delay)
+                delay = backoff(delay)
+                continue
+            break
+        delay = 1
+        offset = updates[-1].update_id + 1
+        logger.debug(f'Enqueued {added} of {len(updates)} updates')
+
+
+class Worker:
+    """Обрабатывает апдейты из очереди через диспетчер, держа в работе до batch_size апдейтов."""
+
+    def __init__(self, dp: Dispatcher, batch_size: int = None):
+        self.dp = dp
+        self.batch_size = batch_size or settings.WORKER_BATCH_SIZE
+        self.processed = 0
+        self._stopped = False
+        self._purged_at = 0.0
+
+    def stop(self) -> None:
+        """Перестает забирать новые апдейты, взятые в работу дорабатываются."""
+        self._stopped = True
+
+    async def run(self, until_empty: bool = False) -> None:
+        Dispatcher.set_current(self.dp)
+        Bot.set_current(self.dp.bot)
+        inflight = set()
+        delay = 1
+        while not self._stopped:
+            try:
+                if len(inflight) < self.batch_size:
+                    async with async_session() as db:
+                        rows = await QueuedUpdate.claim(
+                            db, limit=self.batch_size - len(inflight), lease=settings.WORKER_LEASE
+                        )
+                    inflight.update(asyncio.ensure_future(self._process(row)) for row in rows)
+                if not inflight:
+                    if until_empty:
+                        async with async_session() as db:
+                            if not await QueuedUpdate.pending_count(db):
+                                break
+                    await self._purge()
+                delay = 1
+            except DB_ERRORS:
+                # Взятые апдейты дорабатываются, новые забираются после паузы
+                logger.exception(f'Update queue is unavailable, retry in {delay} s')
+                if inflight:
+                    _, inflight = await asyncio.wait(inflight, timeout=delay)
+                else:
+                    await asyncio.sleep(delay)
+                delay = backoff(delay)
+                continue
+            if inflight:
+                _, inflight = await asyncio.wait(
+                    inflight, timeout=settings.WORKER_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+                )
+                continue
+            await asyncio.sleep(settings.WORKER_POLL_INTERVAL)
+        if inflight:
+            await asyncio.wait(inflight)
+
+    async def _process(self, row) -> None:
+        error = None
+        try:
+            await self.dp.process_update(types.Update.to_object(row.payload))
+        except Exception as e:
+            logger.exception(f'Update {row.update_id} failed, attempt {row.attempts}')
+            error = e
+        try:
+            async with async_session() as db:
+                if error is None:
+                    await QueuedUpdate.complete(db, row.update_id)
+                elif row.attempts >= settings.WORKER_MAX_ATTEMPTS:
+                    await QueuedUpdate.complete(db, row.update_id, error=repr(error))
+                else:
+                    await QueuedUpdate.retry(db, row.update_id, delay=settings.WORKER_RETRY_DELAY, error=repr(error))
+        except DB_ERRORS:
+            # Апдейт остается взятым и вернется в работу после WORKER_LEASE
+            logger.exception(f'Failed to mark update {row.update_id} as processed')
+            return
+        if error is None:
+            self.processed += 1
+
+    async def _purge(self) -> None:
+        if time.monotonic() - self._purged_at < PURGE_INTERVAL:
+            return
+        self._purged_at = time.monotonic()
+        async with async_session() as db:
+            purged = await QueuedUpdate.purge(db, datetime.utcnow() - timedelta(seconds=settings.WORKER_RETENTION))
+        if purged:
+            logger.debug(f'Purged {purged} processed updates')
+
+
+def _run(dp: Dispatcher, main, on_startup_callbacks: list, on_shutdown_callbacks: list) -> None:
+    loop = asyncio.get_event_loop()
+    for callback in on_startup_callbacks:
+        loop.run_until_complete(callback(dp))
+    try:
+        loop.run_until_complete(main)
+    finally:
+        for callback in on_shutdown_callbacks:
+            loop.run_until_complete(callback(dp))
+
+
+def start_worker(dp: Dispatcher, on_startup_callbacks: list = (), on_shutdown_callbacks: list = ()) -> None:
+    """Запускает воркер очереди апдейтов, SIGTERM дожидается обработки взятых апдейтов."""
+    worker = Worker(dp)
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    logger.info('Start update queue worker')
+    _run(dp, worker.run(), on_startup_callbacks, on_shutdown_callbacks)
+
+
+def start_ingress(dp: Dispatcher, on_startup_callbacks: list = (), on_shutdown_callbacks: list = ()) -> None:
+    """Запускает прием апдейтов long polling'ом в очередь воркеров."""
+    logger.info('Start long polling into update queue')
+    _run(dp, poll_updates(dp), on_startup_callbacks, on_shutdown_callbacks)
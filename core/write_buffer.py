@@ -0,0 +1,103 @@
+"""
+Отложенная запись трат (write-behind), включается WRITE_BUFFER_ENABLED.
+
+Траты не пишутся каждая своей транзакцией: они копятся в буфере процесса до WRITE_BUFFER_DELAY секунд
+или до WRITE_BUFFER_MAX_ROWS строк и записываются одним INSERT для всех сообщений всех пользователей,
+пришедших за это время. Хендлер ждет коммита своей порции, поэтому ответ уходит только после записи.
+Если общий INSERT не прошел (например, категорию удалили), порции пишутся по отдельности,
+и ошибку получает только хендлер с неподходящей порцией.
+
+Дубли отсекает ключ идемпотентности трат в БД: повторно доставленное сообщение получает
+None вместо id у уже записанных трат. При остановке процесса буфер записывается сразу.
+"""
+import asyncio
+from typing import List, Optional, Set, Tuple
+
+from aiogram import Dispatcher
+from sqlalchemy.exc import SQLAlchemyError
+
+from core import metrics
+from core.db import async_session
+from core.logging_utils import logger
+from core.settings import settings
+from models import Expense
+
+Batch = List[Tuple[List[dict], asyncio.Future]]
+
+
+class WriteBuffer:
+    def __init__(self, delay: float, max_rows: int):
+        self.delay = delay
+        self.max_rows = max_rows
+        self.flushes = 0
+        self.written = 0
+        self._pending: Batch = []
+        self._size = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._writes: Set[asyncio.Future] = set()
+
+    async def add(self, expenses: List[dict]) -> List[Optional[int]]:
+        """
+        Ставит траты (словари колонок expense с user_id и idempotency_key) в ближайшую запись и ждет ее.
+        Возвращает id трат в том же порядке, None — трата с таким ключом уже была записана.
+        """
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append((expenses, future))
+        self._size += len(expenses)
+        if self._size >= self.max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_event_loop().call_later(self.delay, self._flush)
+        # Запись не отменяется вместе с хендлером: остальные траты порции от нее зависят
+        return await asyncio.shield(future)
+
+    async def flush(self) -> None:
+        """Записывает накопленные траты и дожидается всех начатых записей."""
+        self._flush()
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending, self._size = self._pending, [], 0
+        write = asyncio.ensure_future(self._write(batch))
+        self._writes.add(write)
+        write.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch: Batch) -> None:
+        try:
+            async with async_session() as db:
+                rows = await Expense.create_many(db=db, expenses=[e for expenses, _ in batch for e in expenses])
+        except SQLAlchemyError as ex:
+            if len(batch) > 1:
+                logger.warning(f'Batched insert of {len(batch)} messages failed, writing them one by one :: {ex}')
+                for item in batch:
+                    await self._write([item])
+                return
+            batch[0][1].set_exception(ex)
+            return
+        except Exception as ex:
+            for _, future in batch:
+                future.set_exception(ex)
+            return
+        self.flushes += 1
+        self.written += len(rows)
+        ids = {(r.user_id, r.idempotency_key): r.id for r in rows}
+        for expenses, future in batch:
+            # pop: если ключ повторился внутри одной записи, id получит только первая трата
+            future.set_result([ids.pop((e['user_id'], e['idempotency_key']), None) for e in expenses])
+
+
+write_buffer = WriteBuffer(delay=settings.WRITE_BUFFER_DELAY, max_rows=settings.WRITE_BUFFER_MAX_ROWS)
+
+
+async def on_shutdown(_: Dispatcher) -> None:
+    await write_buffer.flush()
+
+
+metrics.registry.gauge('finance_bot_write_buffer_flushes', 'Batched expense inserts committed', lambda: write_buffer.flushes)
+metrics.registry.gauge('finance_bot_write_buffer_rows', 'Expenses written through the buffer', lambda: write_buffer.written)
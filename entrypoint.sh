@@ -2,8 +2,10 @@
 
 set -e
 
-echo Running migrations
-alembic upgrade head
+if [ "$1" != "worker" ]; then
+  echo Running migrations
+  alembic upgrade head
+fi
 
 echo Running app
-python3 server.py
+python3 server.py "$@"
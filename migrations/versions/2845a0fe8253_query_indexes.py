@@ -0,0 +1,32 @@
+"""query indexes
+
+Revision ID: 2845a0fe8253
+Revises: a7d3eace6b23
+Create Date: 2026-10-18 10:12:31.404215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2845a0fe8253'
+down_revision = 'a7d3eace6b23'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_expense_created', 'expense', ['created'])
+    op.create_index('ix_expense_category_id_created', 'expense', ['category_id', 'created'])
+    op.create_index('uq_category_lower_name', 'category', [sa.text('lower(name)')], unique=True)
+    op.create_index('uq_aliases_lower_name', 'aliases', [sa.text('lower(name)')], unique=True)
+    op.create_index('ix_aliases_category_id', 'aliases', ['category_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_aliases_category_id', table_name='aliases')
+    op.drop_index('uq_aliases_lower_name', table_name='aliases')
+    op.drop_index('uq_category_lower_name', table_name='category')
+    op.drop_index('ix_expense_category_id_created', table_name='expense')
+    op.drop_index('ix_expense_created', table_name='expense')
@@ -0,0 +1,47 @@
+"""update queue
+
+Revision ID: 5b1e0c7d2a94
+Revises: 9844957a96c6
+Create Date: 2026-10-18 15:02:11.408213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e0c7d2a94'
+down_revision = '9844957a96c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'update_queue',
+        sa.Column('update_id', sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('created', sa.DateTime(), server_default=sa.text("timezone('UTC', now())"), nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('processed', sa.DateTime(), nullable=True),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('update_id'),
+    )
+    # Голова очереди каждого пользователя: необработанные апдейты в порядке update_id
+    op.create_index(
+        'ix_update_queue_pending', 'update_queue', ['user_id', 'update_id'],
+        postgresql_where=sa.text('processed IS NULL'),
+    )
+    op.create_index(
+        'ix_update_queue_processed', 'update_queue', ['processed'],
+        postgresql_where=sa.text('processed IS NOT NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_update_queue_processed', table_name='update_queue')
+    op.drop_index('ix_update_queue_pending', table_name='update_queue')
+    op.drop_table('update_queue')
@@ -0,0 +1,64 @@
+"""local day rollup
+
+Revision ID: 7f2c4d8e1a35
+Revises: e3a91f4c6b08
+Create Date: 2026-10-18 16:20:44.581327
+
+"""
+from alembic import op
+
+from core.settings import settings
+
+
+# revision identifiers, used by Alembic.
+revision = '7f2c4d8e1a35'
+down_revision = 'e3a91f4c6b08'
+branch_labels = None
+depends_on = None
+
+ROLLUP_FUNCTION = """
+    CREATE OR REPLACE FUNCTION daily_category_totals_update() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE daily_category_totals
+            SET amount = amount - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND day = {old_day} AND category_id = OLD.category_id;
+            DELETE FROM daily_category_totals
+            WHERE user_id = OLD.user_id AND day = {old_day} AND category_id = OLD.category_id AND count <= 0;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO daily_category_totals (user_id, day, category_id, amount, count)
+            VALUES (NEW.user_id, {new_day}, NEW.category_id, NEW.amount, 1)
+            ON CONFLICT (user_id, day, category_id) DO UPDATE
+            SET amount = daily_category_totals.amount + EXCLUDED.amount,
+                count = daily_category_totals.count + 1;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+# asyncpg выполняет в одном запросе только одну команду
+CLEAR_ROLLUP = 'DELETE FROM daily_category_totals'
+FILL_ROLLUP = """
+    INSERT INTO daily_category_totals (user_id, day, category_id, amount, count)
+    SELECT user_id, {day}, category_id, sum(amount), count(*) FROM expense
+    GROUP BY user_id, {day}, category_id
+"""
+
+
+def _set_day(day: str) -> None:
+    op.execute(ROLLUP_FUNCTION.format(
+        old_day=day.format(created='OLD.created'), new_day=day.format(created='NEW.created'),
+    ))
+    op.execute(CLEAR_ROLLUP)
+    op.execute(FILL_ROLLUP.format(day=day.format(created='created')))
+
+
+def upgrade() -> None:
+    # День роллапа — локальный день пользователя, тогда периоды бота читаются из роллапа целиком, без краев
+    _set_day(f"({{created}} + interval '{int(settings.DIFFERENCE_WITH_UTC)} hours')::date")
+
+
+def downgrade() -> None:
+    _set_day('{created}::date')
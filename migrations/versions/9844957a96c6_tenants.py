@@ -0,0 +1,162 @@
+"""tenants
+
+Revision ID: 9844957a96c6
+Revises: c354d917a85e
+Create Date: 2026-10-18 14:21:53.662048
+
+"""
+from typing import Optional
+
+from alembic import op
+import sqlalchemy as sa
+
+from core.settings import settings
+
+
+# revision identifiers, used by Alembic.
+revision = '9844957a96c6'
+down_revision = 'c354d917a85e'
+branch_labels = None
+depends_on = None
+
+TABLES = ('category', 'aliases', 'budget', 'expense')
+
+ROLLUP_FUNCTION = """
+    CREATE FUNCTION daily_category_totals_update() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE daily_category_totals
+            SET amount = amount - OLD.amount, count = count - 1
+            WHERE {old_key};
+            DELETE FROM daily_category_totals
+            WHERE {old_key} AND count <= 0;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO daily_category_totals ({columns}, amount, count)
+            VALUES ({new_values}, NEW.amount, 1)
+            ON CONFLICT ({columns}) DO UPDATE
+            SET amount = daily_category_totals.amount + EXCLUDED.amount,
+                count = daily_category_totals.count + 1;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+
+def _create_rollup(with_user: bool) -> None:
+    columns = ['day', 'category_id']
+    if with_user:
+        columns.insert(0, 'user_id')
+    key_columns = [sa.Column('user_id', sa.BigInteger(), nullable=False)] if with_user else []
+    op.create_table('daily_category_totals',
+    *key_columns,
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['category_id'], ['category.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint(*columns)
+    )
+    expressions = {'user_id': 'user_id', 'day': 'created::date', 'category_id': 'category_id'}
+    op.execute(f"""
+        INSERT INTO daily_category_totals ({', '.join(columns)}, amount, count)
+        SELECT {', '.join(expressions[c] for c in columns)}, sum(amount), count(*) FROM expense
+        GROUP BY {', '.join(expressions[c] for c in columns)}
+    """)
+    op.execute(ROLLUP_FUNCTION.format(
+        columns=', '.join(columns),
+        old_key=' AND '.join(f'{c} = OLD.{expressions[c]}' for c in columns),
+        new_values=', '.join(f'NEW.{expressions[c]}' for c in columns),
+    ))
+    op.execute("""
+        CREATE TRIGGER expense_daily_category_totals
+        AFTER INSERT OR UPDATE OR DELETE ON expense
+        FOR EACH ROW EXECUTE PROCEDURE daily_category_totals_update()
+    """)
+
+
+def _drop_rollup() -> None:
+    op.execute("DROP TRIGGER expense_daily_category_totals ON expense")
+    op.execute("DROP FUNCTION daily_category_totals_update()")
+    op.drop_table('daily_category_totals')
+
+
+def _owner() -> Optional[int]:
+    """
+    Владелец существующих данных — первый пользователь из ACCESS_IDS.
+    Без ACCESS_IDS миграция проходит только на пустой базе, иначе данные некому отдать.
+    """
+    if settings.ACCESS_IDS:
+        return int(settings.ACCESS_IDS[0])
+    bind = op.get_bind()
+    if any(bind.execute(sa.text(f"SELECT EXISTS (SELECT 1 FROM {table})")).scalar() for table in TABLES):
+        raise RuntimeError(
+            'ACCESS_IDS is empty: set it before this migration, '
+            'the first id becomes the owner of the existing categories, aliases, budget and expenses'
+        )
+    return None
+
+
+def upgrade() -> None:
+    # Существующие данные принадлежат первому пользователю из ACCESS_IDS,
+    # остальным пользователям копируются его категории, алиасы и бюджет
+    owner = _owner()
+    others = [int(access_id) for access_id in settings.ACCESS_IDS[1:]]
+    for table in TABLES:
+        op.add_column(table, sa.Column('user_id', sa.BigInteger(), nullable=True))
+        op.execute(sa.text(f"UPDATE {table} SET user_id = :owner").bindparams(owner=owner))
+    op.execute("DELETE FROM budget WHERE id <> (SELECT min(id) FROM budget)")
+    # Глобальная уникальность имен мешает копиям категорий и алиасов, поэтому индексы меняются до копирования
+    op.drop_index('uq_category_lower_name', table_name='category')
+    op.drop_index('uq_aliases_lower_name', table_name='aliases')
+    op.create_index('uq_category_user_id_lower_name', 'category', ['user_id', sa.text('lower(name)')], unique=True)
+    op.create_index('uq_aliases_user_id_lower_name', 'aliases', ['user_id', sa.text('lower(name)')], unique=True)
+    for user_id in others:
+        op.execute(sa.text("""
+            INSERT INTO category (user_id, name) SELECT :user_id, name FROM category WHERE user_id = :owner
+        """).bindparams(user_id=user_id, owner=owner))
+        op.execute(sa.text("""
+            INSERT INTO aliases (user_id, name, category_id)
+            SELECT :user_id, a.name, tenant_category.id
+            FROM aliases a
+            JOIN category c ON c.id = a.category_id
+            JOIN category tenant_category ON tenant_category.user_id = :user_id AND tenant_category.name = c.name
+            WHERE a.user_id = :owner
+        """).bindparams(user_id=user_id, owner=owner))
+        op.execute(sa.text("""
+            INSERT INTO budget (user_id, name, daily_limit) SELECT :user_id, name, daily_limit FROM budget
+            WHERE user_id = :owner
+        """).bindparams(user_id=user_id, owner=owner))
+    for table in TABLES:
+        op.alter_column(table, 'user_id', nullable=False)
+    #
+    op.drop_index('ix_expense_created', table_name='expense')
+    op.drop_index('ix_expense_category_id_created_id', table_name='expense')
+    op.create_index('ix_expense_user_id_created', 'expense', ['user_id', 'created'])
+    op.create_index(
+        'ix_expense_user_id_category_id_created_id', 'expense', ['user_id', 'category_id', 'created', 'id']
+    )
+    op.create_unique_constraint('budget_user_id_key', 'budget', ['user_id'])
+    #
+    _drop_rollup()
+    _create_rollup(with_user=True)
+
+
+def downgrade() -> None:
+    owner = _owner()
+    _drop_rollup()
+    for table in ('expense', 'aliases', 'budget', 'category'):
+        op.execute(sa.text(f"DELETE FROM {table} WHERE user_id IS DISTINCT FROM :owner").bindparams(owner=owner))
+    op.drop_constraint('budget_user_id_key', 'budget')
+    op.drop_index('uq_aliases_user_id_lower_name', table_name='aliases')
+    op.drop_index('uq_category_user_id_lower_name', table_name='category')
+    op.drop_index('ix_expense_user_id_category_id_created_id', table_name='expense')
+    op.drop_index('ix_expense_user_id_created', table_name='expense')
+    op.create_index('uq_aliases_lower_name', 'aliases', [sa.text('lower(name)')], unique=True)
+    op.create_index('uq_category_lower_name', 'category', [sa.text('lower(name)')], unique=True)
+    op.create_index('ix_expense_category_id_created_id', 'expense', ['category_id', 'created', 'id'])
+    op.create_index('ix_expense_created', 'expense', ['created'])
+    for table in TABLES:
+        op.drop_column(table, 'user_id')
+    _create_rollup(with_user=False)
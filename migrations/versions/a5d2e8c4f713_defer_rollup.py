@@ -0,0 +1,55 @@
+"""defer rollup
+
+Revision ID: a5d2e8c4f713
+Revises: f1c7a2d9e4b6
+Create Date: 2026-10-18 21:20:37.418265
+
+"""
+from alembic import op
+
+from core.settings import settings
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5d2e8c4f713'
+down_revision = 'f1c7a2d9e4b6'
+branch_labels = None
+depends_on = None
+
+ROLLUP_FUNCTION = """
+    CREATE OR REPLACE FUNCTION daily_category_totals_update() RETURNS trigger AS $$
+    BEGIN
+        {defer}
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE daily_category_totals
+            SET amount = amount - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND day = (OLD.created + interval '{hours} hours')::date
+                AND category_id = OLD.category_id;
+            DELETE FROM daily_category_totals
+            WHERE user_id = OLD.user_id AND day = (OLD.created + interval '{hours} hours')::date
+                AND category_id = OLD.category_id AND count <= 0;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO daily_category_totals (user_id, day, category_id, amount, count)
+            VALUES (NEW.user_id, (NEW.created + interval '{hours} hours')::date, NEW.category_id, NEW.amount, 1)
+            ON CONFLICT (user_id, day, category_id) DO UPDATE
+            SET amount = daily_category_totals.amount + EXCLUDED.amount,
+                count = daily_category_totals.count + 1;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+# Импорт ставит параметр в своей транзакции и дописывает роллап сам одним запросом
+DEFER = """IF current_setting('finance.defer_rollup', true) = 'on' THEN
+            RETURN NULL;
+        END IF;"""
+
+
+def upgrade() -> None:
+    op.execute(ROLLUP_FUNCTION.format(defer=DEFER, hours=int(settings.DIFFERENCE_WITH_UTC)))
+
+
+def downgrade() -> None:
+    op.execute(ROLLUP_FUNCTION.format(defer='', hours=int(settings.DIFFERENCE_WITH_UTC)))
@@ -0,0 +1,29 @@
+"""expense idempotency key
+
+Revision ID: b4e6f2a9c731
+Revises: 7f2c4d8e1a35
+Create Date: 2026-10-18 20:05:37.214562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e6f2a9c731'
+down_revision = '7f2c4d8e1a35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('expense', sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+    # У старых и импортированных трат ключа нет, NULL не конфликтуют между собой
+    op.create_unique_constraint(
+        'uq_expense_user_id_idempotency_key', 'expense', ['user_id', 'idempotency_key']
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_expense_user_id_idempotency_key', 'expense', type_='unique')
+    op.drop_column('expense', 'idempotency_key')
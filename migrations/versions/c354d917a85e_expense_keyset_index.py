@@ -0,0 +1,27 @@
+"""expense keyset index
+
+Revision ID: c354d917a85e
+Revises: cfdbd87b3316
+Create Date: 2026-10-18 12:40:05.730144
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c354d917a85e'
+down_revision = 'cfdbd87b3316'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # (category_id, created, id) обслуживает и диапазон по дате, и постраничную выборку по курсору (created, id)
+    op.create_index('ix_expense_category_id_created_id', 'expense', ['category_id', 'created', 'id'])
+    op.drop_index('ix_expense_category_id_created', table_name='expense')
+
+
+def downgrade() -> None:
+    op.create_index('ix_expense_category_id_created', 'expense', ['category_id', 'created'])
+    op.drop_index('ix_expense_category_id_created_id', table_name='expense')
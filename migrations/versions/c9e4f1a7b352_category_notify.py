@@ -0,0 +1,41 @@
+"""category notify
+
+Revision ID: c9e4f1a7b352
+Revises: a5d2e8c4f713
+Create Date: 2026-10-18 22:41:17.205634
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e4f1a7b352'
+down_revision = 'a5d2e8c4f713'
+branch_labels = None
+depends_on = None
+
+TABLES = ('category', 'aliases')
+
+
+def upgrade() -> None:
+    # Процессы бота сбрасывают кэш категорий пользователя по уведомлению, в том числе после правок вручную.
+    # Одинаковые уведомления одной транзакции Postgres доставляет один раз
+    op.execute("""
+        CREATE FUNCTION categories_changed_notify() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('finance_categories', COALESCE(NEW.user_id, OLD.user_id)::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table in TABLES:
+        op.execute(f"""
+            CREATE TRIGGER {table}_changed_notify AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE PROCEDURE categories_changed_notify()
+        """)
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER {table}_changed_notify ON {table}")
+    op.execute("DROP FUNCTION categories_changed_notify()")
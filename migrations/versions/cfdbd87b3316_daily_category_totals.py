@@ -0,0 +1,64 @@
+"""daily category totals
+
+Revision ID: cfdbd87b3316
+Revises: 2845a0fe8253
+Create Date: 2026-10-18 11:02:47.118563
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cfdbd87b3316'
+down_revision = '2845a0fe8253'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('daily_category_totals',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['category_id'], ['category.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('day', 'category_id')
+    )
+    op.execute("""
+        INSERT INTO daily_category_totals (day, category_id, amount, count)
+        SELECT created::date, category_id, sum(amount), count(*) FROM expense GROUP BY created::date, category_id
+    """)
+    # Роллап поддерживается триггером, поэтому учитываются и вставки мимо ORM (CTE, COPY).
+    op.execute("""
+        CREATE FUNCTION daily_category_totals_update() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE daily_category_totals
+                SET amount = amount - OLD.amount, count = count - 1
+                WHERE day = OLD.created::date AND category_id = OLD.category_id;
+                DELETE FROM daily_category_totals
+                WHERE day = OLD.created::date AND category_id = OLD.category_id AND count <= 0;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO daily_category_totals (day, category_id, amount, count)
+                VALUES (NEW.created::date, NEW.category_id, NEW.amount, 1)
+                ON CONFLICT (day, category_id) DO UPDATE
+                SET amount = daily_category_totals.amount + EXCLUDED.amount,
+                    count = daily_category_totals.count + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER expense_daily_category_totals
+        AFTER INSERT OR UPDATE OR DELETE ON expense
+        FOR EACH ROW EXECUTE PROCEDURE daily_category_totals_update()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER expense_daily_category_totals ON expense")
+    op.execute("DROP FUNCTION daily_category_totals_update()")
+    op.drop_table('daily_category_totals')
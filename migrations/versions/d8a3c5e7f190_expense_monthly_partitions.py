@@ -0,0 +1,114 @@
+"""expense monthly partitions
+
+Revision ID: d8a3c5e7f190
+Revises: b4e6f2a9c731
+Create Date: 2026-10-18 21:10:52.903417
+
+"""
+from datetime import date, datetime, time, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+from core.settings import settings
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a3c5e7f190'
+down_revision = 'b4e6f2a9c731'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+INDEXES = (
+    ('ix_expense_user_id_created', ['user_id', 'created']),
+    ('ix_expense_user_id_category_id_created_id', ['user_id', 'category_id', 'created', 'id']),
+)
+
+CREATE_TRIGGER = """
+    CREATE TRIGGER expense_daily_category_totals
+    AFTER INSERT OR UPDATE OR DELETE ON expense
+    FOR EACH ROW EXECUTE PROCEDURE daily_category_totals_update()
+"""
+
+
+def _next_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def _bound(month: date) -> str:
+    """Начало локального месяца пользователя в UTC: тогда /month читает ровно одну партицию."""
+    return (datetime.combine(month, time()) - timedelta(hours=int(settings.DIFFERENCE_WITH_UTC))).isoformat(' ')
+
+
+def _detach_old_table(name: str) -> None:
+    """Переименовывает текущую expense, снимает с нее триггер роллапа и освобождает имена индексов."""
+    op.execute('DROP TRIGGER expense_daily_category_totals ON expense')
+    op.execute(f'ALTER TABLE expense RENAME TO {name}')
+    op.execute(f'ALTER INDEX expense_pkey RENAME TO {name}_pkey')
+    for index, _ in INDEXES:
+        op.drop_index(index, table_name=name)
+    op.drop_constraint('uq_expense_user_id_idempotency_key', name, type_='unique')
+
+
+def _finish(old_table: str) -> None:
+    """Переносит строки из old_table в новую expense и возвращает индексы, последовательность id и триггер."""
+    # Триггера на новой таблице еще нет: роллап уже содержит эти траты
+    op.execute(f'INSERT INTO expense SELECT id, user_id, amount, created, category_id, idempotency_key FROM {old_table}')
+    op.execute('ALTER SEQUENCE expense_id_seq OWNED BY expense.id')
+    op.drop_table(old_table)
+    for index, columns in INDEXES:
+        op.create_index(index, 'expense', columns)
+    op.execute(CREATE_TRIGGER)
+
+
+def upgrade() -> None:
+    _detach_old_table('expense_unpartitioned')
+    # Ключ партиционирования должен входить в первичный ключ и уникальные ограничения
+    op.execute("""
+        CREATE TABLE expense (
+            id integer NOT NULL DEFAULT nextval('expense_id_seq'::regclass),
+            user_id bigint NOT NULL,
+            amount bigint NOT NULL,
+            created timestamp without time zone NOT NULL,
+            category_id integer NOT NULL REFERENCES category (id) ON DELETE CASCADE,
+            idempotency_key varchar(64),
+            CONSTRAINT expense_pkey PRIMARY KEY (id, created),
+            CONSTRAINT uq_expense_user_id_idempotency_key UNIQUE (user_id, idempotency_key, created)
+        ) PARTITION BY RANGE (created)
+    """)
+    # Траты за месяцы без своей партиции (например, внесенные задним числом) попадают в партицию по умолчанию
+    op.execute('CREATE TABLE expense_default PARTITION OF expense DEFAULT')
+    offset = timedelta(hours=int(settings.DIFFERENCE_WITH_UTC))
+    first = op.get_bind().execute(sa.text('SELECT min(created) FROM expense_unpartitioned')).scalar()
+    today = (datetime.utcnow() + offset).date()
+    month = (min((first + offset).date(), today) if first else today).replace(day=1)
+    last = today.replace(day=1)
+    for _ in range(MONTHS_AHEAD):
+        last = _next_month(last)
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE expense_y{month:%Y}m{month:%m} PARTITION OF expense "
+            f"FOR VALUES FROM ('{_bound(month)}') TO ('{_bound(_next_month(month))}')"
+        )
+        month = _next_month(month)
+    _finish('expense_unpartitioned')
+
+
+def downgrade() -> None:
+    _detach_old_table('expense_partitioned')
+    op.execute("""
+        CREATE TABLE expense (
+            id integer NOT NULL DEFAULT nextval('expense_id_seq'::regclass),
+            user_id bigint NOT NULL,
+            amount bigint NOT NULL,
+            created timestamp without time zone NOT NULL,
+            category_id integer NOT NULL REFERENCES category (id) ON DELETE CASCADE,
+            idempotency_key varchar(64),
+            CONSTRAINT expense_pkey PRIMARY KEY (id),
+            CONSTRAINT uq_expense_user_id_idempotency_key UNIQUE (user_id, idempotency_key)
+        )
+    """)
+    # Партиции удаляются вместе с expense_partitioned, отсоединенные в архив остаются как есть
+    _finish('expense_partitioned')
@@ -0,0 +1,50 @@
+"""amount minor units
+
+Revision ID: e3a91f4c6b08
+Revises: 5b1e0c7d2a94
+Create Date: 2026-10-18 15:48:37.215904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a91f4c6b08'
+down_revision = '5b1e0c7d2a94'
+branch_labels = None
+depends_on = None
+
+# Перевод float через numeric округляет до 15 значащих цифр, поэтому суммы вида 0.1 + 0.2
+# переводятся в копейки точно; доли копейки (старый парсер принимал «1.234») округляются
+TO_MINOR = 'round({column}::numeric * 100)::bigint'
+FROM_MINOR = '{column} / 100.0'
+
+# asyncpg выполняет в одном запросе только одну команду
+CLEAR_ROLLUP = 'DELETE FROM daily_category_totals'
+FILL_ROLLUP = """
+    INSERT INTO daily_category_totals (user_id, day, category_id, amount, count)
+    SELECT user_id, created::date, category_id, sum(amount), count(*) FROM expense
+    GROUP BY user_id, created::date, category_id
+"""
+
+
+def upgrade() -> None:
+    op.alter_column('expense', 'amount', type_=sa.BigInteger(), postgresql_using=TO_MINOR.format(column='amount'))
+    op.alter_column(
+        'budget', 'daily_limit', type_=sa.BigInteger(), postgresql_using=TO_MINOR.format(column='daily_limit')
+    )
+    # Роллап пересчитывается из переведенных трат, а не переводится сам: в накопленных float-суммах могла быть ошибка
+    op.alter_column('daily_category_totals', 'amount', type_=sa.BigInteger(), postgresql_using='0')
+    op.execute(CLEAR_ROLLUP)
+    op.execute(FILL_ROLLUP)
+
+
+def downgrade() -> None:
+    op.alter_column('expense', 'amount', type_=sa.Float(), postgresql_using=FROM_MINOR.format(column='amount'))
+    op.alter_column(
+        'budget', 'daily_limit', type_=sa.Float(), postgresql_using=FROM_MINOR.format(column='daily_limit')
+    )
+    op.alter_column('daily_category_totals', 'amount', type_=sa.Float(), postgresql_using='0')
+    op.execute(CLEAR_ROLLUP)
+    op.execute(FILL_ROLLUP)
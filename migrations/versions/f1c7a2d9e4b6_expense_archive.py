@@ -0,0 +1,33 @@
+"""expense archive
+
+Revision ID: f1c7a2d9e4b6
+Revises: d8a3c5e7f190
+Create Date: 2026-10-18 22:14:08.531907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c7a2d9e4b6'
+down_revision = 'd8a3c5e7f190'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Месяцы отсоединенных партиций: проверка и пересборка роллапа не трогают их дни
+    op.create_table(
+        'expense_archive',
+        sa.Column('name', sa.String(length=63), nullable=False),
+        sa.Column('schema', sa.String(length=63), nullable=False),
+        sa.Column('first_day', sa.Date(), nullable=False),
+        sa.Column('last_day', sa.Date(), nullable=False),
+        sa.Column('archived', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('expense_archive')
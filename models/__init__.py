@@ -1 +1,2 @@
-from models.expense import Expense, Category, Budget
+from models.expense import Expense, Category, Budget, DailyCategoryTotal, ArchivedPartition
+from models.update import QueuedUpdate
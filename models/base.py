@@ -1,4 +1,4 @@
-from sqlalchemy import select, delete, update
+from sqlalchemy import select, delete, update, func
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
@@ -7,11 +7,11 @@ from core.exceptions import GetFromDatabaseException
 
 
 class BaseOrmMixin:
-    """Class for create base orm query"""
+    """Class for create base orm query. All queries are scoped by tenant (Telegram user id)"""
 
     @classmethod
-    async def by_id(cls, db: AsyncSession, instance_id: int, selectinload_attr: str = None):
-        query = select(cls).where(cls.id == instance_id)
+    async def by_id(cls, db: AsyncSession, user_id: int, instance_id: int, selectinload_attr: str = None):
+        query = select(cls).where(cls.user_id == user_id, cls.id == instance_id)
         #
         if selectinload_attr:
             query = query.options(selectinload(getattr(cls, selectinload_attr)))
@@ -29,8 +29,8 @@ class BaseOrmMixin:
         return instance
 
     @classmethod
-    async def by_name(cls, db: AsyncSession, name: str):
-        query = select(cls).where(cls.name == name)
+    async def by_name(cls, db: AsyncSession, user_id: int, name: str):
+        query = select(cls).where(cls.user_id == user_id, func.lower(cls.name) == name.lower())
         try:
             instance = await db.execute(query)
             instance = instance.first()
@@ -44,8 +44,8 @@ class BaseOrmMixin:
         return instance
 
     @classmethod
-    async def get_all(cls, db: AsyncSession, selectinload_attr: str = None):
-        query = select(cls).order_by(cls.id)
+    async def get_all(cls, db: AsyncSession, user_id: int, selectinload_attr: str = None):
+        query = select(cls).where(cls.user_id == user_id).order_by(cls.id)
         #
         if selectinload_attr:
             query = query.options(selectinload(getattr(cls, selectinload_attr)))
@@ -59,8 +59,8 @@ class BaseOrmMixin:
         return instances
 
     @classmethod
-    async def create(cls, db: AsyncSession, **kwargs):
-        instance = cls(**kwargs)
+    async def create(cls, db: AsyncSession, user_id: int, **kwargs):
+        instance = cls(user_id=user_id, **kwargs)
         db.add(instance)
         try:
             await db.commit()
@@ -70,8 +70,8 @@ class BaseOrmMixin:
         return instance
 
     @classmethod
-    async def delete_by_id(cls, db: AsyncSession, instance_id: int):
-        query = delete(cls).where(cls.id == instance_id)
+    async def delete_by_id(cls, db: AsyncSession, user_id: int, instance_id: int):
+        query = delete(cls).where(cls.user_id == user_id, cls.id == instance_id)
         await db.execute(query)
         try:
             await db.commit()
@@ -81,9 +81,9 @@ class BaseOrmMixin:
         return True
 
     @classmethod
-    async def update(cls, db: AsyncSession, instance_id: int, **kwargs):
+    async def update(cls, db: AsyncSession, user_id: int, instance_id: int, **kwargs):
         query = (
-            update(cls).where(cls.id == instance_id).values(**kwargs).execution_options(synchronize_session="fetch")
+            update(cls).where(cls.user_id == user_id, cls.id == instance_id).values(**kwargs).execution_options(synchronize_session="fetch")
         )
         await db.execute(query)
         try:
@@ -1,28 +1,69 @@
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
+from typing import List, Tuple
 
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, select, Date, cast, Float, desc
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, ForeignKey, Date, DateTime, select, delete, union_all, desc,
+    func, Index, UniqueConstraint, cast, and_, or_, tuple_, text, literal_column, Interval,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import relationship
 
 from core.db import Base
 from core.exceptions import GetFromDatabaseException, NotCorrectMessage
+from core.settings import settings
 from models.base import BaseOrmMixin
 
 
+def _quote(identifier: str) -> str:
+    return postgresql.dialect().identifier_preparer.quote(identifier)
+
+
+def _utc_offset() -> timedelta:
+    return timedelta(hours=settings.DIFFERENCE_WITH_UTC)
+
+
+def _local_day(created):
+    """
+    Локальный день пользователя, к которому относится трата (created хранится в UTC).
+    Сдвиг пишется в запрос литералом, как в функции триггера роллапа: с параметром выражения
+    в SELECT и GROUP BY получают разные параметры, и Postgres не считает их одним выражением.
+    """
+    return cast(created + literal_column(f"interval '{int(settings.DIFFERENCE_WITH_UTC)} hours'", Interval), Date)
+
+
 class Expense(Base, BaseOrmMixin):
+    """
+    Траты партиционированы по created по локальным месяцам (expense_yYYYYmMM) с партицией по умолчанию
+    expense_default для месяцев без своей партиции. Ключ партиционирования входит в первичный ключ
+    и ключ идемпотентности.
+    """
     __tablename__ = "expense"
+    IDEMPOTENCY_CONSTRAINT = 'uq_expense_user_id_idempotency_key'
+    DEFAULT_PARTITION = 'expense_default'
+    __table_args__ = (
+        Index('ix_expense_user_id_created', 'user_id', 'created'),
+        Index('ix_expense_user_id_category_id_created_id', 'user_id', 'category_id', 'created', 'id'),
+        UniqueConstraint('user_id', 'idempotency_key', 'created', name=IDEMPOTENCY_CONSTRAINT),
+        {'postgresql_partition_by': 'RANGE (created)'},
+    )
 
-    id = Column(Integer, primary_key=True)
-    amount = Column(Float, nullable=False)
-    created = Column(DateTime, nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, nullable=False)
+    # В копейках
+    amount = Column(BigInteger, nullable=False)
+    created = Column(DateTime, primary_key=True)
     category_id = Column(Integer, ForeignKey('category.id', ondelete='CASCADE'), nullable=False)
+    # <message_id>:<номер строки> для трат из сообщений бота, повторная доставка сообщения не создает дублей
+    idempotency_key = Column(String(64), nullable=True)
 
     @classmethod
-    async def get_last(cls, db: AsyncSession):
+    async def get_last(cls, db: AsyncSession, user_id: int):
         query = select(
             cls.id, Category.name, cls.amount, cls.created
-        ).join(Category).order_by(desc(cls.created)).limit(10)
+        ).join(Category).where(cls.user_id == user_id).order_by(desc(cls.created)).limit(10)
         try:
             expenses = await db.execute(query)
             expenses = expenses.all()
@@ -32,62 +73,559 @@ class Expense(Base, BaseOrmMixin):
         return expenses
 
     @classmethod
-    async def get_statistics(cls, db: AsyncSession, period: str):
-        if period == 'month':
-            deadline = datetime.utcnow().replace(day=1).date()
+    async def get_statistics(cls, db: AsyncSession, user_id: int, start: datetime, end: datetime):
+        """
+        Возвращает суммы трат по каждой категории за полуинтервал [start, end) и дневной лимит бюджета.
+        Агрегация выполняется в БД за один запрос: строка на каждую категорию
+        (id, name, amount, daily_limit), amount равен None если трат не было.
+        """
+        query = cls.statistics_query(user_id=user_id, start=start, end=end)
+
+        try:
+            rows = await db.execute(query)
+            rows = rows.all()
+        except SQLAlchemyError as ex:
+            await db.rollback()
+            raise GetFromDatabaseException(f'Error get {cls.__name__} from finance database :: {ex}')
+        return rows
+
+    @classmethod
+    async def create_with_statistics(
+            cls, db: AsyncSession, user_id: int, start: datetime, end: datetime, expenses: List[dict]
+    ):
+        """
+        Добавляет траты одним INSERT и в той же транзакции одним запросом возвращает статистику за [start, end).
+        INSERT ... RETURNING выполняется в CTE, строки которого не видны основному запросу,
+        поэтому новые траты, попавшие в интервал, добавляются к суммам через UNION ALL.
+        Траты с уже записанным ключом идемпотентности пропускаются.
+        Строки как в get_statistics плюс колонки expense_ids и expense_keys с идентификаторами
+        и ключами новых трат в порядке id, None если новых трат нет.
+        """
+        # Траты передаются массивами: у postgresql.insert().values() нет ключа кэша, и такой запрос
+        # компилировался бы заново на каждое сообщение
+        new_expenses = text(
+            "INSERT INTO expense (user_id, amount, category_id, created, idempotency_key) "
+            "SELECT :user_id, * FROM unnest(CAST(:amounts AS bigint[]), CAST(:category_ids AS integer[]), "
+            "CAST(:created AS timestamp[]), CAST(:keys AS varchar[])) "
+            f"ON CONFLICT ON CONSTRAINT {cls.IDEMPOTENCY_CONSTRAINT} DO NOTHING "
+            "RETURNING id, category_id, amount, created, idempotency_key"
+        ).bindparams(
+            user_id=user_id,
+            amounts=[e['amount'] for e in expenses],
+            category_ids=[e['category_id'] for e in expenses],
+            created=[e['created'] for e in expenses],
+            keys=[e['idempotency_key'] for e in expenses],
+        ).columns(
+            cls.id, cls.category_id, cls.amount, cls.created, cls.idempotency_key
+        ).cte('new_expenses')
+        amounts = union_all(
+            *cls._amounts(user_id=user_id, start=start, end=end),
+            select(new_expenses.c.category_id, new_expenses.c.amount).where(
+                new_expenses.c.created >= start, new_expenses.c.created < end
+            ),
+        ).subquery()
+        query = cls._statistics_query(user_id, amounts).add_columns(
+            select(func.array_agg(aggregate_order_by(new_expenses.c.id, new_expenses.c.id))).scalar_subquery().label(
+                'expense_ids'
+            ),
+            select(
+                func.array_agg(aggregate_order_by(new_expenses.c.idempotency_key, new_expenses.c.id))
+            ).scalar_subquery().label('expense_keys'),
+        )
+
+        try:
+            rows = await db.execute(query)
+            rows = rows.all()
+            await db.commit()
+        except SQLAlchemyError:
+            await db.rollback()
+            raise
+        return rows
+
+    @classmethod
+    async def create_many(cls, db: AsyncSession, expenses: List[dict]):
+        """
+        Добавляет траты любых пользователей одним INSERT, траты с уже записанным ключом идемпотентности пропускает.
+        Возвращает (id, user_id, idempotency_key) новых трат.
+        """
+        query = insert(cls).values(expenses).on_conflict_do_nothing(
+            constraint=cls.IDEMPOTENCY_CONSTRAINT
+        ).returning(cls.id, cls.user_id, cls.idempotency_key)
+        try:
+            rows = await db.execute(query)
+            rows = rows.all()
+            await db.commit()
+        except SQLAlchemyError:
+            await db.rollback()
+            raise
+        return rows
+
+    @classmethod
+    async def delete_returning(cls, db: AsyncSession, user_id: int, instance_id: int):
+        """Удаляет трату и возвращает ее (created, category_id, amount), None если траты нет."""
+        query = delete(cls).where(cls.user_id == user_id, cls.id == instance_id).returning(
+            cls.created, cls.category_id, cls.amount
+        )
+        try:
+            row = await db.execute(query)
+            row = row.first()
+            await db.commit()
+        except SQLAlchemyError:
+            await db.rollback()
+            raise
+        return row
+
+    @classmethod
+    async def get_partitions(cls, db: AsyncSession) -> List[str]:
+        """Имена месячных партиций expense по возрастанию, без партиции по умолчанию."""
+        query = text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'expense'::regclass AND c.relname <> :default ORDER BY c.relname"
+        )
+        try:
+            rows = await db.execute(query, {'default': cls.DEFAULT_PARTITION})
+            rows = rows.scalars().all()
+        except SQLAlchemyError as ex:
+            await db.rollback()
+            raise GetFromDatabaseException(f'Error get {cls.__name__} partitions from finance database :: {ex}')
+        return rows
+
+    @staticmethod
+    def partition_name(month: date) -> str:
+        return f'expense_y{month:%Y}m{month:%m}'
+
+    @staticmethod
+    def partition_month(name: str) -> date:
+        return datetime.strptime(name, 'expense_y%Ym%m').date()
+
+    @classmethod
+    async def create_partition(cls, db: AsyncSession, month: date) -> int:
+        """
+        Создает партицию локального месяца month, границы — начала месяцев в UTC со сдвигом DIFFERENCE_WITH_UTC,
+        как у периодов бота. Траты этого месяца, уже лежащие в партиции по умолчанию,
+        в той же транзакции переносятся в новую: DELETE и INSERT проходят через триггер роллапа
+        и взаимно компенсируются. Возвращает число перенесенных трат.
+        """
+        first_day = month.replace(day=1)
+        start = datetime.combine(first_day, time()) - _utc_offset()
+        end = datetime.combine((first_day + timedelta(days=32)).replace(day=1), time()) - _utc_offset()
+        bounds = f"created >= '{start.isoformat(' ')}' AND created < '{end.isoformat(' ')}'"
+        try:
+            await db.execute(text(
+                f"CREATE TEMPORARY TABLE expense_moved ON COMMIT DROP AS "
+                f"SELECT * FROM {cls.DEFAULT_PARTITION} WHERE {bounds}"
+            ))
+            moved = await db.execute(text(f"DELETE FROM {cls.DEFAULT_PARTITION} WHERE {bounds}"))
+            await db.execute(text(
+                f"CREATE TABLE {cls.partition_name(first_day)} PARTITION OF expense "
+                f"FOR VALUES FROM ('{start.isoformat(' ')}') TO ('{end.isoformat(' ')}')"
+            ))
+            await db.execute(text("INSERT INTO expense SELECT * FROM expense_moved"))
+            await db.commit()
+        except SQLAlchemyError:
+            await db.rollback()
+            raise
+        return moved.rowcount
+
+    @classmethod
+    async def detach_partition(cls, db: AsyncSession, name: str, schema: str) -> None:
+        """
+        Отсоединяет партицию, переносит ее в схему schema и в той же транзакции запоминает ее месяц
+        в expense_archive. Траты партиции перестают читаться ботом, их итоги остаются в роллапе,
+        проверка и пересборка роллапа дни архивных месяцев не трогают.
+        Вернуть: ALTER TABLE expense ATTACH PARTITION и удалить строку из expense_archive.
+        """
+        first_day = cls.partition_month(name)
+        archived = ArchivedPartition(
+            name=name, schema=schema, first_day=first_day, last_day=(first_day + timedelta(days=32)).replace(day=1),
+            archived=datetime.utcnow(),
+        )
+        quoted_schema = _quote(schema)
+        try:
+            await db.execute(text(f"ALTER TABLE expense DETACH PARTITION {name}"))
+            await db.execute(text(f"CREATE SCHEMA IF NOT EXISTS {quoted_schema}"))
+            await db.execute(text(f"ALTER TABLE {name} SET SCHEMA {quoted_schema}"))
+            db.add(archived)
+            await db.commit()
+        except SQLAlchemyError:
+            await db.rollback()
+            raise
+
+    @classmethod
+    async def get_category_total(
+            cls, db: AsyncSession, user_id: int, category_id: int, start: datetime, end: datetime
+    ):
+        """Возвращает (name, amount) категории за [start, end), None если категории нет."""
+        amounts = union_all(
+            *cls._amounts(user_id=user_id, start=start, end=end, category_id=category_id)
+        ).subquery()
+        total = select(cast(func.coalesce(func.sum(amounts.c.amount), 0), BigInteger)).scalar_subquery()
+        query = select(Category.name, total.label('amount')).where(
+            Category.user_id == user_id, Category.id == category_id
+        )
+
+        try:
+            row = await db.execute(query)
+            row = row.first()
+        except SQLAlchemyError as ex:
+            await db.rollback()
+            raise GetFromDatabaseException(f'Error get {cls.__name__} from finance database :: {ex}')
+        return row
+
+    @classmethod
+    async def get_page(
+            cls, db: AsyncSession, user_id: int, category_id: int, start: datetime, end: datetime, limit: int,
+            before: Tuple[datetime, int] = None, after: Tuple[datetime, int] = None,
+    ):
+        """
+        Страница трат категории за [start, end) от новых к старым с пагинацией по курсору (created, id).
+        before — траты старше курсора, after — новее курсора, без курсора — самые новые.
+        Возвращает (траты, есть ли еще траты в направлении выборки).
+        """
+        query = select(cls.id, cls.amount, cls.created).where(
+            cls.user_id == user_id, cls.category_id == category_id, cls.created >= start, cls.created < end
+        )
+        if after is not None:
+            query = query.where(tuple_(cls.created, cls.id) > after).order_by(cls.created, cls.id)
         else:
-            deadline = datetime.utcnow().date()
+            if before is not None:
+                query = query.where(tuple_(cls.created, cls.id) < before)
+            query = query.order_by(desc(cls.created), desc(cls.id))
+
+        try:
+            expenses = await db.execute(query.limit(limit + 1))
+            expenses = expenses.all()
+        except SQLAlchemyError as ex:
+            await db.rollback()
+            raise GetFromDatabaseException(f'Error get {cls.__name__} from finance database :: {ex}')
+        has_more = len(expenses) > limit
+        expenses = expenses[:limit]
+        if after is not None:
+            expenses.reverse()
+        return expenses, has_more
 
+    @classmethod
+    def export_query(cls, user_id: int):
+        """Запрос всех трат с именами категорий для потоковой выгрузки: (id, created, amount, category)."""
+        return select(
+            cls.id, cls.created, cls.amount, Category.name.label('category')
+        ).join(Category).where(cls.user_id == user_id).order_by(cls.id)
+
+    @classmethod
+    def _amounts(cls, user_id: int, start: datetime, end: datetime, category_id: int = None) -> list:
+        """
+        Запросы (category_id, amount) за [start, end) для объединения через UNION ALL.
+        Полные локальные сутки интервала читаются из роллапа daily_category_totals,
+        неполные края — из самих трат. Периоды бота выровнены по локальным суткам, поэтому краев у них нет.
+        """
+        offset = _utc_offset()
+        local_start, local_end = start + offset, end + offset
+        first_day = local_start.date() if local_start.time() == time() else local_start.date() + timedelta(days=1)
+        last_day = local_end.date()
+        if first_day >= last_day:
+            return [cls._raw_amounts(user_id, start, end, category_id)]
+        #
+        full_start = datetime.combine(first_day, time()) - offset
+        full_end = datetime.combine(last_day, time()) - offset
+        amounts = [DailyCategoryTotal.amounts(user_id, first_day, last_day, category_id)]
+        if start < full_start:
+            amounts.append(cls._raw_amounts(user_id, start, full_start, category_id))
+        if full_end < end:
+            amounts.append(cls._raw_amounts(user_id, full_end, end, category_id))
+        return amounts
+
+    @classmethod
+    def statistics_query(cls, user_id: int, start: datetime, end: datetime):
+        amounts = union_all(*cls._amounts(user_id=user_id, start=start, end=end)).subquery()
+        return cls._statistics_query(user_id, amounts)
+
+    @classmethod
+    def raw_amounts_query(cls, user_id: int, start: datetime, end: datetime):
+        """Суммы трат за [start, end) по самой таблице expense, без роллапа."""
+        return cls._raw_amounts(user_id, start, end)
+
+    @classmethod
+    def _raw_amounts(cls, user_id: int, start: datetime, end: datetime, category_id: int = None):
+        query = select(cls.category_id, cls.amount).where(
+            cls.user_id == user_id, cls.created >= start, cls.created < end
+        )
+        if category_id is not None:
+            query = query.where(cls.category_id == category_id)
+        return query
+
+    @classmethod
+    def _statistics_query(cls, user_id: int, amounts):
+        totals = select(
+            amounts.c.category_id, cast(func.sum(amounts.c.amount), BigInteger).label('amount')
+        ).group_by(amounts.c.category_id).subquery()
+        daily_limit = select(Budget.daily_limit).where(Budget.user_id == user_id).scalar_subquery()
+
+        return select(
+            Category.id, Category.name, totals.c.amount, func.coalesce(daily_limit, 0).label('daily_limit')
+        ).outerjoin(totals, totals.c.category_id == Category.id).where(
+            Category.user_id == user_id
+        ).order_by(Category.id)
+
+
+class DailyCategoryTotal(Base, BaseOrmMixin):
+    """
+    Роллап сумм трат по пользователям, локальным дням (UTC + DIFFERENCE_WITH_UTC) и категориям,
+    поддерживается триггером на таблице expense. Сдвиг зашит в функцию триггера, поэтому
+    после смены DIFFERENCE_WITH_UTC роллап нужно пересобрать: `python -m core.rollup rebuild`.
+    Массовая загрузка выключает триггер в своей транзакции параметром DEFER_SETTING
+    и сама дописывает суммы загруженных трат запросом ADD_TOTALS.
+    """
+    __tablename__ = "daily_category_totals"
+
+    # Загрузка в одной транзакции обновляла бы одни и те же строки роллапа сотни раз,
+    # а каждый UPDATE строки, уже измененной в этой транзакции, дороже предыдущего
+    DEFER_SETTING = 'finance.defer_rollup'
+    TRIGGER_FUNCTION = """
+        CREATE OR REPLACE FUNCTION daily_category_totals_update() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('finance.defer_rollup', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE daily_category_totals
+                SET amount = amount - OLD.amount, count = count - 1
+                WHERE user_id = OLD.user_id AND day = (OLD.created + interval '{hours} hours')::date
+                    AND category_id = OLD.category_id;
+                DELETE FROM daily_category_totals
+                WHERE user_id = OLD.user_id AND day = (OLD.created + interval '{hours} hours')::date
+                    AND category_id = OLD.category_id AND count <= 0;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO daily_category_totals (user_id, day, category_id, amount, count)
+                VALUES (NEW.user_id, (NEW.created + interval '{hours} hours')::date, NEW.category_id, NEW.amount, 1)
+                ON CONFLICT (user_id, day, category_id) DO UPDATE
+                SET amount = daily_category_totals.amount + EXCLUDED.amount,
+                    count = daily_category_totals.count + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """
+    # Параметры asyncpg: user_id и массивы day, category_id, amount, count
+    ADD_TOTALS = """
+        INSERT INTO daily_category_totals (user_id, day, category_id, amount, count)
+        SELECT $1, * FROM unnest($2::date[], $3::integer[], $4::bigint[], $5::integer[])
+        ON CONFLICT (user_id, day, category_id) DO UPDATE
+        SET amount = daily_category_totals.amount + EXCLUDED.amount,
+            count = daily_category_totals.count + EXCLUDED.count
+    """
+
+    user_id = Column(BigInteger, primary_key=True)
+    day = Column(Date, primary_key=True)
+    category_id = Column(Integer, ForeignKey('category.id', ondelete='CASCADE'), primary_key=True)
+    amount = Column(BigInteger, nullable=False)
+    count = Column(Integer, nullable=False)
+
+    @classmethod
+    def amounts(cls, user_id: int, first_day: date, last_day: date, category_id: int = None):
+        """Запрос (category_id, amount) за дни [first_day, last_day)."""
+        query = select(cls.category_id, cls.amount).where(
+            cls.user_id == user_id, cls.day >= first_day, cls.day < last_day
+        )
+        if category_id is not None:
+            query = query.where(cls.category_id == category_id)
+        return query
+
+    @classmethod
+    async def get_slice(cls, db: AsyncSession, user_id: int, first_day: date, last_day: date):
+        """
+        Колонки (day_index, category_id, amount) за дни [first_day, last_day) для векторных расчетов,
+        day_index — номер дня от first_day.
+        """
         query = select(
-            cls.id, Category.name, cls.amount, cls.created
-        ).join(Category).where(cast(cls.created, Date) >= deadline).order_by(cls.category_id)
+            (cls.day - first_day).label('day_index'), cls.category_id, cls.amount
+        ).where(cls.user_id == user_id, cls.day >= first_day, cls.day < last_day)
+        try:
+            rows = await db.execute(query)
+            rows = rows.all()
+        except SQLAlchemyError as ex:
+            await db.rollback()
+            raise GetFromDatabaseException(f'Error get {cls.__name__} from finance database :: {ex}')
+        return rows
+
+    @classmethod
+    async def get_drift(cls, db: AsyncSession):
+        """
+        Сравнивает роллап с суммами, посчитанными по таблице expense, кроме дней архивных месяцев.
+        Возвращает расходящиеся строки (user_id, day, category_id, expected_amount, expected_count, amount, count).
+        """
+        expected = select(
+            Expense.user_id, _local_day(Expense.created).label('day'), Expense.category_id,
+            cast(func.sum(Expense.amount), BigInteger).label('amount'), func.count().label('count'),
+        ).group_by(Expense.user_id, _local_day(Expense.created), Expense.category_id).subquery()
+        query = select(
+            func.coalesce(expected.c.user_id, cls.user_id).label('user_id'),
+            func.coalesce(expected.c.day, cls.day).label('day'),
+            func.coalesce(expected.c.category_id, cls.category_id).label('category_id'),
+            expected.c.amount.label('expected_amount'), expected.c.count.label('expected_count'),
+            cls.amount, cls.count,
+        ).select_from(
+            expected.outerjoin(
+                cls, and_(
+                    cls.user_id == expected.c.user_id,
+                    cls.day == expected.c.day,
+                    cls.category_id == expected.c.category_id,
+                ), full=True
+            )
+        ).where(
+            or_(
+                expected.c.day.is_(None),
+                cls.day.is_(None),
+                expected.c.count != cls.count,
+                expected.c.amount != cls.amount,
+            ),
+            ~ArchivedPartition.covers(func.coalesce(expected.c.day, cls.day)),
+        ).order_by('user_id', 'day', 'category_id')
 
         try:
-            expenses = await db.execute(query)
-            expenses = expenses.all()
+            rows = await db.execute(query)
+            rows = rows.all()
         except SQLAlchemyError as ex:
             await db.rollback()
             raise GetFromDatabaseException(f'Error get {cls.__name__} from finance database :: {ex}')
-        return expenses
+        return rows
+
+    @classmethod
+    async def rebuild(cls, db: AsyncSession):
+        """
+        Пересчитывает роллап по таблице expense и пересоздает функцию триггера в одной транзакции.
+        Дни архивных месяцев не пересчитываются: их трат в expense уже нет, итоги остаются прежними.
+        """
+        day = _local_day(Expense.created)
+        try:
+            await db.execute(text(cls.TRIGGER_FUNCTION.format(hours=int(settings.DIFFERENCE_WITH_UTC))))
+            await db.execute(
+                delete(cls).where(~ArchivedPartition.covers(cls.day)).execution_options(synchronize_session=False)
+            )
+            await db.execute(insert(cls).from_select(
+                ['user_id', 'day', 'category_id', 'amount', 'count'],
+                select(
+                    Expense.user_id, day, Expense.category_id, func.sum(Expense.amount), func.count()
+                ).where(~ArchivedPartition.covers(day)).group_by(Expense.user_id, day, Expense.category_id),
+            ))
+            await db.commit()
+        except SQLAlchemyError:
+            await db.rollback()
+            raise
+
+
+class ArchivedPartition(Base, BaseOrmMixin):
+    """Месячные партиции expense, отсоединенные в архивную схему, и локальные дни [first_day, last_day) их месяца."""
+    __tablename__ = "expense_archive"
+
+    name = Column(String(63), primary_key=True)
+    schema = Column(String(63), nullable=False)
+    first_day = Column(Date, nullable=False)
+    last_day = Column(Date, nullable=False)
+    archived = Column(DateTime, nullable=False)
+
+    @classmethod
+    def covers(cls, day):
+        """Условие: локальный день day попадает в архивный месяц."""
+        return select(cls.name).where(cls.first_day <= day, day < cls.last_day).exists()
 
 
 class Aliase(Base, BaseOrmMixin):
     __tablename__ = "aliases"
 
     id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, nullable=False)
     name = Column(String(255), nullable=False)
-    category_id = Column(Integer, ForeignKey('category.id', ondelete='CASCADE'), nullable=False)
+    category_id = Column(Integer, ForeignKey('category.id', ondelete='CASCADE'), nullable=False, index=True)
 
 
 class Category(Base, BaseOrmMixin):
     __tablename__ = "category"
 
+    # Триггеры category и aliases шлют в канал user_id при любом изменении категорий или алиасов
+    CHANGED_CHANNEL = 'finance_categories'
+
     id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, nullable=False)
     name = Column(String(255), nullable=False)
     expenses = relationship('Expense', cascade='all, delete, save-update, merge, delete-orphan')
     aliases = relationship('Aliase', cascade='all, delete, save-update, merge, delete-orphan')
 
     @classmethod
-    async def get_category_id(cls, db: AsyncSession, category_name: str):
-        category = await cls.by_name(db=db, name=category_name)
+    async def get_category_id(cls, db: AsyncSession, user_id: int, category_name: str):
+        category = await cls.by_name(db=db, user_id=user_id, name=category_name)
         if category:
             return category.id
-        alias = await Aliase.by_name(db=db, name=category_name)
+        alias = await Aliase.by_name(db=db, user_id=user_id, name=category_name)
         if not alias:
             raise NotCorrectMessage(f"Категории с именем '{category_name}' не существует")
         return alias.category_id
 
+    @classmethod
+    async def get_names(cls, db: AsyncSession, user_id: int):
+        """Возвращает пары (категория, алиас) одним запросом: (id, name, alias_name)"""
+        query = select(cls.id, cls.name, Aliase.name).outerjoin(Aliase).where(
+            cls.user_id == user_id
+        ).order_by(cls.id, Aliase.id)
+        try:
+            rows = await db.execute(query)
+            rows = rows.all()
+        except SQLAlchemyError as ex:
+            await db.rollback()
+            raise GetFromDatabaseException(f'Error get {cls.__name__} from finance database :: {ex}')
+        return rows
+
+    @classmethod
+    async def copy_from(cls, db: AsyncSession, user_id: int, template_user_id: int) -> int:
+        """
+        Копирует пользователю категории, алиасы и бюджет template_user_id, как миграция мультитенантности
+        копировала их пользователям из ACCESS_IDS. Уже существующие имена и бюджет не трогает.
+        Возвращает число добавленных категорий.
+        """
+        params = {'user_id': user_id, 'template_user_id': template_user_id}
+        try:
+            categories = await db.execute(text("""
+                INSERT INTO category (user_id, name) SELECT :user_id, name FROM category
+                WHERE user_id = :template_user_id ORDER BY id
+                ON CONFLICT DO NOTHING
+            """), params)
+            await db.execute(text("""
+                INSERT INTO aliases (user_id, name, category_id)
+                SELECT :user_id, a.name, tenant_category.id
+                FROM aliases a
+                JOIN category c ON c.id = a.category_id
+                JOIN category tenant_category ON tenant_category.user_id = :user_id AND tenant_category.name = c.name
+                WHERE a.user_id = :template_user_id ORDER BY a.id
+                ON CONFLICT DO NOTHING
+            """), params)
+            await db.execute(text("""
+                INSERT INTO budget (user_id, name, daily_limit) SELECT :user_id, name, daily_limit FROM budget
+                WHERE user_id = :template_user_id
+                ON CONFLICT DO NOTHING
+            """), params)
+            await db.commit()
+        except SQLAlchemyError as ex:
+            await db.rollback()
+            raise GetFromDatabaseException(f'Error copy {cls.__name__} in finance database :: {ex}')
+        return categories.rowcount
+
+
+Index('uq_aliases_user_id_lower_name', Aliase.user_id, func.lower(Aliase.name), unique=True)
+Index('uq_category_user_id_lower_name', Category.user_id, func.lower(Category.name), unique=True)
+
 
 class Budget(Base, BaseOrmMixin):
     __tablename__ = "budget"
 
     id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, nullable=False, unique=True)
     name = Column(String(255), nullable=False)
-    daily_limit = Column(Float, nullable=False)
+    # В копейках
+    daily_limit = Column(BigInteger, nullable=False)
 
     @classmethod
-    async def get(cls, db: AsyncSession):
-        budget = await db.execute(select(cls))
+    async def get(cls, db: AsyncSession, user_id: int):
+        budget = await db.execute(select(cls).where(cls.user_id == user_id))
         budget = budget.first()
         if not budget:
             return
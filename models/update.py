@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+from typing import Iterable, Tuple
+
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, DateTime, Index, select, update, delete, func, or_, exists, text,
+)
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from core.db import Base
+from core.exceptions import GetFromDatabaseException
+
+
+def _utc_now():
+    return func.timezone('UTC', func.now())
+
+
+class QueuedUpdate(Base):
+    """
+    Апдейт Telegram в общей очереди воркеров. update_id — первичный ключ,
+    поэтому повторная доставка того же апдейта в очередь игнорируется.
+    """
+    __tablename__ = "update_queue"
+    __table_args__ = (
+        Index('ix_update_queue_pending', 'user_id', 'update_id', postgresql_where='processed IS NULL'),
+        Index('ix_update_queue_processed', 'processed', postgresql_where='processed IS NOT NULL'),
+    )
+
+    update_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    user_id = Column(BigInteger, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    created = Column(DateTime, nullable=False, server_default=text("timezone('UTC', now())"))
+    attempts = Column(Integer, nullable=False, server_default='0')
+    locked_until = Column(DateTime)
+    processed = Column(DateTime)
+    error = Column(String)
+
+    @classmethod
+    async def enqueue(cls, db: AsyncSession, updates: Iterable[Tuple[int, int, dict]]) -> int:
+        """Кладет апдейты (update_id, user_id, payload) в очередь, уже известные пропускает. Возвращает число новых."""
+        values = [dict(update_id=update_id, user_id=user_id, payload=payload) for update_id, user_id, payload in updates]
+        if not values:
+            return 0
+        query = insert(cls).values(values).on_conflict_do_nothing(index_elements=[cls.update_id])
+        try:
+            result = await db.execute(query)
+            await db.commit()
+        except SQLAlchemyError as ex:
+            await db.rollback()
+            raise GetFromDatabaseException(f'Error create {cls.__name__} in finance database :: {ex}')
+        return result.rowcount
+
+    @classmethod
+    async def claim(cls, db: AsyncSession, limit: int, lease: int):
+        """
+        Забирает в обработку до limit апдейтов на время lease секунд.
+        Берется только самый ранний необработанный апдейт каждого пользователя,
+        поэтому апдейты одного пользователя обрабатываются строго по порядку и по одному,
+        а апдейты разных пользователей — параллельно любым числом воркеров.
+        Строки: (update_id, user_id, payload, attempts).
+        """
+        earlier = aliased(cls)
+        now = _utc_now()
+        head = select(cls.update_id).where(
+            cls.processed.is_(None),
+            or_(cls.locked_until.is_(None), cls.locked_until < now),
+            ~exists().where(
+                earlier.user_id == cls.user_id, earlier.processed.is_(None), earlier.update_id < cls.update_id
+            ),
+        ).order_by(cls.update_id).limit(limit).with_for_update(skip_locked=True)
+        query = update(cls).where(cls.update_id.in_(head.scalar_subquery())).values(
+            attempts=cls.attempts + 1, locked_until=now + timedelta(seconds=lease),
+        ).returning(cls.update_id, cls.user_id, cls.payload, cls.attempts).execution_options(synchronize_session=False)
+        try:
+            rows = await db.execute(query)
+            rows = rows.all()
+            await db.commit()
+        except SQLAlchemyError as ex:
+            await db.rollback()
+            raise GetFromDatabaseException(f'Error get {cls.__name__} from finance database :: {ex}')
+        return sorted(rows, key=lambda r: r.update_id)
+
+    @classmethod
+    async def complete(cls, db: AsyncSession, update_id: int, error: str = None) -> None:
+        """Отмечает апдейт обработанным, после этого следующий апдейт пользователя доступен воркерам."""
+        await cls._update(db, update_id, processed=_utc_now(), locked_until=None, error=error)
+
+    @classmethod
+    async def retry(cls, db: AsyncSession, update_id: int, delay: int, error: str) -> None:
+        """Возвращает апдейт в очередь не раньше чем через delay секунд."""
+        locked_until = _utc_now() + timedelta(seconds=delay)
+        await cls._update(db, update_id, locked_until=locked_until, error=error)
+
+    @classmethod
+    async def pending_count(cls, db: AsyncSession) -> int:
+        query = select(func.count()).select_from(cls).where(cls.processed.is_(None))
+        try:
+            count = await db.execute(query)
+        except SQLAlchemyError as ex:
+            await db.rollback()
+            raise GetFromDatabaseException(f'Error get {cls.__name__} from finance database :: {ex}')
+        return count.scalar_one()
+
+    @classmethod
+    async def purge(cls, db: AsyncSession, before: datetime) -> int:
+        """Удаляет апдейты, обработанные раньше before."""
+        query = delete(cls).where(cls.processed < before).execution_options(synchronize_session=False)
+        try:
+            result = await db.execute(query)
+            await db.commit()
+        except SQLAlchemyError as ex:
+            await db.rollback()
+            raise GetFromDatabaseException(f'Error delete {cls.__name__} from finance database :: {ex}')
+        return result.rowcount
+
+    @classmethod
+    async def _update(cls, db: AsyncSession, update_id: int, **kwargs) -> None:
+        query = update(cls).where(cls.update_id == update_id).values(**kwargs).execution_options(
+            synchronize_session=False
+        )
+        try:
+            await db.execute(query)
+            await db.commit()
+        except SQLAlchemyError as ex:
+            await db.rollback()
+            raise GetFromDatabaseException(f'Error update {cls.__name__} in finance database :: {ex}')
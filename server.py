@@ -1,36 +1,130 @@
+import asyncio
+import csv
+import functools
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
 from aiogram import Bot
 from aiogram import Dispatcher, executor, types
+from aiogram.utils.callback_data import CallbackData
 
-from core import exceptions, expenses
-from core.db import async_session
+from core import analytics, charts, exceptions, expenses, exporter, importer, periods
+from core import metrics, outbox, scheduler, worker, write_buffer
+from core.money import format_amount
+from core.db import engine, log_pool_stats
 from core.logging_utils import logger
-from core.middlewares import AccessMiddleware
+from core.middlewares import AccessMiddleware, ProfilingMiddleware
+from core.resolver import resolver
 from core.settings import settings
-from models import Category
+from core.webhook import start_webhook
 
 bot = Bot(token=settings.API_TOKEN)
 dp = Dispatcher(bot)
-dp.middleware.setup(AccessMiddleware(settings.ACCESS_IDS))
+# Воркерам апдейты достаются уже после ограничения частоты при приеме в очередь
+rate_limit = 0 if sys.argv[1:] == ['worker'] else settings.RATE_LIMIT_RATE
+dp.middleware.setup(AccessMiddleware(settings.ACCESS_IDS, rate=rate_limit, burst=settings.RATE_LIMIT_BURST))
+if settings.PROFILING_ENABLED:
+    dp.middleware.setup(ProfilingMiddleware(engine, slow_update_ms=settings.PROFILING_SLOW_UPDATE_MS))
+
+
+# Кнопки постраничного просмотра трат категории, курсор — (created в микросекундах от EPOCH, id)
+category_cb = CallbackData('cat', 'period', 'category_id', 'direction', 'created', 'id')
+EPOCH = datetime(1970, 1, 1)
+# Подсказка в /help и ответ на /export с неизвестным форматом
+EXPORT_USAGE = f"Выгрузка трат: /export{' или /export parquet' if exporter.pyarrow is not None else ''}"
+
+
+def reply(
+        message: types.Message, text: str = None, reply_markup=None,
+        header: str = None, summary: str = None, coalesce: str = None,
+) -> None:
+    """
+    Ставит ответ в очередь исходящих сообщений и сразу возвращается, хендлер не ждет Bot API.
+    Ответы в чат с одинаковым coalesce, ждущие отправки, сливаются в один.
+    """
+    outbox.outbox.send(
+        message.chat.id, text, header=header, summary=summary, coalesce=coalesce, reply_markup=reply_markup
+    )
 
 
 @dp.message_handler(commands=['start', 'help'])
 async def send_welcome(message: types.Message):
     """Отправляет приветственное сообщение и помощь по боту"""
-    await message.answer(
+    reply(
+        message,
         "Бот для учёта финансов\n\n"
         "Добавить расход: 250 такси\n"
+        "Расход за прошедший день: вчера 1 500,50 продукты или 12.03 300 кофе\n"
+        "Несколько расходов — каждый с новой строки\n"
         "Сегодняшняя статистика: /today\n"
+        "За текущую неделю: /week\n"
         "За текущий месяц: /month\n"
-        "Категории трат: /categories")
+        "За прошлый месяц: /prev_month\n"
+        "За текущий год: /year\n"
+        "За произвольный период: /stats 2023-01-01..2023-03-31\n"
+        "Аналитика и прогноз на месяц: /analytics\n"
+        "График трат: /chart month или /chart year\n"
+        "Категории трат: /categories\n"
+        f"{EXPORT_USAGE}\n"
+        "Импорт трат: пришлите файл .csv или .jsonl с колонками created, amount, category")
+
+
+@dp.message_handler(content_types=[types.ContentType.DOCUMENT])
+async def import_expenses(message: types.Message):
+    """Импортирует траты из присланного CSV или JSONL файла"""
+    suffix = os.path.splitext(message.document.file_name or '')[1].lower()
+    if suffix not in importer.SUFFIXES:
+        reply(message, "Для импорта пришлите файл .csv или .jsonl")
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f'import{suffix}')
+        await message.document.download(destination_file=path)
+        try:
+            result = await importer.import_file(path, message.from_user.id)
+        except (UnicodeDecodeError, csv.Error):
+            reply(message, "Не удалось прочитать файл: нужен CSV или JSONL в кодировке UTF-8")
+            return
+        except importer.DB_ERRORS:
+            # Импорт идет одной транзакцией, при ошибке не записывается ни одна трата
+            logger.exception(f'Import of {message.document.file_name} for {message.from_user.id} failed')
+            reply(message, "Не удалось импортировать траты, ни одна трата не записана. Попробуйте позже")
+            return
+    reply(message, f"Импортировано трат: {result.imported}, пропущено строк: {result.skipped}")
+
+
+@dp.message_handler(commands=['export'])
+async def export_expenses(message: types.Message):
+    """Отправляет файл со всеми тратами: /export или /export parquet"""
+    file_format = message.get_args().strip().lower() or 'csv'
+    if file_format not in exporter.FORMATS:
+        reply(message, EXPORT_USAGE)
+        return
+    # Каталог удаляет очередь исходящих сообщений, когда файл отправлен
+    directory = tempfile.mkdtemp()
+    cleanup = functools.partial(shutil.rmtree, directory, ignore_errors=True)
+    path = os.path.join(directory, f'expenses.{file_format}')
+    try:
+        await exporter.export_file(path, message.from_user.id)
+    except exceptions.NotCorrectMessage as e:
+        cleanup()
+        reply(message, str(e))
+        return
+    except Exception:
+        cleanup()
+        raise
+    outbox.outbox.send_document(message.chat.id, path, on_done=cleanup)
 
 
 @dp.message_handler(lambda message: message.text.startswith('/del'))
 async def del_expense(message: types.Message):
     """Удаляет одну запись о расходе по её идентификатору"""
     expense_id = int(message.text[4:])
-    await expenses.delete_expense(expense_id)
+    await expenses.delete_expense(message.from_user.id, expense_id)
     answer_message = "Удалил"
-    await message.answer(answer_message)
+    reply(message, answer_message)
 
 
 @dp.message_handler(lambda message: message.text.startswith('/cat_'))
@@ -39,48 +133,146 @@ async def get_category(message: types.Message):
     args = message.text[5:]
     period = args[0]
     category_id = int(args[1:])
-    answer_message = await expenses.get_category(category_id, period)
-    await message.answer(answer_message)
+    try:
+        page = await expenses.get_category(message.from_user.id, category_id, period)
+    except exceptions.NotCorrectMessage as e:
+        reply(message, str(e))
+        return
+    reply(message, page.text, reply_markup=_category_keyboard(period, category_id, page))
+
+
+@dp.callback_query_handler(category_cb.filter())
+async def get_category_page(query: types.CallbackQuery, callback_data: dict):
+    """Листает траты категории по кнопкам «новее» и «старше»"""
+    cursor = (EPOCH + timedelta(microseconds=int(callback_data['created'])), int(callback_data['id']))
+    period, category_id = callback_data['period'], int(callback_data['category_id'])
+    if callback_data['direction'] == 'newer':
+        page = await expenses.get_category(query.from_user.id, category_id, period, after=cursor)
+    else:
+        page = await expenses.get_category(query.from_user.id, category_id, period, before=cursor)
+    outbox.outbox.edit_text(
+        query.message.chat.id, query.message.message_id, page.text,
+        reply_markup=_category_keyboard(period, category_id, page),
+    )
+    # Ответ на нажатие кнопки — не сообщение в чат, его Telegram ждет сразу
+    await query.answer()
+
+
+def _category_keyboard(period: str, category_id: int, page: expenses.CategoryPage):
+    buttons = []
+    for direction, title, cursor in (('newer', '« Новее', page.newer), ('older', 'Старше »', page.older)):
+        if cursor is not None:
+            created, expense_id = cursor
+            buttons.append(types.InlineKeyboardButton(title, callback_data=category_cb.new(
+                period=period, category_id=category_id, direction=direction,
+                created=(created - EPOCH) // timedelta(microseconds=1), id=expense_id,
+            )))
+    return types.InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
 
 
 @dp.message_handler(commands=['categories'])
 async def categories_list(message: types.Message):
     """Отправляет список категорий расходов"""
-    async with async_session() as db:
-        categories = await Category.get_all(db=db, selectinload_attr='aliases')
+    categories = await resolver.get_categories(message.from_user.id)
     answer_message = "Категории трат:\n\n* " + \
-                     ("\n* ".join([c.name + ' (' + ", ".join([a.name for a in c.aliases]) + ')' for c in categories]))
-    await message.answer(answer_message)
+                     ("\n* ".join([c.name + ' (' + ", ".join(c.aliases) + ')' for c in categories]))
+    reply(message, answer_message)
+
+
+@dp.message_handler(commands=list(periods.PERIODS))
+async def period_statistics(message: types.Message):
+    """Отправляет статистику трат за сегодня, неделю, текущий или прошлый месяц, год"""
+    period = periods.get_period(message.get_command(pure=True).lower())
+    answer_message = await expenses.get_statistics(message.from_user.id, period)
+    reply(message, summary=answer_message, coalesce=f'stats:{period.code}')
+
+
+@dp.message_handler(commands=['analytics'])
+async def expense_analytics(message: types.Message):
+    """Отправляет средние траты, сравнение с прошлым месяцем и прогноз на конец месяца"""
+    reply(message, await analytics.get_analytics(message.from_user.id))
 
 
-@dp.message_handler(commands=['today'])
-async def today_statistics(message: types.Message):
-    """Отправляет сегодняшнюю статистику трат"""
-    answer_message = await expenses.get_statistics(period='today')
-    await message.answer(answer_message)
+@dp.message_handler(commands=['chart'])
+async def expense_chart(message: types.Message):
+    """Отправляет график трат по категориям и по дням: /chart month или /chart year"""
+    try:
+        chart = await charts.get_chart(message.from_user.id, message.get_args().strip().lower() or 'month')
+    except exceptions.NotCorrectMessage as e:
+        reply(message, str(e))
+        return
+    if chart.file_id is not None:
+        outbox.outbox.send_photo(message.chat.id, chart.file_id)
+        return
 
+    async def remember(sent: types.Message):
+        await charts.remember(chart.key, sent.photo[-1].file_id)
 
-@dp.message_handler(commands=['month'])
-async def month_statistics(message: types.Message):
-    """Отправляет статистику трат текущего месяца"""
-    answer_message = await expenses.get_statistics(period='month')
-    await message.answer(answer_message)
+    outbox.outbox.send_photo(message.chat.id, chart.png, on_sent=remember)
+
+
+@dp.message_handler(commands=['stats'])
+async def range_statistics(message: types.Message):
+    """Отправляет статистику трат за произвольный период: /stats 2023-01-01..2023-03-31"""
+    try:
+        period = periods.parse_range(message.get_args())
+    except exceptions.NotCorrectMessage as e:
+        reply(message, str(e))
+        return
+    answer_message = await expenses.get_statistics(message.from_user.id, period)
+    reply(message, summary=answer_message, coalesce=f'stats:{period.title}')
 
 
 @dp.message_handler()
 async def add_expense(message: types.Message):
-    """Добавляет новый расход"""
+    """Добавляет новые расходы, по одному на строку сообщения"""
     try:
-        e = await expenses.add_expense(message.text)
+        added, statistics = await expenses.add_expenses(
+            message.from_user.id, message.text, message.message_id, _sent_at(message)
+        )
     except exceptions.NotCorrectMessage as e:
-        await message.answer(str(e))
+        reply(message, str(e))
+        return
+    if not added:
+        reply(message, "Траты из этого сообщения уже добавлены", summary=statistics)
         return
-    answer_message = (
-        f"Добавлены траты {e.amount} {settings.CURRENCY} на {e.category_name}.\n\n"
-        f"{await expenses.get_statistics(period='today')}")
-    await message.answer(answer_message)
+    lines = "\n".join(
+        f"{format_amount(e.amount)} {settings.CURRENCY} на {e.category_name}" + (f" за {e.day:%d.%m.%Y}" if e.day else "")
+        for e in added
+    )
+    # Ответы на траты, пришедшие подряд, сливаются в один с последней статистикой
+    reply(message, lines, header="Добавлены траты:", summary=statistics, coalesce='expenses')
+
+
+def _sent_at(message: types.Message) -> datetime:
+    """Время отправки сообщения в UTC: aiogram переводит дату из Telegram в локальное время сервера."""
+    return datetime.utcfromtimestamp(message.date.timestamp())
+
+
+async def on_startup(_):
+    if settings.POSTGRES_CONFIG.POOL_STATS_INTERVAL:
+        asyncio.create_task(log_pool_stats(settings.POSTGRES_CONFIG.POOL_STATS_INTERVAL))
+    if settings.METRICS_LOG_INTERVAL:
+        asyncio.create_task(metrics.log_summary(settings.METRICS_LOG_INTERVAL))
 
 
 if __name__ == '__main__':
     logger.debug(f'Start Finance TG Bot with settings: {settings.dict()}')
-    executor.start_polling(dp, skip_updates=True)
+    # Планировщик работает в единственном процессе приема апдейтов, а не в каждом воркере
+    # Сначала дописываются буферизованные траты и дорисовываются графики, ответы на них уходят
+    # через очередь сообщений
+    on_startup_callbacks = [on_startup, outbox.on_startup, metrics.on_startup, resolver.on_startup]
+    on_shutdown_callbacks = [
+        write_buffer.on_shutdown, charts.on_shutdown, outbox.on_shutdown, metrics.on_shutdown, resolver.on_shutdown,
+    ]
+    if sys.argv[1:] == ['worker']:
+        worker.start_worker(dp, on_startup_callbacks, on_shutdown_callbacks)
+    elif settings.WEBHOOK_HOST:
+        start_webhook(dp, on_startup_callbacks + [scheduler.on_startup], on_shutdown_callbacks)
+    elif settings.UPDATE_QUEUE_ENABLED:
+        worker.start_ingress(dp, on_startup_callbacks + [scheduler.on_startup], on_shutdown_callbacks)
+    else:
+        executor.start_polling(
+            dp, skip_updates=True, on_startup=on_startup_callbacks + [scheduler.on_startup],
+            on_shutdown=on_shutdown_callbacks,
+        )
@@ -0,0 +1,34 @@
+import os
+
+# Настройки читаются при импорте core.settings, тестам достаточно значений по умолчанию
+for name, value in {
+    'PG_DB': 'finance', 'PG_USER': 'finance', 'PG_PASS': 'finance', 'PG_HOST': 'localhost', 'PG_PORT': '5432',
+    'API_TOKEN': '123456:ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghi', 'ACCESS_IDS': '["1", "2"]',
+    'DIFFERENCE_WITH_UTC': '3', 'CURRENCY': 'RUB',
+}.items():
+    os.environ.setdefault(name, value)
+
+import asyncio  # noqa: E402
+
+import pytest  # noqa: E402
+
+from tests.fake_db import FakeDatabase  # noqa: E402
+
+
+@pytest.fixture
+def fake_db(monkeypatch) -> FakeDatabase:
+    """Траты и категории в памяти вместо Postgres для кода core.expenses."""
+    from core import expenses, resolver
+    from core.cache import stats_cache
+    from models import Category, Expense
+
+    db = FakeDatabase()
+    monkeypatch.setattr(expenses, 'async_session', db.session)
+    monkeypatch.setattr(resolver, 'async_session', db.session)
+    for name in ('create_with_statistics', 'get_statistics', 'delete_returning', 'get_category_total', 'get_page'):
+        monkeypatch.setattr(Expense, name, getattr(db, name))
+    monkeypatch.setattr(Category, 'get_names', db.get_names)
+    monkeypatch.setattr(Category, 'copy_from', db.copy_from)
+    resolver.resolver.invalidate()
+    asyncio.run(stats_cache.clear())
+    return db
@@ -0,0 +1,112 @@
+"""
+Хранилище трат в памяти с теми же методами, что у моделей, для тестов без Postgres.
+
+Каждый запрос и закрытие сессии отдают управление циклу событий, как настоящие запросы к БД,
+чтобы параллельные хендлеры перемешивались между ними.
+"""
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+
+class FakeSession:
+    async def __aenter__(self) -> 'FakeSession':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await asyncio.sleep(0)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.categories: Dict[int, Dict[int, str]] = {}
+        self.expenses: List[dict] = []
+        self._next_id = 1
+
+    def session(self) -> FakeSession:
+        return FakeSession()
+
+    def add_category(self, user_id: int, category_id: int, name: str) -> None:
+        self.categories.setdefault(user_id, {})[category_id] = name
+
+    def total(self, user_id: int, start: datetime, end: datetime, category_id: int = None) -> int:
+        return sum(
+            e['amount'] for e in self.expenses
+            if e['user_id'] == user_id and start <= e['created'] < end and category_id in (None, e['category_id'])
+        )
+
+    def statistics(self, user_id: int, start: datetime, end: datetime) -> list:
+        return [
+            SimpleNamespace(
+                id=category_id, name=name, amount=self.total(user_id, start, end, category_id) or None, daily_limit=0,
+            )
+            for category_id, name in sorted(self.categories.get(user_id, {}).items())
+        ]
+
+    async def get_names(self, db, user_id: int) -> list:
+        await asyncio.sleep(0)
+        return [(category_id, name, None) for category_id, name in self.categories.get(user_id, {}).items()]
+
+    async def copy_from(self, db, user_id: int, template_user_id: int) -> int:
+        await asyncio.sleep(0)
+        categories = self.categories.setdefault(user_id, {})
+        names = {name.lower() for name in categories.values()}
+        copied = 0
+        for name in self.categories.get(template_user_id, {}).values():
+            if name.lower() not in names:
+                self.add_category(user_id, self._next_id, name)
+                self._next_id += 1
+                copied += 1
+        return copied
+
+    async def get_statistics(self, db, user_id: int, start: datetime, end: datetime) -> list:
+        await asyncio.sleep(0)
+        rows = self.statistics(user_id, start, end)
+        await asyncio.sleep(0)
+        return rows
+
+    async def create_with_statistics(
+            self, db, user_id: int, start: datetime, end: datetime, expenses: List[dict]
+    ) -> list:
+        await asyncio.sleep(0)
+        keys = {(e['user_id'], e['idempotency_key']) for e in self.expenses}
+        new = []
+        for e in expenses:
+            if (user_id, e['idempotency_key']) in keys:
+                continue
+            keys.add((user_id, e['idempotency_key']))
+            new.append(dict(e, user_id=user_id, id=self._next_id))
+            self._next_id += 1
+        self.expenses.extend(new)
+        rows = self.statistics(user_id, start, end)
+        # Коммит виден другим сессиям до того, как вызывающий код получит результат
+        await asyncio.sleep(0)
+        for row in rows:
+            row.expense_ids = [e['id'] for e in new] or None
+            row.expense_keys = [e['idempotency_key'] for e in new] or None
+        return rows
+
+    async def delete_returning(self, db, user_id: int, instance_id: int) -> Optional[SimpleNamespace]:
+        await asyncio.sleep(0)
+        for e in self.expenses:
+            if e['user_id'] == user_id and e['id'] == instance_id:
+                self.expenses.remove(e)
+                await asyncio.sleep(0)
+                return SimpleNamespace(created=e['created'], category_id=e['category_id'], amount=e['amount'])
+        return None
+
+    async def get_category_total(
+            self, db, user_id: int, category_id: int, start: datetime, end: datetime
+    ) -> Optional[SimpleNamespace]:
+        await asyncio.sleep(0)
+        name = self.categories.get(user_id, {}).get(category_id)
+        if name is None:
+            return None
+        row = SimpleNamespace(name=name, amount=self.total(user_id, start, end, category_id))
+        await asyncio.sleep(0)
+        return row
+
+    async def get_page(self, db, user_id: int, category_id: int, start: datetime, end: datetime, limit: int, **_):
+        await asyncio.sleep(0)
+        return [], False
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler
+
+from core.middlewares import AccessMiddleware
+from core.outbox import outbox
+
+
+def _message(user_id: int) -> types.Message:
+    return types.Message.to_object({
+        'message_id': 1,
+        'date': int(time.time()),
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'test'},
+        'chat': {'id': user_id, 'type': 'private'},
+        'text': '100 еда',
+    })
+
+
+@pytest.fixture(autouse=True)
+def empty_outbox():
+    outbox._pending.clear()
+    yield
+    outbox._pending.clear()
+
+
+def _process(middleware: AccessMiddleware, user_id: int) -> bool:
+    """True, если сообщение прошло middleware."""
+    try:
+        asyncio.run(middleware.on_pre_process_message(_message(user_id), {}))
+    except CancelHandler:
+        return False
+    return True
+
+
+def test_limiter_is_disabled_by_default():
+    middleware = AccessMiddleware(['1'])
+    assert all(_process(middleware, 1) for _ in range(100))
+
+
+def test_throttled_user_is_told_once_per_series():
+    middleware = AccessMiddleware(['1'], rate=0.001, burst=3)
+    assert [_process(middleware, 1) for _ in range(6)] == [True, True, True, False, False, False]
+    assert [m.text for m in outbox._pending[1]] == [
+        "Слишком много сообщений подряд, это и следующие сообщения не обработаны. Отправьте их снова через 1000 с."
+    ]
+    assert middleware.dropped == 3
+
+
+def test_notice_repeats_after_user_was_allowed_again():
+    middleware = AccessMiddleware(['1'], rate=0.001, burst=1)
+    assert [_process(middleware, 1) for _ in range(2)] == [True, False]
+    middleware.limiter.bucket(1).tokens = 1
+    assert _process(middleware, 1)
+    assert not _process(middleware, 1)
+    assert len(outbox._pending[1]) == 2
@@ -0,0 +1,21 @@
+from core import importer
+
+IDS_BY_NAME = {'еда': 1}
+
+
+def test_bad_jsonl_lines_are_skipped(tmp_path):
+    path = tmp_path / 'import.jsonl'
+    path.write_text(
+        '{"created": "2024-01-02", "amount": "100", "category": "Еда"}\n'
+        '{"created": "2024-01-02", "amount": \n'
+        '[1, 2]\n'
+        '42\n'
+        '"еда"\n'
+        'null\n'
+        '{"created": null, "amount": {}, "category": "еда"}\n',
+        encoding='utf-8',
+    )
+    records = [importer.parse_row(row, IDS_BY_NAME) for row in importer.iter_rows(str(path))]
+    assert len(records) == 7
+    assert records[0] is not None and records[0][0] == 10000
+    assert records[1:] == [None] * 6
@@ -0,0 +1,40 @@
+import asyncio
+import socket
+
+from aiohttp import ClientSession
+
+from core import metrics
+from core.settings import settings
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_metrics_are_served_on_internal_port(monkeypatch):
+    port = _free_port()
+    monkeypatch.setattr(settings, 'METRICS_HOST', '127.0.0.1')
+    monkeypatch.setattr(settings, 'METRICS_PORT', port)
+
+    async def scrape() -> str:
+        await metrics.on_startup(None)
+        try:
+            async with ClientSession() as session:
+                async with session.get(f'http://127.0.0.1:{port}/metrics') as response:
+                    return await response.text()
+        finally:
+            await metrics.on_shutdown(None)
+
+    assert '# TYPE finance_bot_handler_seconds histogram' in asyncio.run(scrape())
+
+
+def test_busy_port_does_not_stop_startup(monkeypatch):
+    with socket.socket() as busy:
+        busy.bind(('127.0.0.1', 0))
+        busy.listen()
+        monkeypatch.setattr(settings, 'METRICS_PORT', busy.getsockname()[1])
+        asyncio.run(metrics.on_startup(None))
+    assert metrics._runner is None
+
@@ -0,0 +1,38 @@
+"""Суммы трат в копейках против прежних сумм во float на большом случайном наборе."""
+import random
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from core.money import format_amount, to_decimal, to_minor
+from core.parser import parse_line
+
+ROWS = 200000
+
+
+def _amount_texts(seed: int) -> list:
+    rng = random.Random(seed)
+    return [f'{rng.randint(0, 100000)}.{rng.randint(0, 99):02d}' for _ in range(ROWS)]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_integer_totals_are_exact_and_float_totals_drift(seed):
+    texts = _amount_texts(seed)
+    exact = sum(Decimal(text) for text in texts)
+    minor = sum(to_minor(text) for text in texts)
+    floats = 0.0
+    for text in texts:
+        floats += float(text)
+    assert to_decimal(minor) == exact
+    assert Decimal(format_amount(minor)) == exact
+    # Прежнее хранение во float: сумма расходится с точной
+    assert Decimal(repr(floats)) != exact
+
+
+def test_parsed_messages_sum_to_exact_total():
+    rng = random.Random(0)
+    today = date(2024, 3, 15)
+    texts = [f'{rng.randint(1, 100000)},{rng.randint(0, 99):02d}' for _ in range(ROWS // 4)]
+    total = sum(parse_line(f'{text} еда', today).amount for text in texts)
+    assert to_decimal(total) == sum(Decimal(text.replace(',', '.')) for text in texts)
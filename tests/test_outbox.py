@@ -0,0 +1,69 @@
+import asyncio
+
+from aiogram.utils.exceptions import MessageIsTooLong
+
+from core.outbox import MESSAGE_LIMIT, Outbox, split_text
+
+
+class FakeBot:
+    def __init__(self, fail_first: Exception = None):
+        self.sent = []
+        self._fail = fail_first
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        if self._fail is not None:
+            error, self._fail = self._fail, None
+            raise error
+        if len(text) > MESSAGE_LIMIT:
+            raise MessageIsTooLong()
+        self.sent.append((chat_id, text, reply_markup))
+
+
+def _outbox() -> Outbox:
+    return Outbox(rate=1000, chat_rate=1000, chat_burst=1000, workers=2)
+
+
+def _deliver(outbox: Outbox, bot: FakeBot) -> None:
+    async def run():
+        outbox.start(bot)
+        await outbox.stop(timeout=1)
+    asyncio.run(run())
+
+
+def test_split_text_respects_limit_and_lines():
+    text = '\n'.join(f'{n:04d} ' + 'x' * 95 for n in range(100))
+    parts = split_text(text, limit=1000)
+    assert all(len(part) <= 1000 for part in parts)
+    assert '\n'.join(parts) == text
+    assert split_text('y' * 2500, limit=1000) == ['y' * 1000, 'y' * 1000, 'y' * 500]
+    assert split_text('') == ['']
+
+
+def test_coalescing_stops_before_the_message_limit():
+    outbox, bot = _outbox(), FakeBot()
+    for n in range(300):
+        outbox.send(1, f'{n} RUB на еду, длинная строка траты', header='Добавлены траты:', summary='итог',
+                    coalesce='expenses')
+    _deliver(outbox, bot)
+    texts = [text for _, text, _ in bot.sent]
+    assert len(texts) > 1
+    assert all(len(text) <= MESSAGE_LIMIT for text in texts)
+    assert sum(text.count('RUB на еду') for text in texts) == 300
+
+
+def test_long_reply_is_sent_in_parts():
+    outbox, bot = _outbox(), FakeBot()
+    outbox.send(1, '\n'.join('строка статистики ' * 5 for _ in range(200)), reply_markup='markup')
+    _deliver(outbox, bot)
+    assert len(bot.sent) > 1
+    assert [markup for _, _, markup in bot.sent] == [None] * (len(bot.sent) - 1) + ['markup']
+
+
+def test_unexpected_error_does_not_block_the_chat():
+    outbox, bot = _outbox(), FakeBot(fail_first=RuntimeError('boom'))
+    outbox.send(1, 'первый')
+    outbox.send(1, 'второй')
+    _deliver(outbox, bot)
+    assert bot.sent == [(1, 'второй', None)]
+    assert outbox.failed == 1
+    assert not outbox._pending
@@ -0,0 +1,100 @@
+"""Свойства разбора сообщений на случайных, но воспроизводимых (seed) входных данных."""
+import random
+import string
+from datetime import date, timedelta
+
+import pytest
+
+from core.exceptions import NotCorrectMessage
+from core.money import MAX_AMOUNT, MINOR_UNITS, to_minor
+from core.parser import parse_line, parse_message
+
+TODAY = date(2024, 3, 15)
+CATEGORIES = ('еда', 'такси', 'Кофе', 'продукты  и  быт', 'кино', 'coffee')
+# Символы, из которых собираются случайные сообщения: цифры, разделители, буквы и знаки
+ALPHABET = string.digits * 4 + ' \u00a0\u202f\t.,-+' + 'сегоднявчера' + 'abcXYZ' + '\n'
+
+
+def _format_amount(rng: random.Random, amount: int) -> str:
+    """Сумма в копейках одним из допустимых способов записи."""
+    units, cents = divmod(amount, MINOR_UNITS)
+    integer = str(units)
+    if rng.random() < 0.5 and len(integer) > 3:
+        separator = rng.choice(' \u00a0\u202f')
+        head = len(integer) % 3 or 3
+        integer = separator.join([integer[:head]] + [integer[i:i + 3] for i in range(head, len(integer), 3)])
+    if not cents and rng.random() < 0.5:
+        return integer
+    fraction = f'{cents:02d}'
+    if fraction.endswith('0') and rng.random() < 0.5:
+        fraction = fraction[0]
+    return integer + rng.choice('.,') + fraction
+
+
+def _random_amount(rng: random.Random) -> int:
+    return rng.choice((
+        lambda: rng.randint(1, 10 ** 4),
+        lambda: rng.randint(1, 10 ** 8),
+        lambda: rng.randint(1, MAX_AMOUNT),
+        lambda: rng.randint(MAX_AMOUNT - 10 ** 4, MAX_AMOUNT),
+    ))()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_well_formed_line_is_parsed_exactly(seed):
+    rng = random.Random(seed)
+    for _ in range(2000):
+        amount = _random_amount(rng)
+        category = rng.choice(CATEGORIES)
+        days = rng.randint(0, 400)
+        day = TODAY - timedelta(days=days)
+        prefix = rng.choice(('', 'сегодня ', 'Вчера ', day.strftime('%d.%m.%Y '), day.strftime('%d.%m.%y ')))
+        line = f'{prefix}{_format_amount(rng, amount)} {category}'
+        parsed = parse_line(line, TODAY)
+        assert parsed.amount == amount, line
+        assert parsed.category_text == ' '.join(category.lower().split()), line
+        if prefix.strip() == 'Вчера':
+            assert parsed.day == TODAY - timedelta(days=1)
+        elif prefix.strip() and prefix.strip() != 'сегодня':
+            assert parsed.day == (None if days == 0 else day), line
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_input_is_parsed_or_rejected(seed):
+    rng = random.Random(seed)
+    for _ in range(5000):
+        text = ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 40)))
+        try:
+            expenses = parse_message(text, TODAY)
+        except NotCorrectMessage:
+            continue
+        assert expenses, text
+        for expense in expenses:
+            assert 0 < expense.amount <= MAX_AMOUNT, text
+            assert expense.category_text == expense.category_text.strip().lower(), text
+            assert expense.day is None or expense.day < TODAY, text
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_multiline_message_keeps_order(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        amounts = [_random_amount(rng) for _ in range(rng.randint(1, 20))]
+        text = '\n'.join(f'{_format_amount(rng, amount)} {rng.choice(CATEGORIES)}' for amount in amounts)
+        assert [e.amount for e in parse_message(text, TODAY)] == amounts
+
+
+def test_amount_bound():
+    units = MAX_AMOUNT // MINOR_UNITS
+    assert parse_line(f'{units} еда', TODAY).amount == MAX_AMOUNT
+    assert parse_line(f'0000{units} еда', TODAY).amount == MAX_AMOUNT
+    for text in (f'{units},01 еда', f'{units + 1} еда', '12345678901234567890 еда', '9' * 5000 + ' еда'):
+        with pytest.raises(NotCorrectMessage, match='больше'):
+            parse_line(text, TODAY)
+
+
+def test_import_amount_bound():
+    assert to_minor(str(MAX_AMOUNT // MINOR_UNITS)) == MAX_AMOUNT
+    for text in ('12345678901234567890', '1e30', '-1e30'):
+        with pytest.raises(ValueError):
+            to_minor(text)
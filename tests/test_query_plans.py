@@ -0,0 +1,124 @@
+"""
+Планы горячих запросов бота на настоящем Postgres: ни один не должен читать таблицу
+последовательным сканированием. Нужна база из настроек PG_* с примененными миграциями
+(`alembic upgrade head`), без нее тесты пропускаются.
+
+Запросы берутся из самих методов моделей: вместо сессии им передается заглушка,
+которая запоминает выполненный запрос. Планы строятся с enable_seqscan = off: так планировщик
+выбирает Seq Scan, только если подходящего индекса нет, и результат не зависит от объема данных.
+"""
+import asyncio
+from datetime import date, datetime, timedelta
+
+import asyncpg
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from core.settings import settings
+from models import Budget, Category, DailyCategoryTotal, Expense, QueuedUpdate
+from models.expense import Aliase
+
+USER_ID = 1
+CATEGORY_ID = 1
+MONTH_START = datetime(2024, 3, 1) - timedelta(hours=settings.DIFFERENCE_WITH_UTC)
+NOW = datetime(2024, 3, 15, 12, 30)
+# Нет сервера, неверный пароль или нет прав на базу: тесты пропускаются, ошибки EXPLAIN — нет
+DB_UNAVAILABLE = (OSError, asyncio.TimeoutError, asyncpg.PostgresError, DBAPIError)
+
+
+class Result:
+    rowcount = 0
+
+    def all(self):
+        return []
+
+    def first(self):
+        return None
+
+    def scalar_one(self):
+        return 0
+
+
+class Recorder:
+    """Заглушка AsyncSession, запоминающая запросы вместо выполнения."""
+
+    def __init__(self):
+        self.queries = []
+
+    async def execute(self, query, *_):
+        self.queries.append(query)
+        return Result()
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+async def _record(call) -> list:
+    db = Recorder()
+    await call(db)
+    return db.queries
+
+
+HOT_QUERIES = {
+    'last expenses': lambda db: Expense.get_last(db, USER_ID),
+    'month statistics': lambda db: Expense.get_statistics(db, USER_ID, MONTH_START, MONTH_START + timedelta(days=31)),
+    'statistics with partial days': lambda db: Expense.get_statistics(db, USER_ID, NOW - timedelta(days=2), NOW),
+    'category total': lambda db: Expense.get_category_total(db, USER_ID, CATEGORY_ID, NOW - timedelta(days=2), NOW),
+    'category page': lambda db: Expense.get_page(
+        db, USER_ID, CATEGORY_ID, MONTH_START, NOW, limit=10, before=(NOW, 100)
+    ),
+    'delete expense': lambda db: Expense.delete_returning(db, USER_ID, 100),
+    'category by name': lambda db: Category.by_name(db, USER_ID, 'Еда'),
+    'alias by name': lambda db: Aliase.by_name(db, USER_ID, 'Еда'),
+    'category names': lambda db: Category.get_names(db, USER_ID),
+    'budget': lambda db: Budget.get(db, USER_ID),
+    'rollup slice': lambda db: DailyCategoryTotal.get_slice(db, USER_ID, date(2024, 1, 1), date(2024, 4, 1)),
+    'claim updates': lambda db: QueuedUpdate.claim(db, limit=10, lease=60),
+    'complete update': lambda db: QueuedUpdate.complete(db, 100),
+    'pending updates': lambda db: QueuedUpdate.pending_count(db),
+}
+
+
+async def _explain_all() -> dict:
+    engine = create_async_engine(settings.POSTGRES_CONFIG.URL, future=True)
+    plans = {}
+    try:
+        try:
+            async with engine.connect() as conn:
+                if (await conn.exec_driver_sql("SELECT to_regclass('update_queue')")).scalar() is None:
+                    return {}
+        except DB_UNAVAILABLE as e:
+            pytest.skip(f'Postgres is not available: {e!r}')
+        async with engine.connect() as conn:
+            await conn.exec_driver_sql('SET enable_seqscan = off')
+            for name, call in HOT_QUERIES.items():
+                lines = []
+                for query in await _record(call):
+                    compiled = query.compile(dialect=postgresql.dialect(paramstyle='named'))
+                    plan = await conn.execute(text(f'EXPLAIN {compiled}').bindparams(**compiled.params))
+                    lines.extend(plan.scalars())
+                plans[name] = '\n'.join(lines)
+            await conn.rollback()
+    finally:
+        await engine.dispose()
+    return plans
+
+
+@pytest.fixture(scope='module')
+def plans() -> dict:
+    plans = asyncio.run(_explain_all())
+    if not plans:
+        pytest.skip('Database is not migrated, run alembic upgrade head')
+    return plans
+
+
+@pytest.mark.parametrize('name', HOT_QUERIES)
+def test_hot_query_uses_indexes(plans, name):
+    assert plans[name], f'{name}: no query was executed'
+    assert 'Seq Scan' not in plans[name], f'{name} reads a table sequentially:\n{plans[name]}'
@@ -0,0 +1,62 @@
+import asyncio
+
+from core import exceptions
+from core.resolver import resolver
+from models import Category
+
+
+def test_new_user_gets_owner_categories(fake_db):
+    # Первый пользователь из ACCESS_IDS — владелец категорий, второй добавлен после миграции
+    fake_db.add_category(1, 1, 'еда')
+    fake_db.add_category(1, 2, 'такси')
+
+    async def scenario():
+        return await resolver.get_category_id(2, 'Еда'), await resolver.get_categories(2)
+
+    category_id, categories = asyncio.run(scenario())
+    assert [c.name for c in categories] == ['еда', 'такси']
+    assert fake_db.categories[2][category_id] == 'еда'
+    assert fake_db.categories[1] == {1: 'еда', 2: 'такси'}
+
+
+def test_concurrent_lookups_load_once_and_count_unknown_names(fake_db, monkeypatch):
+    fake_db.add_category(1, 1, 'еда')
+    loads = []
+
+    async def counting_get_names(db, user_id):
+        loads.append(user_id)
+        return await fake_db.get_names(db, user_id)
+
+    monkeypatch.setattr(Category, 'get_names', counting_get_names)
+    hits, misses, unknown = resolver.hits, resolver.misses, resolver.unknown
+
+    async def scenario():
+        # Пока идет первая загрузка, следующие ждут ее на замке пользователя, а не грузят снова
+        await asyncio.gather(*(resolver.snapshot(1) for _ in range(5)))
+        resolver.invalidate(1)
+        await asyncio.gather(*(resolver.snapshot(1) for _ in range(5)))
+        try:
+            await resolver.get_category_id(1, 'такси')
+        except exceptions.NotCorrectMessage:
+            pass
+
+    asyncio.run(scenario())
+    assert loads == [1, 1]
+    assert resolver.misses - misses == 2
+    assert resolver.hits - hits == 9
+    assert resolver.unknown - unknown == 1
+
+
+def test_snapshot_invalidated_during_load_is_not_cached(fake_db):
+    fake_db.add_category(1, 1, 'еда')
+
+    async def scenario():
+        load = asyncio.ensure_future(resolver.snapshot(1))
+        await asyncio.sleep(0)
+        # Категория добавлена, пока загрузка ждала ответа БД, уведомление пришло до ее конца
+        fake_db.add_category(1, 2, 'такси')
+        resolver.invalidate(1)
+        await load
+        return await resolver.get_category_id(1, 'такси')
+
+    assert asyncio.run(scenario()) == 2
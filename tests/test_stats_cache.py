@@ -0,0 +1,151 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+from core import expenses, periods
+from core.cache import MemoryBackend, StatRow, StatsCache, stats_cache
+
+USER_ID = 1
+NAMES = ('today', 'week', 'month', 'prev_month', 'year')
+
+
+def _setup(fake_db, categories=('еда', 'такси', 'кофе')):
+    for category_id, name in enumerate(categories, start=1):
+        fake_db.add_category(USER_ID, category_id, name)
+
+
+def _assert_cache_matches(fake_db):
+    """Каждая запись кэша совпадает с тем, что сейчас вернула бы БД."""
+    for (user_id, start, end, category_id), (_, value) in stats_cache.backend._data.items():
+        if category_id is None:
+            cached = {r.id: r.amount or 0 for r in value}
+            expected = {r.id: r.amount or 0 for r in fake_db.statistics(user_id, start, end)}
+            assert cached == expected, (start, end)
+        else:
+            assert value.amount == fake_db.total(user_id, start, end, category_id), (start, end, category_id)
+
+
+def _amounts(text: str) -> dict:
+    """Суммы по категориям из ответа статистики."""
+    result = {}
+    for line in text.splitlines():
+        if ' | ' in line:
+            amount, name = line.split(' | ')[:2]
+            result[name] = amount.split()[0]
+    return result
+
+
+def test_read_between_commit_and_cache_update_is_not_stored(fake_db):
+    _setup(fake_db)
+    month = periods.get_period('month')
+
+    async def scenario():
+        await expenses.get_statistics(USER_ID, month)
+        # /month из той же пачки апдейтов читает уже закоммиченную трату до того, как кэш ее применил
+        await asyncio.gather(
+            expenses.add_expenses(USER_ID, '100 еда', message_id=1, sent=datetime.utcnow()),
+            expenses.get_statistics(USER_ID, month),
+        )
+        return await expenses.get_statistics(USER_ID, month)
+
+    assert _amounts(asyncio.run(scenario())) == {'еда': '100'}
+    _assert_cache_matches(fake_db)
+
+
+def test_read_during_delete_is_not_stored(fake_db):
+    _setup(fake_db)
+    month = periods.get_period('month')
+
+    async def scenario():
+        await expenses.add_expenses(USER_ID, '100 еда\n50 кофе', message_id=1, sent=datetime.utcnow())
+        await expenses.get_statistics(USER_ID, month)
+        await asyncio.gather(
+            expenses.delete_expense(USER_ID, 1),
+            expenses.get_statistics(USER_ID, month),
+            expenses.get_category(USER_ID, 1, 'm'),
+        )
+        return await expenses.get_statistics(USER_ID, month)
+
+    assert _amounts(asyncio.run(scenario())) == {'кофе': '50'}
+    _assert_cache_matches(fake_db)
+
+
+def test_new_category_invalidates_cached_statistics(fake_db):
+    _setup(fake_db)
+    month = periods.get_period('month')
+
+    async def scenario():
+        await expenses.get_statistics(USER_ID, month)
+        fake_db.add_category(USER_ID, 4, 'книги')
+        expenses.resolver.invalidate(USER_ID)
+        await expenses.add_expenses(USER_ID, '300 книги', message_id=1, sent=datetime.utcnow())
+        return await expenses.get_statistics(USER_ID, month)
+
+    assert _amounts(asyncio.run(scenario())) == {'книги': '300'}
+    _assert_cache_matches(fake_db)
+
+
+def test_missing_category_drops_entry():
+    cache = StatsCache(MemoryBackend(max_size=10, ttl=60))
+    start, end = datetime(2023, 1, 1), datetime(2023, 2, 1)
+
+    async def scenario():
+        generation = await cache.begin_read(USER_ID, start, end)
+        await cache.set_statistics(USER_ID, start, end, [StatRow(1, 'еда', 100, 0)], generation=generation)
+        async with cache.writing():
+            await cache.expense_added(USER_ID, datetime(2023, 1, 15), 2, 50)
+        return await cache.get_statistics(USER_ID, start, end)
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_nothing_is_stored_while_a_write_is_in_flight():
+    cache = StatsCache(MemoryBackend(max_size=10, ttl=60))
+    start, end = datetime(2023, 1, 1), datetime(2023, 2, 1)
+
+    async def scenario():
+        async with cache.writing():
+            generation = await cache.begin_read(USER_ID, start, end)
+            await cache.set_statistics(USER_ID, start, end, [StatRow(1, 'еда', 100, 0)], generation=generation)
+        return await cache.get_statistics(USER_ID, start, end)
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_random_interleavings_never_leave_stale_totals(fake_db):
+    _setup(fake_db)
+    now = datetime.utcnow()
+
+    async def delayed(rng, coro):
+        for _ in range(rng.randrange(6)):
+            await asyncio.sleep(0)
+        await coro
+
+    async def scenario(rng, first_message_id):
+        tasks = []
+        for n in range(40):
+            action = rng.random()
+            if action < 0.4:
+                text = '\n'.join(
+                    f'{rng.randrange(1, 500)} {rng.choice(("еда", "такси", "кофе"))}' for _ in range(rng.randrange(1, 4))
+                )
+                sent = now - timedelta(days=rng.randrange(0, 60), minutes=rng.randrange(0, 600))
+                tasks.append(expenses.add_expenses(USER_ID, text, message_id=first_message_id + n, sent=sent))
+            elif action < 0.55 and fake_db.expenses:
+                tasks.append(expenses.delete_expense(USER_ID, rng.choice(fake_db.expenses)['id']))
+            elif action < 0.8:
+                tasks.append(expenses.get_statistics(USER_ID, periods.get_period(rng.choice(NAMES))))
+            else:
+                tasks.append(expenses.get_category(USER_ID, rng.randrange(1, 4), rng.choice('dwmpy')))
+        await asyncio.gather(*(delayed(rng, task) for task in tasks))
+
+    for seed in range(30):
+        # Замки резолвера привязаны к циклу событий, а каждый прогон идет в новом
+        expenses.resolver.invalidate()
+        asyncio.run(scenario(random.Random(seed), seed * 100))
+        _assert_cache_matches(fake_db)
+    for name in NAMES:
+        period = periods.get_period(name)
+        served = asyncio.run(expenses.get_statistics(USER_ID, period))
+        expected = {r.name: r.amount for r in fake_db.statistics(USER_ID, period.start, period.end) if r.amount}
+        assert _amounts(served) == {name: expenses.format_amount(amount) for name, amount in expected.items()}
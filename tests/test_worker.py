@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import pytest
+from aiogram import Bot, Dispatcher, types
+
+from core import worker
+from core.exceptions import GetFromDatabaseException
+from core.middlewares import AccessMiddleware
+from core.outbox import outbox
+from core.settings import settings
+from models import QueuedUpdate
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        return False
+
+
+class Row:
+    def __init__(self, update_id: int):
+        self.update_id = update_id
+        self.attempts = 1
+        self.payload = {'update_id': update_id}
+
+
+def _update(update_id: int, user_id: int) -> types.Update:
+    return types.Update.to_object({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'test'},
+            'chat': {'id': user_id, 'type': 'private'},
+            'text': '100 еда',
+        },
+    })
+
+
+@pytest.fixture
+def dp(monkeypatch) -> Dispatcher:
+    dispatcher = Dispatcher(Bot(token=settings.API_TOKEN))
+    dispatcher.middleware.setup(AccessMiddleware(['1'], rate=0.001, burst=2))
+    monkeypatch.setattr(worker, 'async_session', FakeSession)
+    monkeypatch.setattr(settings, 'WORKER_POLL_INTERVAL', 0.01)
+    outbox._pending.clear()
+    yield dispatcher
+    outbox._pending.clear()
+
+
+def test_admit_drops_strangers_and_flood(dp):
+    updates = [_update(1, 1), _update(2, 3), _update(3, 1), _update(4, 1)]
+    assert [u.update_id for u in worker.admit(dp, updates)] == [1, 3]
+    assert [m.text for m in outbox._pending[3]] == ['Access Denied']
+
+
+def test_worker_backs_off_while_queue_is_unavailable(dp, monkeypatch):
+    calls = []
+    completed = []
+
+    async def claim(db, limit, lease):
+        calls.append(limit)
+        if len(calls) <= 2:
+            raise GetFromDatabaseException('connection refused')
+        return [Row(len(calls))] if len(calls) == 3 else []
+
+    async def complete(db, update_id, error=None):
+        completed.append(update_id)
+
+    async def pending_count(db):
+        return 0
+
+    async def process_update(update):
+        pass
+
+    sleeps = []
+    sleep = asyncio.sleep
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr(QueuedUpdate, 'claim', claim)
+    monkeypatch.setattr(QueuedUpdate, 'complete', complete)
+    monkeypatch.setattr(QueuedUpdate, 'pending_count', pending_count)
+    monkeypatch.setattr(dp, 'process_update', process_update)
+    monkeypatch.setattr(worker.asyncio, 'sleep', fake_sleep)
+    asyncio.run(worker.Worker(dp, batch_size=1).run(until_empty=True))
+    assert sleeps[:2] == [1, 2]
+    assert completed == [3]
+
+
+def test_failed_bookkeeping_leaves_update_leased(dp, monkeypatch):
+    async def complete(db, update_id, error=None):
+        raise GetFromDatabaseException('connection refused')
+
+    async def process_update(update):
+        pass
+
+    monkeypatch.setattr(QueuedUpdate, 'complete', complete)
+    monkeypatch.setattr(dp, 'process_update', process_update)
+    processor = worker.Worker(dp)
+    asyncio.run(processor._process(Row(1)))
+    assert processor.processed == 0